@@ -0,0 +1,1394 @@
+"""Checks of the API's observable behaviour through Flask's test client.
+
+    python apicheck.py                       # every check
+    python apicheck.py listing audit
+
+Each check runs against a copy of ../data in a temporary directory, with the audit log,
+the live updates log and any SQLite database kept there too, so the checked-in files are
+left alone.
+
+reload       a change to a data file is served by the next request, without a restart
+scoring      /api/optimize_date scores match a per-train evaluation of the scoring formula
+             for several weight sets, and Service then Standby are filled in score order
+conflicts    optimize conflicts are the ones each enabled rule finds for its plan entries,
+             and /api/conflict_rules counts one evaluation per entry a rule applies to
+audit        a legacy backend_audit.json is migrated; with a small METROPAL_AUDIT_MAX_BYTES the
+             log rotates into at most METROPAL_AUDIT_BACKUPS gzipped backups, and /api/audit
+             and /api/stats read the newest entries first across them
+batch        /api/optimize_batch rejects bad dates, executor and workers with 400; thread,
+             process and streamed (NDJSON) batches give each date the plan /api/optimize_date
+             gives, answering a repeated date once
+sqlite       with METROPAL_DATA_BACKEND=sqlite (metro.db imported from the JSON) the list,
+             timeline, certificate and optimize endpoints answer exactly as from the JSON
+             file; malformed dates get 400 from either backend
+importer     import_json.py streams the same (date, trains) pairs json.load reads, even with
+             tiny read chunks; rerunning it leaves one row per (date, train) and updates
+             changed records in place
+cache        a repeated /api/optimize_date is a cache hit with the same answer (zero weights
+             don't matter); other requirements, a data file change or a live update are
+             misses that see the change, and /api/cache/invalidate empties the cache
+incremental  /api/optimize_incremental rejects bad updates, weights and requirements with 400
+             without applying any of the request; accepted updates report every train whose
+             assignment moved, match /api/optimize_date and /api/optimize_batch afterwards
+             (other weights too), survive dropped sessions and data reloads, and a session
+             catches up on updates another worker logged
+benchmark    a small benchmark.py run times every stage for each fleet size and leaves the
+             data directory and audit log it was pointed at as they were
+generator    generate_data.py is repeatable for a seed; its JSON, JSON Lines and SQLite
+             outputs hold the same records, shaped like the checked-in data, and the API
+             serves and plans every generated day from either backend
+columnar     with METROPAL_DATA_BACKEND=columnar (a snapshot written by columnar.py) the
+             endpoints answer exactly as from the JSON file, and a rewritten snapshot is
+             served by the next request
+records      /api/full_trains serves each record exactly as the data file holds it, including
+             a record missing a field or carrying one the backend doesn't know, and such a
+             record can still be planned
+detail       detail=summary drops the plan and conflicts, assignments (or the older
+             "explain": false) keeps train_id/assignment/score, ?fields= picks plan keys, and
+             full keeps the reasons, on the optimize, batch and horizon endpoints; cut-down
+             answers never change the cached full result, and an unknown detail is a 400
+listing      /api/full_trains and /api/maintenance filter, sort and page like the same
+             operations on the data file, following Link rel="next" visits every row once
+             with X-Total-Count the filtered total, and bad paging or sort fields are a 400
+etag         list responses carry an ETag and Last-Modified; If-None-Match or
+             If-Modified-Since with them gives an empty 304 until the data file changes,
+             and another query has another ETag
+maintenance  /api/maintenance/<train_id> gives the train's log entries oldest first, within
+             ?from=&to= and paged, 404 for a train without history; a fleet record without
+             last_maintenance_date is aged from its latest logged maintenance up to the plan date
+solver       mode=solver gives the greedy plan when nothing else constrains it, meets class
+             capacities (IBL overflow going to Standby), keeps trains with expired
+             certificates out of Service and Standby, reports an objective matching its plan,
+             and bad mode or solver options are a 400
+horizon      /api/optimize_horizon plans consecutive days whose first day is the
+             /api/optimize_date plan (live updates included); each next day carries the
+             fleet forward: Service trains run daily_km, maintained IBL trains restart at
+             zero, cleaned Standby trains no longer need cleaning, the rest keep their
+             mileage; "changed" lists every move, days without requirements follow
+             daily_requirements.json, and bad days, start_date or daily_km are a 400
+sweep        every /api/optimize_sweep result (grid, explicit sets, seeded samples) has the
+             summary and assignments /api/optimize_date gives for its weights, live updates
+             included, with changed_trains the moves from the base weights; samples repeat
+             for a seed and stay in their ranges, and oversized or malformed sweeps are a 400
+metrics      /metrics counts requests per route template and status, computed (not cached)
+             plans per mode, their conflicts per severity, cache hits and misses as
+             /api/cache reports them, and planning phases; with METROPAL_PROFILING=1
+             ?profile=1 returns a profile with the endpoint's status, and without it is ignored
+asgi         asgi.app answers list, optimize and streamed batch requests as the Flask app
+             does (validators and 304s included), a quick request is served while more
+             slow streamed responses than the lane has threads are still being read, a full
+             lane is a 503 with Retry-After and an oversized body a 413
+events       an optimization publishes optimization and conflicts events shaped like its
+             /api/audit and /api/conflicts entries, a cache invalidation a data_version
+             event; /api/stream (Flask and ASGI) opens with retry, hello and the events after
+             Last-Event-ID, and closing it unsubscribes
+snapshot     create_app(preload=True) freezes the data: the app, and a worker forked from it,
+             keep serving the snapshot (body and ETag) after a data file changes, until
+             reload() picks the change up and freezes again
+timeline     /api/trains/<id>/timeline series equal each train's records in the fleet file,
+             date by date within ?from=&to=, on every backend; an unknown train is a 404,
+             unknown fields or dates a 400, and the data's ETag gives a 304
+certificates /api/certificates/expiring lists the fleet file's expiries within the window
+             soonest first, by type, with expired ones on request and paged, skipping
+             malformed dates; certificates="flag" reports every Service/Standby train with an
+             expired certificate, "exclude" keeps them all out of service with a note, and an
+             unknown mode or bad query argument is a 400
+
+Exits with status 1 and prints what was expected when a check fails.
+"""
+import argparse, asyncio, contextlib, datetime, gc, json, os, shutil, sqlite3, sys, tempfile
+from urllib.parse import urlsplit
+
+import data_loader
+import audit
+import live_updates
+import repository
+import result_cache
+import incremental
+import conflicts
+import batch
+import import_json
+import benchmark
+import generate_data
+import columnar
+import metrics
+import events
+from certificates import CERTIFICATES
+import asgi
+from app import app, create_app
+
+WEIGHTS = {"punctuality": 80, "maintenance": 60, "cleaning": 50, "branding": 80, "mileage": 50}
+
+def _reset():
+    data_loader.invalidate()
+    result_cache.invalidate()
+    with incremental._sessions_lock:
+        incremental._sessions.clear()
+    repository.remove_session()
+    repository._engine = None
+
+@contextlib.contextmanager
+def sandbox():
+    """Points the data files, logs and database at a temporary copy of the data directory"""
+    saved = (data_loader.DATA_DIR, data_loader.DATA_BACKEND, audit.AUDIT_FILE, audit.LEGACY_AUDIT_FILE,
+             live_updates.LIVE_UPDATES_FILE, repository.DB_PATH)
+    with tempfile.TemporaryDirectory() as tmp:
+        shutil.copytree(data_loader.DATA_DIR, os.path.join(tmp, "data"))
+        data_loader.DATA_DIR = os.path.join(tmp, "data")
+        data_loader.DATA_BACKEND = "json"
+        audit.AUDIT_FILE = os.path.join(tmp, "audit.jsonl")
+        audit.LEGACY_AUDIT_FILE = os.path.join(tmp, "audit.json")
+        live_updates.LIVE_UPDATES_FILE = os.path.join(tmp, "live_updates.jsonl")
+        repository.DB_PATH = os.path.join(tmp, "metro.db")
+        _reset()
+        try:
+            yield tmp
+        finally:
+            (data_loader.DATA_DIR, data_loader.DATA_BACKEND, audit.AUDIT_FILE, audit.LEGACY_AUDIT_FILE,
+             live_updates.LIVE_UPDATES_FILE, repository.DB_PATH) = saved
+            _reset()
+
+def read_data(name):
+    with open(os.path.join(data_loader.DATA_DIR, name), encoding="utf-8") as f:
+        return json.load(f)
+
+def _rewritten(path, write):
+    """Rewrites path, moving its mtime on so the change is seen even within one clock tick"""
+    previous = os.stat(path).st_mtime_ns if os.path.exists(path) else None
+    write()
+    if previous is not None:
+        os.utime(path, ns=(previous + 10**9, previous + 10**9))
+
+def write_data(name, value):
+    path = os.path.join(data_loader.DATA_DIR, name)
+
+    def write():
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(value, f)
+    _rewritten(path, write)
+
+def plan_date():
+    """The last date with fleet data"""
+    return max(data_loader.load_train_data_range())
+
+def write_snapshot():
+    source = os.path.join(data_loader.DATA_DIR, "full_train_data.json")
+    target = os.path.join(data_loader.DATA_DIR, columnar.SNAPSHOT_DIR)
+    _rewritten(os.path.join(target, "meta.json"),
+               lambda: columnar.write_snapshot(import_json.iter_dated_records(source), target))
+
+def use_backend(name):
+    """Serves the fleet from another backend, first converting the JSON into the sandbox's
+       metro.db or columnar snapshot if there is none yet"""
+    source = os.path.join(data_loader.DATA_DIR, "full_train_data.json")
+    if name == "sqlite" and not os.path.exists(repository.DB_PATH):
+        import_json.import_file(source, repository.DB_PATH, log=lambda *args: None)
+    if name == "columnar" and not os.path.exists(os.path.join(data_loader.DATA_DIR, columnar.SNAPSHOT_DIR)):
+        write_snapshot()
+    _reset()
+    data_loader.DATA_BACKEND = name
+
+def plan_key(result):
+    return [(p["train_id"], p["assignment"], p["score"]) for p in result["plan"]]
+
+def check_reload(client):
+    day = plan_date()
+    before = client.get(f"/api/full_trains?date={day}")
+    fleet = read_data("full_train_data.json")
+    record = next(t for t in fleet[day] if t["train_id"] == before.json[0]["train_id"])
+    record["fitness_score"] = 0.123
+    write_data("full_train_data.json", fleet)
+    after = client.get(f"/api/full_trains?date={day}")
+    if after.json[0]["fitness_score"] != 0.123:
+        print(f"reload: {record['train_id']} still served with {after.json[0]['fitness_score']} after the file changed")
+        return False
+    if after.headers["ETag"] == before.headers["ETag"]:
+        print("reload: ETag unchanged after the data file changed")
+        return False
+    print("reload: ok")
+    return True
+
+def _reference_scores(trains, weights, day):
+    """Scores computed one train at a time, the way the scoring formula is written down"""
+    ref = datetime.date.fromisoformat(day)
+
+    def age(t):
+        value = t.get("last_maintenance_date") or data_loader.last_maintenance_date(t["train_id"], day)
+        return (ref - datetime.date.fromisoformat(value)).days if value else 9999
+
+    max_km = max(t.get("km_since_last_maintenance", 0) or t.get("mileage_since_maintenance", 0) for t in trains) or 1
+    max_days = max(age(t) for t in trains) or 1
+    weight_sum = sum(weights.values()) or 1
+    scores = {}
+    for t in trains:
+        branding = (1.0 if t.get("branding_active", 0) == 1 else 0.0) + t.get("branding_priority", 0)
+        score = 0.0
+        score += weights.get("punctuality", 0) / weight_sum * t.get("fitness_score", 0)
+        score += weights.get("maintenance", 0) / weight_sum * (1.0 - age(t) / max_days)
+        score += weights.get("cleaning", 0) / weight_sum * (0.2 if t.get("needs_cleaning") else 0.8)
+        score += weights.get("branding", 0) / weight_sum * branding / 2
+        score += weights.get("mileage", 0) / weight_sum * (1.0 - t.get("mileage_since_maintenance", 0) / max_km)
+        scores[t["train_id"]] = round(score, 3)
+    return scores
+
+def check_scoring(client):
+    day = plan_date()
+    trains = data_loader.load_full_train_data(day)
+    for weights in (WEIGHTS, {"punctuality": 100}, {"maintenance": 10, "mileage": 90, "branding": 0},
+                    {"cleaning": 1, "branding": 3}):
+        result = client.post("/api/optimize_date", json={
+            "date": day, "weights": weights, "requirements": {"service": 12, "standby": 4}, "detail": "assignments"
+        }).json
+        expected = _reference_scores(trains, weights, day)
+        for p in result["plan"]:
+            if abs(p["score"] - expected[p["train_id"]]) > 0.0015:  # both sides rounded to 3 places
+                print(f"scoring: {p['train_id']} scored {p['score']}, expected {expected[p['train_id']]} with {weights}")
+                return False
+        ranked = [p for p in result["plan"] if p["assignment"] != "IBL"]
+        counts = [len([p for p in ranked if p["assignment"] == a]) for a in ("Service", "Standby")]
+        if counts[0] > 12 or counts[1] > 4 or any(a["score"] < b["score"] for a, b in zip(ranked, ranked[1:])):
+            print(f"scoring: Service/Standby not filled in score order with {weights}")
+            return False
+    print("scoring: ok")
+    return True
+
+def check_conflicts(client):
+    day = plan_date()
+    trains = data_loader.load_full_train_data(day)
+    for weights in (WEIGHTS, dict(WEIGHTS, branding=20, cleaning=90)):
+        before = client.get("/api/conflict_rules").json
+        result = client.post("/api/optimize_date", json={"date": day, "weights": weights, "detail": "assignments"}).json
+        after = client.get("/api/conflict_rules").json
+        expected, evaluations = [], {}
+        for rule in conflicts.RULES:
+            if rule["enabled"] is not None and not rule["enabled"](weights):
+                continue
+            for p in result["plan"]:
+                if p["assignment"] in rule["assignments"]:
+                    record = next(t for t in trains if t["train_id"] == p["train_id"])
+                    evaluations[rule["name"]] = evaluations.get(rule["name"], 0) + 1
+                    found = rule["check"](record, p["assignment"])
+                    if found:
+                        expected.append(found)
+        if result["conflicts"] != expected:
+            print(f"conflicts: reported conflicts differ from what the rules find, in rule order "
+                  f"({len(result['conflicts'])} reported, {len(expected)} expected) with {weights}")
+            return False
+        for name, stats in after.items():
+            if stats["evaluations"] - before[name]["evaluations"] != evaluations.get(name, 0):
+                print(f"conflicts: {name} counted {stats['evaluations'] - before[name]['evaluations']} "
+                      f"evaluations, expected {evaluations.get(name, 0)} with {weights}")
+                return False
+    print("conflicts: ok")
+    return True
+
+def check_audit(client):
+    day = plan_date()
+    legacy = [{"timestamp": "2025-01-02T00:00:00Z", "optimization_type": "legacy", "n": 2},
+              {"timestamp": "2025-01-01T00:00:00Z", "optimization_type": "legacy", "n": 1}]
+    with open(audit.LEGACY_AUDIT_FILE, "w", encoding="utf-8") as f:
+        json.dump(legacy, f)
+    if client.get("/api/audit").json != legacy or not os.path.exists(audit.LEGACY_AUDIT_FILE + ".migrated"):
+        print("audit: legacy backend_audit.json not migrated newest first")
+        return False
+
+    saved = audit.MAX_BYTES, audit.BACKUP_COUNT
+    audit.MAX_BYTES, audit.BACKUP_COUNT = 6000, 2
+    try:
+        for service in range(1, 9):
+            client.post("/api/optimize_date", json={
+                "date": day, "weights": WEIGHTS, "requirements": {"service": service, "standby": 2}, "detail": "summary"
+            })
+    finally:
+        audit.MAX_BYTES, audit.BACKUP_COUNT = saved
+    backups = [n for n in range(1, 5) if os.path.exists(f"{audit.AUDIT_FILE}.{n}.gz")]
+    if backups != [1, 2]:
+        print(f"audit: backups {backups} after rotating with 2 kept")
+        return False
+    entries = client.get("/api/audit").json
+    served = [a["requirements"]["service"] for a in entries]
+    if not 2 <= len(served) < 8 or served != list(range(8, 8 - len(served), -1)):
+        print(f"audit: /api/audit gave requirements {served}, expected the newest entries first")
+        return False
+    if [a["requirements"]["service"] for a in client.get("/api/audit?type=date_specific&limit=2").json] != [8, 7]:
+        print("audit: /api/audit?type=&limit= did not return the two newest entries")
+        return False
+    stats = client.get("/api/stats").json
+    if stats["total_optimizations"] != len(entries) or stats["last_optimization"] != entries[0]["timestamp"]:
+        print(f"audit: /api/stats counted {stats['total_optimizations']} optimizations, /api/audit has {len(entries)}")
+        return False
+    print("audit: ok")
+    return True
+
+def check_batch(client):
+    dates = sorted(data_loader.load_train_data_range())
+    body = {"dates": dates, "weights": WEIGHTS, "requirements": {"service": 14, "standby": 5}, "detail": "assignments"}
+    for bad in ({"dates": []}, {"dates": ["2025-02-30"]}, {"executor": "fork"}, {"workers": 0},
+                {"workers": "2"}, {"workers": True}, {"detail": "everything"}):
+        response = client.post("/api/optimize_batch", json=dict(body, **bad))
+        if response.status_code != 400:
+            print(f"batch: {bad} answered {response.status_code}, expected 400")
+            return False
+
+    expected = {d: plan_key(client.post("/api/optimize_date", json=dict(body, date=d)).json) for d in dates}
+    order = dates[::-1] + dates[:1]
+    try:
+        for options in ({}, {"executor": "thread", "workers": 2}, {"executor": "process", "workers": 2}):
+            result = client.post("/api/optimize_batch", json=dict(body, dates=order, **options)).json
+            if sorted(result) != dates:
+                print(f"batch: {options} answered dates {sorted(result)} for {order}")
+                return False
+            if any(plan_key(result[d]) != expected[d] for d in dates):
+                print(f"batch: {options} plans differ from /api/optimize_date")
+                return False
+        response = client.post("/api/optimize_batch?stream=1", json=dict(body, dates=order, workers=2))
+        lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        streamed = {line["date"]: line["result"] for line in lines}
+        if response.mimetype != "application/x-ndjson" or len(lines) != len(dates) or sorted(streamed) != dates:
+            print(f"batch: streamed {len(lines)} lines for dates {sorted(streamed)}, expected one per date")
+            return False
+        if any(plan_key(streamed[d]) != expected[d] for d in dates):
+            print("batch: streamed plans differ from /api/optimize_date")
+            return False
+    finally:
+        batch.shutdown_pools()
+    print("batch: ok")
+    return True
+
+MALFORMED_DATES = [
+    ("get", "/api/full_trains?date=2025-9-20", None),
+    ("get", "/api/full_trains?from=yesterday", None),
+    ("get", "/api/full_trains?to=2025-09-31", None),
+    ("get", "/api/maintenance?from=2025/01/01", None),
+    ("get", "/api/maintenance/KMRL-T01?to=soon", None),
+    ("get", "/api/trains/KMRL-T01/timeline?from=20250918", None),
+    ("get", "/api/certificates/expiring?date=2025-13-01", None),
+    ("post", "/api/optimize_date", {"date": "2025-09-20T00:00"}),
+    ("post", "/api/optimize_batch", {"dates": ["2025-09-20", "tomorrow"]}),
+    ("post", "/api/optimize_incremental", {"date": "20-09-2025", "updates": [{"train_id": "KMRL-T01"}]}),
+    ("post", "/api/optimize_horizon", {"start_date": "2025-02-29"}),
+    ("post", "/api/optimize_sweep", {"date": "2025-9-20", "weight_sets": [WEIGHTS]}),
+]
+
+def _backend_answers(client, day, dates):
+    train_id = client.get(f"/api/full_trains?date={day}").json[0]["train_id"]
+    answers = [client.get(url).json for url in (
+        f"/api/full_trains?date={day}",
+        f"/api/full_trains?from={dates[0]}&to={dates[-1]}",
+        f"/api/full_trains?from={dates[1]}&status=Closed&sort=-fitness_score,train_id&limit=2",
+        f"/api/full_trains?date={day}&action=Revenue Service,Standby (Cleaning)&sort=mileage_since_maintenance&offset=3&limit=5",
+        f"/api/trains/{train_id}/timeline",
+        f"/api/trains/{train_id}/timeline?from={dates[1]}&fields=fitness_score,last_cleaning_date",
+        f"/api/certificates/expiring?date={day}&within_days=365&include_expired=1",
+    )]
+    for d in dates:
+        for certificates in ("off", "exclude"):
+            answers.append(client.post("/api/optimize_date", json={
+                "date": d, "weights": WEIGHTS, "certificates": certificates, "detail": "assignments"
+            }).json)
+    return answers
+
+def check_sqlite(client):
+    dates = sorted(data_loader.load_train_data_range())
+    day = dates[-1]
+    expected = _backend_answers(client, day, dates)
+    for backend in ("json", "sqlite"):
+        use_backend(backend)
+        if backend == "sqlite" and _backend_answers(client, day, dates) != expected:
+            print("sqlite: answers differ from the JSON backend")
+            return False
+        for method, url, body in MALFORMED_DATES:
+            response = getattr(client, method)(url, json=body)
+            if response.status_code != 400:
+                print(f"sqlite: {method.upper()} {url} {body or ''} answered {response.status_code} "
+                      f"from the {backend} backend, expected 400")
+                return False
+    print("sqlite: ok")
+    return True
+
+def check_importer(client):
+    source = os.path.join(data_loader.DATA_DIR, "full_train_data.json")
+    fleet = read_data("full_train_data.json")
+    for chunk_size in (7, 100, 1 << 20):
+        if list(import_json.iter_dated_records(source, chunk_size)) != list(fleet.items()):
+            print(f"importer: records streamed with {chunk_size}-character chunks differ from json.load")
+            return False
+
+    def rows():
+        with contextlib.closing(sqlite3.connect(repository.DB_PATH)) as db:
+            return db.execute("SELECT COUNT(*), COUNT(DISTINCT date || train_id) FROM train_inventory").fetchone()
+
+    expected = sum(len(trains) for trains in fleet.values())
+    quiet = lambda *args: None
+    import_json.import_file(source, repository.DB_PATH, batch_size=7, log=quiet)
+    import_json.import_file(source, repository.DB_PATH, batch_size=7, log=quiet)
+    if rows() != (expected, expected):
+        print(f"importer: (rows, distinct) {rows()} after importing twice, expected {expected} of each")
+        return False
+    day = max(fleet)
+    fleet[day][0]["fitness_score"] = 0.321
+    write_data("full_train_data.json", fleet)
+    import_json.import_file(source, repository.DB_PATH, log=quiet)
+    use_backend("sqlite")
+    served = client.get(f"/api/full_trains?date={day}&train_id={fleet[day][0]['train_id']}").json
+    if rows() != (expected, expected) or served[0]["fitness_score"] != 0.321:
+        print(f"importer: re-import did not update {fleet[day][0]['train_id']} in place")
+        return False
+    print("importer: ok")
+    return True
+
+def check_cache(client):
+    day = plan_date()
+    body = {"date": day, "weights": WEIGHTS, "requirements": {"service": 15, "standby": 5}}
+
+    def optimize(**changes):
+        before = client.get("/api/cache").json
+        result = client.post("/api/optimize_date", json=dict(body, **changes)).json
+        after = client.get("/api/cache").json
+        return result, ("hit" if after["hits"] > before["hits"] else "miss" if after["misses"] > before["misses"] else None)
+
+    first, outcome = optimize()
+    cases = [
+        ("repeat", {}, "hit"),
+        ("zero weight", {"weights": dict(WEIGHTS, readiness=0)}, "hit"),
+        ("requirements", {"requirements": {"service": 10, "standby": 5}}, "miss"),
+    ]
+    for name, changes, expected in cases:
+        result, outcome = optimize(**changes)
+        if outcome != expected or (expected == "hit" and result != first):
+            print(f"cache: {name} was a {outcome}, expected a {expected}")
+            return False
+
+    train_id = first["plan"][0]["train_id"]
+    fleet = read_data("full_train_data.json")
+    next(t for t in fleet[day] if t["train_id"] == train_id)["fitness_score"] = 0.0
+    write_data("full_train_data.json", fleet)
+    result, outcome = optimize()
+    if outcome != "miss" or result["plan"][0]["train_id"] == train_id:
+        print(f"cache: after a data change the plan was a {outcome} still led by {result['plan'][0]['train_id']}")
+        return False
+    leader = result["plan"][0]["train_id"]
+    client.post("/api/optimize_incremental", json=dict(body, updates=[{"train_id": leader, "needs_cleaning": True,
+                                                                      "fitness_score": 0.0}]))
+    result, outcome = optimize()
+    if outcome != "miss" or result["plan"][0]["train_id"] == leader:
+        print(f"cache: after a live update the plan was a {outcome} still led by {leader}")
+        return False
+
+    if client.post("/api/cache/invalidate").json["status"] != "ok" or client.get("/api/cache").json["size"] != 0:
+        print("cache: /api/cache/invalidate left results cached")
+        return False
+    print("cache: ok")
+    return True
+
+def check_incremental(client):
+    day = plan_date()
+    body = {"date": day, "weights": WEIGHTS, "requirements": {"service": 12, "standby": 4}}
+
+    def assignments(weights=WEIGHTS):
+        result = client.post("/api/optimize_date", json=dict(body, weights=weights, detail="assignments")).json
+        return {p["train_id"]: p["assignment"] for p in result["plan"]}
+
+    before = assignments()
+    ibl = [tid for tid, a in before.items() if a == "IBL"]
+    service = [tid for tid, a in before.items() if a == "Service"]
+    bad_requests = [
+        {"updates": []},
+        {"updates": [{"fitness_score": 1.0}]},
+        {"updates": [{"train_id": ibl[0], "fitness_score": 1.0}, {"train_id": service[0], "fitness_score": "high"}]},
+        {"updates": [{"train_id": ibl[0], "mileage_since_maintenance": 10.5}]},
+        {"updates": [{"train_id": ibl[0], "last_cleaning_date": "yesterday"}]},
+        {"updates": [{"train_id": ibl[0], "fitness_score": 1.0}], "weights": {"punctuality": "high"}},
+        {"updates": [{"train_id": ibl[0], "fitness_score": 1.0}], "requirements": {"service": "ten"}},
+    ]
+    for bad in bad_requests:
+        response = client.post("/api/optimize_incremental", json=dict(body, **bad))
+        if response.status_code != 400:
+            print(f"incremental: {bad} answered {response.status_code}, expected 400")
+            return False
+    if assignments() != before or live_updates.version(day):
+        print("incremental: a rejected request changed the plan")
+        return False
+
+    lift = {"train_id": ibl[0], "fitness_score": 1.0, "needs_cleaning": False, "mileage_since_maintenance": 0}
+    result = client.post("/api/optimize_incremental", json=dict(body, updates=[lift, {"train_id": "NO-SUCH-TRAIN"}])).json
+    after = assignments()
+    moved = {tid for tid in after if after[tid] != before[tid]}
+    reported = {e["train_id"]: e for e in result["changed"]}
+    if ibl[0] not in moved or not moved <= set(reported) or result["unknown_trains"] != ["NO-SUCH-TRAIN"]:
+        print(f"incremental: moves {sorted(moved)} but reported {sorted(reported)} for {lift}")
+        return False
+    if any(e["assignment"] != after[tid] or e["previous_assignment"] != before[tid] for tid, e in reported.items()):
+        print("incremental: reported assignments differ from /api/optimize_date")
+        return False
+    batched = client.post("/api/optimize_batch", json=dict(body, dates=[day], detail="assignments")).json[day]
+    if {p["train_id"]: p["assignment"] for p in batched["plan"]} != after:
+        print("incremental: /api/optimize_batch does not include the live update")
+        return False
+    other = dict(WEIGHTS, punctuality=200)
+    full = client.post("/api/optimize_date", json=dict(body, weights=other)).json
+    fitness = {p["train_id"]: p["reasons"][0]["value"] for p in full["plan"]}
+    if fitness[ibl[0]] != 1.0:
+        print("incremental: a plan with other weights does not include the live update")
+        return False
+
+    # dropped sessions and reloaded data keep the update, since it lives in the log
+    _reset()
+    if assignments() != after:
+        print("incremental: the live update was lost with the sessions and cached data")
+        return False
+
+    # another worker logs an update: this worker's session replays it before its own
+    client.post("/api/optimize_incremental", json=dict(body, updates=[{"train_id": ibl[1], "needs_cleaning": False}]))
+    drop = {"train_id": service[0], "fitness_score": 0.0, "needs_cleaning": True, "maintenance_due": True}
+    with open(live_updates.LIVE_UPDATES_FILE, "a", encoding="utf-8") as f:
+        f.write(json.dumps({"date": day, "updates": [drop]}) + "\n")
+    expected = assignments()
+    result = client.post("/api/optimize_incremental", json=dict(body, updates=[drop])).json
+    entry = next((e for e in result["changed"] if e["train_id"] == service[0]), None)
+    if entry is None or entry["previous_assignment"] != expected[service[0]] or assignments() != expected:
+        print(f"incremental: the session did not catch up on {drop} logged by another worker")
+        return False
+    print("incremental: ok")
+    return True
+
+def check_benchmark(client):
+    paths = data_loader.DATA_DIR, audit.AUDIT_FILE
+    output = os.path.join(os.path.dirname(data_loader.DATA_DIR), "bench.json")
+    with open(os.devnull, "w") as quiet, contextlib.redirect_stderr(quiet):  # per-stage progress
+        benchmark.main(["--trains", "12", "30", "--days", "2", "--repeat", "1", "--batch-dates", "2", "--output", output])
+    with open(output, encoding="utf-8") as f:
+        results = json.load(f)["results"]
+    stages = {"generate_dataset", "load_cold", "load_warm", "columns", "scoring", "conflict_detection", "optimize",
+              "optimize_batch", "audit_write", "api_full_trains", "api_optimize_date", "api_optimize_batch"}
+    for trains in (12, 30):
+        timed = {r["name"] for r in results if r["trains"] == trains and r["median_s"] >= 0}
+        if timed != stages:
+            print(f"benchmark: {trains} trains timed {sorted(timed)}, missing {sorted(stages - timed)}")
+            return False
+    if (data_loader.DATA_DIR, audit.AUDIT_FILE) != paths or os.path.exists(audit.AUDIT_FILE):
+        print("benchmark: the data directory or audit log was left pointing elsewhere or written to")
+        return False
+    print("benchmark: ok")
+    return True
+
+def check_generator(client):
+    keys = set(read_data("full_train_data.json")[plan_date()][0])
+    sim = {"num_trains": 40, "simulation_days": 6, "seed": 7, "start_date": datetime.datetime(2026, 2, 26)}
+    generated = generate_data.generate(**sim)
+    if generated != generate_data.generate(**sim) or generated == generate_data.generate(**dict(sim, seed=8)):
+        print("generator: the same seed gave different data, or another seed the same")
+        return False
+    dates = [(datetime.date(2026, 2, 26) + datetime.timedelta(days=k)).isoformat() for k in range(6)]
+    if list(generated) != dates or any(len(v) != 40 or any(set(t) != keys for t in v) for v in generated.values()):
+        print(f"generator: expected 40 records shaped like the checked-in data on each of {dates}")
+        return False
+
+    args = ["--trains", "40", "--days", "6", "--seed", "7", "--start-date", "2026-02-26"]
+    lines = os.path.join(os.path.dirname(data_loader.DATA_DIR), "fleet.jsonl")
+    with contextlib.redirect_stdout(None):
+        generate_data.main(args + ["--output", os.path.join(data_loader.DATA_DIR, "full_train_data.json")])
+        generate_data.main(args + ["--format", "jsonl", "--output", lines])
+        generate_data.main(args + ["--format", "sqlite", "--output", repository.DB_PATH])
+    with open(lines, encoding="utf-8") as f:
+        from_lines = {e["date"]: e["trains"] for e in map(json.loads, f)}
+    if read_data("full_train_data.json") != generated or from_lines != generated:
+        print("generator: the JSON or JSON Lines output differs from generate()")
+        return False
+    for backend in ("json", "sqlite"):
+        use_backend(backend)
+        served = client.get(f"/api/full_trains?from={dates[0]}").json
+        if served != generated:
+            print(f"generator: /api/full_trains from the {backend} backend differs from the generated data")
+            return False
+        planned = client.post("/api/optimize_batch", json={"dates": dates, "detail": "summary"}).json
+        if any(planned[d]["summary"]["total_trains"] != 40 for d in dates):
+            print(f"generator: not every generated day was planned from the {backend} backend")
+            return False
+    print("generator: ok")
+    return True
+
+def check_columnar(client):
+    dates = sorted(data_loader.load_train_data_range())
+    day = dates[-1]
+    expected = _backend_answers(client, day, dates)
+    use_backend("columnar")
+    if _backend_answers(client, day, dates) != expected:
+        print("columnar: answers differ from the JSON backend")
+        return False
+    for method, url, body in MALFORMED_DATES:
+        response = getattr(client, method)(url, json=body)
+        if response.status_code != 400:
+            print(f"columnar: {method.upper()} {url} {body or ''} answered {response.status_code}, expected 400")
+            return False
+
+    before = client.get(f"/api/full_trains?date={day}")
+    fleet = read_data("full_train_data.json")
+    fleet[day][0]["fitness_score"] = 0.456
+    write_data("full_train_data.json", fleet)
+    write_snapshot()
+    after = client.get(f"/api/full_trains?date={day}")
+    if after.json[0]["fitness_score"] != 0.456 or after.headers["ETag"] == before.headers["ETag"]:
+        print("columnar: a rewritten snapshot was not served")
+        return False
+    print("columnar: ok")
+    return True
+
+def check_records(client):
+    fleet = read_data("full_train_data.json")
+    day = max(fleet)
+    del fleet[day][0]["branding_company"]
+    fleet[day][0]["depot"] = "Muttom"
+    fleet[day][1]["branding_active"] = 1
+    del fleet[day][1]["branding_company"]
+    write_data("full_train_data.json", fleet)
+    for d in fleet:
+        if client.get(f"/api/full_trains?date={d}").json != fleet[d]:
+            print(f"records: /api/full_trains?date={d} differs from the data file")
+            return False
+    if client.get("/api/full_trains?from=2000-01-01").json != fleet:
+        print("records: /api/full_trains?from= differs from the data file")
+        return False
+    result = client.post("/api/optimize_date", json={"date": day, "weights": WEIGHTS,
+                                                     "requirements": {"service": 0, "standby": 0}})
+    trains = {p["train_id"] for p in result.json.get("plan", [])}
+    if result.status_code != 200 or trains != {t["train_id"] for t in fleet[day]}:
+        print(f"records: planning a fleet with a missing and an unknown field answered {result.status_code}")
+        return False
+    print("records: ok")
+    return True
+
+def check_detail(client):
+    day = plan_date()
+    body = {"date": day, "weights": WEIGHTS}
+    full = client.post("/api/optimize_date", json=body).json
+    if not all("reasons" in p for p in full["plan"]) or "conflicts" not in full:
+        print("detail: the default answer has no reasons or conflicts")
+        return False
+
+    def shaped(result, keys):
+        return [{k: p[k] for k in keys} for p in result["plan"]]
+
+    cases = [
+        ("?detail=assignments", {}, ["train_id", "assignment", "score"]),
+        ("", {"explain": False}, ["train_id", "assignment", "score"]),
+        ("?fields=train_id,assignment", {}, ["train_id", "assignment"]),
+        ("", {"detail": "full", "fields": ["assignment", "reasons"]}, ["assignment", "reasons"]),
+    ]
+    for query, options, keys in cases:
+        result = client.post(f"/api/optimize_date{query}", json=dict(body, **options)).json
+        if result["plan"] != shaped(full, keys) or result["summary"] != full["summary"]:
+            print(f"detail: {query or options} did not give plan entries with just {keys}")
+            return False
+    summary = client.post("/api/optimize_date?detail=summary", json=body).json
+    if "plan" in summary or "conflicts" in summary or summary["summary"] != full["summary"]:
+        print("detail: detail=summary still has a plan or conflicts")
+        return False
+    if client.post("/api/optimize_date", json=body).json != full:
+        print("detail: a cut-down answer changed the cached full result")
+        return False
+
+    batched = client.post("/api/optimize_batch?detail=summary", json=dict(body, dates=[day])).json[day]
+    horizon = client.post("/api/optimize_horizon", json={"start_date": day, "days": 2, "fields": "train_id"}).json
+    if "plan" in batched or any(set(p) != {"train_id"} for d in horizon["days"] for p in d["plan"]):
+        print("detail: /api/optimize_batch or /api/optimize_horizon ignored detail or fields")
+        return False
+    for url, payload in (("/api/optimize", {}), ("/api/optimize_date", body), ("/api/optimize_batch", {"dates": [day]}),
+                         ("/api/optimize_horizon", {"start_date": day})):
+        response = client.post(url, json=dict(payload, detail="everything"))
+        if response.status_code != 400:
+            print(f"detail: {url} with an unknown detail answered {response.status_code}, expected 400")
+            return False
+    print("detail: ok")
+    return True
+
+def _pages(client, url):
+    """Every page's rows, following Link rel="next" (a date range's {date: rows} page counts as one
+       row); (rows, X-Total-Count of the first page)"""
+    rows, total = [], None
+    while url:
+        response = client.get(url)
+        rows.extend(response.json if isinstance(response.json, list) else [response.json])
+        total = int(response.headers["X-Total-Count"]) if total is None else total
+        url = None
+        for link in response.headers.get("Link", "").split(", "):
+            if link.endswith('rel="next"'):
+                parts = urlsplit(link[1:link.index(">")])
+                url = f"{parts.path}?{parts.query}"
+    return rows, total
+
+def check_listing(client):
+    fleet = read_data("full_train_data.json")
+    day = max(fleet)
+    logs = read_data("maintenance_log.json")
+    trains = sorted((t for t in fleet[day] if t["job_card_status"] == "Closed"
+                     and t["recommended_action"] in ("Revenue Service", "Standby (Cleaning)")),
+                    key=lambda t: (-t["fitness_score"], t["train_id"]))
+    entries = sorted((e for e in logs if "2025-03-01" <= e["maintenance_date"] <= "2025-08-31"),
+                     key=lambda e: (e["type_of_maintenance"], e["maintenance_date"]), reverse=True)
+    cases = [
+        (f"/api/full_trains?date={day}&status=Closed&action=Revenue Service,Standby (Cleaning)"
+         "&sort=-fitness_score,train_id", trains),
+        (f"/api/full_trains?date={day}", fleet[day]),
+        ("/api/maintenance?from=2025-03-01&to=2025-08-31&sort=-type_of_maintenance,-maintenance_date", entries),
+        (f"/api/maintenance?train_id={logs[0]['train_id']}",
+         [e for e in logs if e["train_id"] == logs[0]["train_id"]]),
+    ]
+    for url, expected in cases:
+        unpaged = client.get(url)
+        if unpaged.json != expected or unpaged.headers["X-Total-Count"] != str(len(expected)):
+            print(f"listing: {url} differs from filtering and sorting the data file")
+            return False
+        for limit in (1, 4, len(expected) + 1):
+            rows, total = _pages(client, f"{url}&limit={limit}")
+            if rows != expected or total != len(expected):
+                print(f"listing: pages of {limit} from {url} gave {len(rows)} rows of {total}, expected {len(expected)}")
+                return False
+        page = client.get(f"{url}&offset=2&limit=3")
+        if page.json != expected[2:5] or ('rel="prev"' in page.headers.get("Link", "")) != bool(expected):
+            print(f"listing: offset=2&limit=3 from {url} is not rows 2-4 with a previous page link")
+            return False
+
+    dated, total = _pages(client, "/api/full_trains?from=2000-01-01&limit=1")
+    if dated != [{d: fleet[d]} for d in fleet] or total != len(fleet):
+        print("listing: paging a date range does not give one date per page")
+        return False
+    for url in ("/api/full_trains?limit=-1", "/api/full_trains?offset=x", "/api/full_trains?sort=colour",
+                "/api/maintenance?limit=ten", "/api/maintenance?sort=-train_name", "/api/maintenance?offset=-3"):
+        if client.get(url).status_code != 400:
+            print(f"listing: {url} answered {client.get(url).status_code}, expected 400")
+            return False
+    print("listing: ok")
+    return True
+
+def check_etag(client):
+    day = plan_date()
+    for url, name in ((f"/api/full_trains?date={day}", "full_train_data.json"),
+                      ("/api/maintenance?limit=5", "maintenance_log.json")):
+        first = client.get(url)
+        etag, modified = first.headers.get("ETag"), first.headers.get("Last-Modified")
+        if not etag or not modified or first.headers.get("Cache-Control") != "no-cache":
+            print(f"etag: {url} has no ETag, Last-Modified or Cache-Control: no-cache")
+            return False
+        for headers in ({"If-None-Match": etag}, {"If-Modified-Since": modified}):
+            cached = client.get(url, headers=headers)
+            if cached.status_code != 304 or cached.data or cached.headers.get("ETag") != etag:
+                print(f"etag: {url} with {headers} answered {cached.status_code}, expected an empty 304")
+                return False
+        if client.get(url + "&sort=train_id").headers["ETag"] == etag:
+            print(f"etag: {url} has the same ETag with another query")
+            return False
+        write_data(name, read_data(name))
+        changed = client.get(url, headers={"If-None-Match": etag})
+        if changed.status_code != 200 or changed.headers["ETag"] == etag:
+            print(f"etag: {url} still answered {changed.status_code} after {name} changed")
+            return False
+    print("etag: ok")
+    return True
+
+def check_maintenance(client):
+    logs = read_data("maintenance_log.json")
+    dates = sorted(e["maintenance_date"] for e in logs)
+    start, end = dates[len(dates) // 4], dates[len(dates) // 2]
+    for train_id in sorted({e["train_id"] for e in logs}):
+        history = sorted((e for e in logs if e["train_id"] == train_id), key=lambda e: e["maintenance_date"])
+        within = [e for e in history if start <= e["maintenance_date"] <= end]
+        for url, expected in ((f"/api/maintenance/{train_id}", history),
+                              (f"/api/maintenance/{train_id}?from={start}&to={end}", within),
+                              (f"/api/maintenance/{train_id}?to={end}&offset=1&limit=2",
+                               [e for e in history if e["maintenance_date"] <= end][1:3])):
+            if client.get(url).json != expected:
+                print(f"maintenance: {url} differs from the train's log entries")
+                return False
+    if client.get("/api/maintenance/NO-SUCH-TRAIN").status_code != 404:
+        print("maintenance: a train without history did not get a 404")
+        return False
+
+    fleet = read_data("full_train_data.json")
+    day = max(fleet)
+    record = fleet[day][0]
+    del record["last_maintenance_date"]
+    write_data("full_train_data.json", fleet)
+    logged = max((e["maintenance_date"] for e in logs if e["train_id"] == record["train_id"]
+                  and e["maintenance_date"] <= day), default=None)
+    expected = (datetime.date.fromisoformat(day) - datetime.date.fromisoformat(logged)).days if logged else 9999
+    plan = client.post("/api/optimize_date", json={"date": day, "weights": WEIGHTS}).json["plan"]
+    entry = next(p for p in plan if p["train_id"] == record["train_id"])
+    age = next(r["value"] for r in entry["reasons"] if r.get("metric") == "maintenance_age_days")
+    if age != expected:
+        print(f"maintenance: {record['train_id']} without last_maintenance_date aged {age} days, expected {expected}")
+        return False
+    print("maintenance: ok")
+    return True
+
+def check_solver(client):
+    day = plan_date()
+    body = {"date": day, "weights": WEIGHTS, "requirements": {"service": 10, "standby": 2}, "detail": "assignments"}
+
+    def counts(result):
+        return {a: sum(p["assignment"] == a for p in result["plan"]) for a in ("Service", "Standby", "IBL")}
+
+    greedy = client.post("/api/optimize_date", json=body).json
+    exact = client.post("/api/optimize_date?mode=solver", json=body).json
+    if exact["solver"]["status"] != "optimal" or plan_key(exact) != plan_key(greedy):
+        print(f"solver: unconstrained plan ({exact['solver']['status']}) differs from the greedy one")
+        return False
+    objective = -sum(p["score"] * {"Service": 1, "Standby": 0.5, "IBL": 0}[p["assignment"]] for p in exact["plan"])
+    if abs(objective - exact["solver"]["objective"]) > 0.001 * len(exact["plan"]):
+        print(f"solver: objective {exact['solver']['objective']} does not match the plan's {objective:.4f}")
+        return False
+
+    capped = client.post("/api/optimize_date", json=dict(body, solver={"capacities": {"Service": 7, "IBL": 8}})).json
+    n = len(capped["plan"])
+    if counts(capped) != {"Service": 7, "Standby": n - 15, "IBL": 8} or capped["solver"]["status"] != "optimal":
+        print(f"solver: capacities Service 7 / IBL 8 gave {counts(capped)} ({capped['solver']['status']})")
+        return False
+
+    later = (datetime.date.fromisoformat(day) + datetime.timedelta(days=120)).isoformat()
+    fleet = data_loader.load_full_train_data(day)
+    lapsed = {t["train_id"] for t in fleet
+              if any(t.get(c) and t.get(c) < later for c in ("rs_cert_expiry", "sig_cert_expiry", "telecom_cert_expiry"))}
+    gated = client.post("/api/optimize_date?mode=solver", json=dict(body, date=later)).json
+    running = {p["train_id"] for p in gated["plan"] if p["assignment"] != "IBL"}
+    if not lapsed or running & lapsed:
+        print(f"solver: trains with expired certificates {sorted(running & lapsed)} assigned Service/Standby")
+        return False
+
+    for query, options in (("?mode=fast", {}), ("", {"solver": "fast"}), ("", {"solver": {"capacities": [3]}}),
+                           ("", {"solver": {"time_budget": "soon"}}), ("", {"solver": {"capacities": {"IBL": "many"}}})):
+        response = client.post(f"/api/optimize_date{query}", json=dict(body, **options))
+        if response.status_code != 400:
+            print(f"solver: {query or options} answered {response.status_code}, expected 400")
+            return False
+    print("solver: ok")
+    return True
+
+def _metric(entry, name):
+    return next(r["value"] for r in entry["reasons"] if r.get("metric") == name)
+
+def check_horizon(client):
+    start = min(data_loader.load_train_data_range())
+    first = data_loader.load_full_train_data(start)[0]["train_id"]
+    client.post("/api/optimize_incremental", json={"date": start, "weights": WEIGHTS,
+                                                   "updates": [{"train_id": first, "needs_cleaning": True}]})
+    result = client.post("/api/optimize_horizon", json={"start_date": start, "days": 6, "daily_km": 700,
+                                                        "weights": WEIGHTS}).json
+    dates = [(datetime.date.fromisoformat(start) + datetime.timedelta(days=k)).isoformat() for k in range(6)]
+    if [d["date"] for d in result["days"]] != dates:
+        print(f"horizon: planned {[d['date'] for d in result['days']]}, expected {dates}")
+        return False
+    rows = {r["date"]: r for r in client.get("/api/daily_requirements").json}
+    for day in result["days"]:
+        row = rows.get(day["date"])
+        if row and (day["service_needed"], day["standby_needed"]) != (row["service_trains_required"],
+                                                                     row["standby_trains_required"]):
+            print(f"horizon: {day['date']} planned for {day['service_needed']}/{day['standby_needed']}, "
+                  f"daily_requirements.json asks for {row['service_trains_required']}/{row['standby_trains_required']}")
+            return False
+    day0 = result["days"][0]
+    expected = client.post("/api/optimize_date", json={"date": start, "weights": WEIGHTS, "requirements": {
+        "service": day0["service_needed"], "standby": day0["standby_needed"]}}).json
+    if plan_key(day0) != plan_key(expected) or not _metric(next(p for p in day0["plan"] if p["train_id"] == first),
+                                                         "needs_cleaning"):
+        print("horizon: the first day differs from /api/optimize_date with the live update")
+        return False
+
+    for before, after in zip(result["days"], result["days"][1:]):
+        today = {p["train_id"]: p for p in before["plan"]}
+        for p in after["plan"]:
+            prev, tid = today[p["train_id"]], p["train_id"]
+            mileage, previous = _metric(p, "mileage_since_maintenance"), _metric(prev, "mileage_since_maintenance")
+            maintained = any("maintenance status" in r.get("note", "") for r in prev["reasons"])
+            km = previous + 700 if prev["assignment"] == "Service" else 0 if maintained else previous
+            if mileage != km:
+                print(f"horizon: {tid} ({prev['assignment']} on {before['date']}) has {mileage} km since "
+                      f"maintenance on {after['date']}, expected {km}")
+                return False
+            if prev["assignment"] == "Standby" and _metric(prev, "needs_cleaning") and _metric(p, "needs_cleaning"):
+                print(f"horizon: {tid} on Standby {before['date']} still needs cleaning on {after['date']}")
+                return False
+        moves = sorted((p["train_id"], today[p["train_id"]]["assignment"], p["assignment"])
+                       for p in after["plan"] if today[p["train_id"]]["assignment"] != p["assignment"])
+        if sorted((c["train_id"], c["from"], c["to"]) for c in after["changed"]) != moves:
+            print(f"horizon: changed on {after['date']} does not list the moves from {before['date']}")
+            return False
+
+    for bad in ({"days": 0}, {"days": 91}, {"days": "7"}, {"start_date": "2025-09-31"}, {"daily_km": "far"}):
+        response = client.post("/api/optimize_horizon", json=dict({"start_date": start}, **bad))
+        if response.status_code != 400:
+            print(f"horizon: {bad} answered {response.status_code}, expected 400")
+            return False
+    print("horizon: ok")
+    return True
+
+def check_sweep(client):
+    day = plan_date()
+    requirements = {"service": 13, "standby": 4}
+    base = dict(WEIGHTS, cleaning=40)
+    lead = data_loader.load_full_train_data(day)[3]["train_id"]
+    client.post("/api/optimize_incremental", json={"date": day, "weights": base, "requirements": requirements,
+                                                   "updates": [{"train_id": lead, "fitness_score": 0.05}]})
+
+    def planned(weights):
+        result = client.post("/api/optimize_date", json={"date": day, "weights": weights, "requirements": requirements,
+                                                         "detail": "assignments"}).json
+        return result["summary"], {p["train_id"]: p["assignment"] for p in result["plan"]}
+
+    body = {"date": day, "weights": base, "requirements": requirements, "include_assignments": True}
+    grid = {"punctuality": [0, 50, 100], "branding": [0, 90], "cleaning": [10, 80]}
+    sweeps = [
+        (dict(body, grid=grid), 12),
+        (dict(body, weight_sets=[{"mileage": 0}, {"maintenance": 200, "punctuality": 5}]), 2),
+        (dict(body, samples=5, seed=3, ranges={"mileage": [0, 100], "branding": [20, 30]}), 5),
+    ]
+    _, base_assignment = planned(base)
+    for payload, size in sweeps:
+        results = client.post("/api/optimize_sweep", json=payload).json["results"]
+        if len(results) != size:
+            print(f"sweep: {len(results)} results for {size} weight sets")
+            return False
+        for r in results:
+            summary, assignment = planned(r["weights"])
+            moved = sorted((tid, base_assignment[tid], a) for tid, a in assignment.items() if base_assignment[tid] != a)
+            if r["summary"] != summary or r["assignments"] != assignment or r["assignments_changed"] != len(moved):
+                print(f"sweep: weights {r['weights']} differ from /api/optimize_date")
+                return False
+            if sorted((c["train_id"], c["from"], c["to"]) for c in r["changed_trains"]) != moved:
+                print(f"sweep: changed_trains for {r['weights']} are not the moves from the base weights")
+                return False
+    grid_weights = [r["weights"] for r in client.post("/api/optimize_sweep", json=dict(body, grid=grid)).json["results"]]
+    combinations = [dict(base, punctuality=p, branding=b, cleaning=c)
+                    for p in grid["punctuality"] for b in grid["branding"] for c in grid["cleaning"]]
+    if sorted(map(sorted, map(dict.items, grid_weights))) != sorted(map(sorted, map(dict.items, combinations))):
+        print("sweep: the grid is not every combination once")
+        return False
+
+    sampled = [client.post("/api/optimize_sweep", json=sweeps[2][0]).json["results"] for _ in range(2)]
+    if sampled[0] != sampled[1] or not all(0 <= r["weights"]["mileage"] <= 100 and 20 <= r["weights"]["branding"] <= 30
+                                           for r in sampled[0]):
+        print("sweep: seeded samples differ between runs or leave their ranges")
+        return False
+    summary = client.post("/api/optimize_sweep?detail=summary", json=dict(body, grid=grid)).json["results"]
+    if any("changed_trains" in r for r in summary):
+        print("sweep: detail=summary kept changed_trains")
+        return False
+    for bad in ({"grid": {"mileage": list(range(100)), "branding": list(range(100))}}, {"samples": 5001},
+                {"weight_sets": []}, {}, {"weight_sets": [{"mileage": "x"}]}, {"weights": {"mileage": True}, "samples": 2},
+                {"grid": {"mileage": 5}}, {"samples": "many"}):
+        payload = dict({"date": day}, **bad)
+        response = client.post("/api/optimize_sweep", json=payload)
+        if response.status_code != 400:
+            print(f"sweep: {bad} answered {response.status_code}, expected 400")
+            return False
+    print("sweep: ok")
+    return True
+
+def _samples(client):
+    """{'name{labels}': value} from /metrics"""
+    text = client.get("/metrics").get_data(as_text=True)
+    return {line.rsplit(" ", 1)[0]: float(line.rsplit(" ", 1)[1])
+            for line in text.splitlines() if line and not line.startswith("#")}
+
+def check_metrics(client):
+    metrics.reset()
+    app_module = sys.modules["app"]
+    day = plan_date()
+    severities = {}
+    # computed, cached, computed, computed by the solver
+    for query, weights, computed in (("", WEIGHTS, True), ("", WEIGHTS, False),
+                                     ("", dict(WEIGHTS, cleaning=90), True), ("?mode=solver", WEIGHTS, True)):
+        result = client.post(f"/api/optimize_date{query}", json={"date": day, "weights": weights,
+                                                                 "detail": "assignments"}).json
+        for c in result["conflicts"] if computed else ():
+            severities[c["severity"]] = severities.get(c["severity"], 0) + 1
+    for train_id in ("KMRL-T01", "KMRL-T02", "NO-SUCH-TRAIN"):
+        client.get(f"/api/maintenance/{train_id}")
+
+    samples = _samples(client)
+    cache = client.get("/api/cache").json
+    latency = 'metropal_http_request_duration_seconds_count{method="%s",endpoint="%s",status="%s"}'
+    expected = {
+        latency % ("POST", "/api/optimize_date", "200"): 4,
+        latency % ("GET", "/api/maintenance/<train_id>", "200"): 2,
+        latency % ("GET", "/api/maintenance/<train_id>", "404"): 1,
+        'metropal_optimize_total{mode="greedy"}': 2,
+        'metropal_optimize_total{mode="solver"}': 1,
+        "metropal_result_cache_hits_total": cache["hits"],
+        "metropal_result_cache_misses_total": cache["misses"],
+        'metropal_phase_duration_seconds_count{phase="score"}': 3,
+        'metropal_phase_duration_seconds_count{phase="audit_write"}': 4,
+    }
+    expected.update({f'metropal_conflicts_total{{severity="{k}"}}': v for k, v in severities.items()})
+    for name, value in expected.items():
+        if samples.get(name) != value:
+            print(f"metrics: {name} is {samples.get(name)}, expected {value}")
+            return False
+    if not any(k.startswith("metropal_conflict_rule_evaluations_total") for k in samples):
+        print("metrics: no conflict rule counters")
+        return False
+
+    saved = app_module.PROFILING
+    try:
+        app_module.PROFILING = False
+        if client.get("/api/maintenance/KMRL-T01?profile=1").mimetype != "application/json":
+            print("metrics: ?profile=1 answered with a profile while profiling is off")
+            return False
+        app_module.PROFILING = True
+        for url, headers, status in (("/api/maintenance/KMRL-T01?profile=1", {}, 200),
+                                     ("/api/maintenance/NO-SUCH-TRAIN", {"X-Profile": "1"}, 404)):
+            response = client.get(url, headers=headers)
+            if response.mimetype != "text/plain" or response.status_code != status or \
+                    "function calls" not in response.get_data(as_text=True):
+                print(f"metrics: {url} {headers} did not give a cProfile report with status {status}")
+                return False
+    finally:
+        app_module.PROFILING = saved
+    print("metrics: ok")
+    return True
+
+async def asgi_call(method, url, body=None, headers=(), read_slowly=None):
+    """(status, {header: value}, body) of one request to asgi.app; read_slowly, an asyncio.Event,
+       holds the client after each body chunk until it is set"""
+    path, _, query = url.partition("?")
+    payload = json.dumps(body).encode() if body is not None else b""
+    scope = {"type": "http", "method": method, "path": path, "query_string": query.encode(), "http_version": "1.1",
+             "headers": [(b"content-type", b"application/json"), *((k.encode(), v.encode()) for k, v in headers)]}
+    received = []
+
+    async def receive():
+        if not received:
+            received.append(True)
+            return {"type": "http.request", "body": payload, "more_body": False}
+        await asyncio.Event().wait()  # the client never disconnects
+
+    response = {"body": b""}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+            response["headers"] = {k.decode(): v.decode() for k, v in message["headers"]}
+        else:
+            response["body"] += message.get("body", b"")
+            if read_slowly is not None and message.get("more_body"):
+                await read_slowly.wait()
+
+    await asgi.app(scope, receive, send)
+    return response["status"], response["headers"], response["body"]
+
+def check_asgi(client):
+    day = plan_date()
+    dates = sorted(data_loader.load_train_data_range())
+    stream_body = {"dates": dates, "stream": True, "detail": "assignments", "workers": 1}
+
+    async def run():
+        for method, url, body in (("GET", f"/api/full_trains?date={day}&limit=5", None),
+                                  ("GET", "/api/maintenance/KMRL-T02", None),
+                                  ("POST", "/api/optimize_date", {"date": day, "detail": "assignments"}),
+                                  ("POST", "/api/optimize_batch", {"dates": ["bad"]})):
+            expected = client.open(url, method=method, json=body)
+            status, headers, data = await asgi_call(method, url, body)
+            if (status, json.loads(data)) != (expected.status_code, expected.json):
+                return f"{method} {url} answered {status} unlike the Flask app's {expected.status_code}"
+            if headers.get("etag") != expected.headers.get("ETag"):
+                return f"{method} {url} sent ETag {headers.get('etag')}, the Flask app {expected.headers.get('ETag')}"
+            if headers.get("etag"):
+                status, _, data = await asgi_call(method, url, body, [("if-none-match", headers["etag"])])
+                if status != 304 or data:
+                    return f"{url} with If-None-Match answered {status}, expected an empty 304"
+
+        expected = client.post("/api/optimize_batch", json=stream_body).get_data(as_text=True).splitlines()
+        status, headers, data = await asgi_call("POST", "/api/optimize_batch", stream_body)
+        if status != 200 or sorted(data.decode().splitlines()) != sorted(expected):
+            return "the streamed batch differs from the Flask app's"
+
+        lane = asgi._lanes["cpu"]
+        release = asyncio.Event()
+        slow = [asyncio.ensure_future(asgi_call("POST", "/api/optimize_batch", stream_body, read_slowly=release))
+                for _ in range(asgi.CPU_WORKERS + 2)]
+        await asyncio.sleep(0.5)
+        try:
+            status, _, _ = await asyncio.wait_for(
+                asgi_call("POST", "/api/optimize_date", {"date": day, "detail": "summary"}), 10)
+        except asyncio.TimeoutError:
+            status = "no answer"
+        release.set()
+        if status != 200 or any(r[0] != 200 for r in await asyncio.gather(*slow)):
+            return f"a quick request got {status} while slow streamed responses were being read"
+
+        saved = lane.inflight, asgi.MAX_BODY
+        lane.inflight = lane.limit
+        try:
+            status, headers, _ = await asgi_call("POST", "/api/optimize_date", {"date": day})
+            if status != 503 or headers.get("retry-after") != "1":
+                return f"a full lane answered {status}, expected 503 with Retry-After"
+            lane.inflight, asgi.MAX_BODY = saved[0], 10
+            status, _, _ = await asgi_call("GET", "/api/full_trains", {"padding": "x" * 20})
+            if status != 413:
+                return f"an oversized body answered {status}, expected 413"
+        finally:
+            lane.inflight, asgi.MAX_BODY = saved
+
+    failure = asyncio.run(run())
+    if failure:
+        print(f"asgi: {failure}")
+        return False
+    print("asgi: ok")
+    return True
+
+def parse_frames(data):
+    """[(id or None, event, data)] of the SSE frames in data; retry and comments are skipped"""
+    frames = []
+    for block in data.decode().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines() if not line.startswith((":", "retry")))
+        if fields:
+            frames.append((fields.get("id") and int(fields["id"]), fields["event"], json.loads(fields["data"])))
+    return frames
+
+def check_events(client):
+    day = plan_date()
+    last_id = events.publish("mark", {})
+    delivered = []
+    events.bus.subscribe(delivered.append)
+    try:
+        client.post("/api/optimize_date", json={"date": day, "weights": dict(WEIGHTS, branding=20, cleaning=90)})
+        version = client.post("/api/cache/invalidate").json["data_version"]
+    finally:
+        events.bus.unsubscribe(delivered.append)
+    got = parse_frames(b"".join(delivered))
+    latest = client.get("/api/audit?limit=1").json[0]
+    conflicts = client.get("/api/conflicts").json
+    expected = [("optimization", {"timestamp": latest["timestamp"], "optimization_type": latest["optimization_type"],
+                                  "date": day, "summary": latest["result_summary"]}),
+                ("conflicts", conflicts[0]), ("data_version", {"data_version": version})]
+    if not latest.get("conflicts") or [frame[1:] for frame in got] != expected:
+        print(f"events: published {[frame[1] for frame in got]}, expected optimization, conflicts and "
+              "data_version shaped like the audit and /api/conflicts entries")
+        return False
+    if [frame[0] for frame in got] != list(range(last_id + 1, last_id + 4)):
+        print(f"events: event ids {[frame[0] for frame in got]} don't follow {last_id}")
+        return False
+
+    response = client.get("/api/stream", headers={"Last-Event-ID": str(last_id)})
+    chunks = iter(response.response)
+    opening = b"".join(next(chunks) for _ in range(2 + len(got)))
+    response.close()
+    if events.bus.subscriber_count():
+        print("events: closing /api/stream left its subscriber registered")
+        return False
+    hello = [(None, "hello", {"data_version": data_loader.data_version()})]
+    if not opening.startswith(b"retry: ") or parse_frames(opening) != hello + got:
+        print("events: /api/stream didn't open with retry, hello and the events after Last-Event-ID")
+        return False
+
+    async def asgi_stream():
+        messages = [{"type": "http.request", "body": b"", "more_body": False}]
+        body = []
+
+        async def receive():
+            if messages:
+                return messages.pop()
+            await asyncio.sleep(0.2)
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            body.append(message.get("body", b""))
+
+        scope = {"type": "http", "method": "GET", "path": "/api/stream", "query_string": f"last_event_id={last_id}".encode(),
+                 "headers": []}
+        await asyncio.wait_for(asgi.app(scope, receive, send), 10)
+        return b"".join(body)
+
+    try:
+        opening = asyncio.run(asgi_stream())
+    except asyncio.TimeoutError:
+        print("events: the ASGI /api/stream kept going after the client disconnected")
+        return False
+    if not opening.startswith(b"retry: ") or parse_frames(opening) != hello + got or events.bus.subscriber_count():
+        print("events: the ASGI /api/stream didn't open with retry, hello and the events after last_event_id")
+        return False
+    print("events: ok")
+    return True
+
+def check_snapshot(client):
+    day = plan_date()
+    url = f"/api/full_trains?date={day}"
+    before = client.get(url)
+    fleet = read_data("full_train_data.json")
+    fleet[day][0]["fitness_score"] = -1.0
+    try:
+        create_app(preload=True)
+        if not data_loader._frozen or not gc.get_freeze_count():
+            print("snapshot: create_app(preload=True) didn't freeze the data")
+            return False
+        write_data("full_train_data.json", fleet)
+        frozen = client.get(url)
+        if (frozen.json, frozen.headers["ETag"]) != (before.json, before.headers["ETag"]):
+            print("snapshot: a data file change was served before reload()")
+            return False
+        if hasattr(os, "fork"):
+            pid = os.fork()
+            if pid == 0:
+                os._exit(0 if client.get(url).json == before.json else 1)
+            if os.waitpid(pid, 0)[1]:
+                print("snapshot: a forked worker didn't serve the snapshot")
+                return False
+        data_loader.reload()
+        after = client.get(url)
+        if after.json[0]["fitness_score"] != -1.0 or after.headers["ETag"] == before.headers["ETag"]:
+            print("snapshot: reload() didn't pick up the changed data file")
+            return False
+        fleet[day][0]["fitness_score"] = -2.0
+        write_data("full_train_data.json", fleet)
+        if client.get(url).json != after.json:
+            print("snapshot: reload() left the new data unfrozen")
+            return False
+    finally:
+        data_loader._frozen = False
+        gc.unfreeze()
+    print("snapshot: ok")
+    return True
+
+def check_timeline(client):
+    fleet = read_data("full_train_data.json")
+    dates = sorted(fleet)
+    start, end = dates[1], dates[-2]
+    fields = list(data_loader.TIMELINE_FIELDS)
+    for backend in ("json", "sqlite", "columnar"):
+        use_backend(backend)
+        for train_id in sorted({t["train_id"] for d in dates for t in fleet[d]}):
+            records = {}
+            for d in dates:
+                record = next((t for t in fleet[d] if t["train_id"] == train_id), None)
+                if record is not None:
+                    records[d] = record
+            for url, lo, hi, picked in ((f"/api/trains/{train_id}/timeline", None, None, fields),
+                                        (f"/api/trains/{train_id}/timeline?from={start}&to={end}"
+                                         "&fields=fitness_score,last_cleaning_date", start, end,
+                                         ["fitness_score", "last_cleaning_date"])):
+                within = [d for d in records if (lo is None or d >= lo) and (hi is None or d <= hi)]
+                expected = {"train_id": train_id, "from": lo, "to": hi, "dates": within,
+                            "series": {f: [records[d].get(f) for d in within] for f in picked}}
+                if client.get(url).json != expected:
+                    print(f"timeline: {url} differs from the fleet file on the {backend} backend")
+                    return False
+        if client.get("/api/trains/NO-SUCH-TRAIN/timeline").status_code != 404:
+            print(f"timeline: an unknown train did not get a 404 on the {backend} backend")
+            return False
+    for url in (f"/api/trains/{train_id}/timeline?fields=fitness_score,no_such_field",
+                f"/api/trains/{train_id}/timeline?fields=train_id",
+                f"/api/trains/{train_id}/timeline?from=2025-13-01"):
+        if client.get(url).status_code != 400:
+            print(f"timeline: {url} did not get a 400")
+            return False
+    response = client.get(f"/api/trains/{train_id}/timeline")
+    if client.get(f"/api/trains/{train_id}/timeline", headers={"If-None-Match": response.headers["ETag"]}).status_code != 304:
+        print("timeline: a request with the current ETag did not get a 304")
+        return False
+    print("timeline: ok")
+    return True
+
+def check_certificates(client):
+    fleet = read_data("full_train_data.json")
+    day = plan_date()
+    ref = datetime.date.fromisoformat(day)
+    records = fleet[day]
+    plan = client.post("/api/optimize_date", json={"date": day, "weights": WEIGHTS, "certificates": "off"}).json["plan"]
+    service, standby = ([records.index(next(t for t in records if t["train_id"] == p["train_id"]))
+                         for p in plan if p["assignment"] == assignment][:2] for assignment in ("Service", "Standby"))
+    shifted = lambda days: (ref + datetime.timedelta(days=days)).isoformat()
+    # the certificates don't enter the scores, so these trains keep their assignments
+    records[service[0]]["rs_cert_expiry"] = shifted(-5)
+    records[standby[0]]["telecom_cert_expiry"] = shifted(-1)
+    records[service[1]]["sig_cert_expiry"] = day  # valid through the day it expires
+    records[standby[1]]["sig_cert_expiry"] = shifted(3)
+    records[0]["sig_cert_expiry"] = "2025-13-40"
+    records[1]["telecom_cert_expiry"] = ""
+    write_data("full_train_data.json", fleet)
+
+    def valid(value):
+        try:
+            return datetime.date.fromisoformat(value)
+        except (TypeError, ValueError):
+            return None
+    entries = sorted((valid(r.get(cert)), cert, i) for i, r in enumerate(records) for cert in CERTIFICATES
+                     if valid(r.get(cert)))
+    for query, lo, hi, types in (("within_days=0", 0, 0, None),
+                                 ("within_days=30", 0, 30, None),
+                                 ("within_days=400&include_expired=1", None, 400, None),
+                                 ("within_days=30&include_expired=1&type=rs_cert_expiry,telecom_cert_expiry",
+                                  None, 30, ("rs_cert_expiry", "telecom_cert_expiry"))):
+        expected = [{"train_id": records[i]["train_id"], "certificate": cert, "expiry": expiry.isoformat(),
+                     "days_left": (expiry - ref).days} for expiry, cert, i in entries
+                    if (lo is None or (expiry - ref).days >= lo) and (expiry - ref).days <= hi
+                    and (types is None or cert in types)]
+        response = client.get(f"/api/certificates/expiring?date={day}&{query}")
+        if response.status_code != 200 or response.json != expected:
+            print(f"certificates: ?{query} differs from the expiries in the fleet file")
+            return False
+        paged = client.get(f"/api/certificates/expiring?date={day}&{query}&offset=1&limit=2")
+        if paged.json != expected[1:3] or paged.headers.get("X-Total-Count") != str(len(expected)):
+            print(f"certificates: ?{query} paged with offset=1&limit=2 differs")
+            return False
+    for query in ("within_days=-1", "within_days=soon", "date=2025-02-30", "type=pan_cert_expiry", "limit=-1"):
+        if client.get(f"/api/certificates/expiring?{query}").status_code != 400:
+            print(f"certificates: ?{query} did not get a 400")
+            return False
+
+    expired = {}
+    for expiry, cert, i in entries:
+        if expiry < ref:
+            expired.setdefault(records[i]["train_id"], []).append((cert, expiry.isoformat()))
+    plans = {}
+    for mode in ("off", "flag", "exclude"):
+        plans[mode] = client.post("/api/optimize_date", json={"date": day, "weights": WEIGHTS, "certificates": mode}).json
+    flagged = sorted((c["train_id"], c["certificate"], c["expiry"]) for c in plans["flag"]["conflicts"] if "certificate" in c)
+    serving = [p for p in plans["flag"]["plan"] if p["assignment"] in ("Service", "Standby")]
+    if flagged != sorted((p["train_id"], cert, expiry) for p in serving for cert, expiry in expired.get(p["train_id"], ())) \
+            or any("certificate" in c for c in plans["off"]["conflicts"]) \
+            or not {records[i]["train_id"] for i in (service[0], standby[0])} <= {t for t, _, _ in flagged}:
+        print(f"certificates: certificates=flag reported {flagged}, not every serving train with an expired certificate")
+        return False
+    for p in plans["exclude"]["plan"]:
+        if p["train_id"] in expired:
+            notes = [r["note"] for r in p["reasons"] if "note" in r]
+            forced = [f"Forced IBL: {cert} expired on {expiry}" for cert, expiry in expired[p["train_id"]]]
+            if p["assignment"] != "IBL" or not (notes[-len(forced):] == forced or "Forced IBL due to maintenance status" in notes):
+                print(f"certificates: certificates=exclude left {p['train_id']} in {p['assignment']} with notes {notes}")
+                return False
+    if client.post("/api/optimize_date", json={"date": day, "certificates": "strict"}).status_code != 400:
+        print("certificates: an unknown certificates mode did not get a 400")
+        return False
+    print("certificates: ok")
+    return True
+
+CHECKS = {
+    "reload": check_reload, "scoring": check_scoring, "conflicts": check_conflicts, "audit": check_audit,
+    "batch": check_batch, "sqlite": check_sqlite, "importer": check_importer, "cache": check_cache,
+    "incremental": check_incremental, "benchmark": check_benchmark,
+    "generator": check_generator, "columnar": check_columnar,
+    "records": check_records, "detail": check_detail,
+    "listing": check_listing, "etag": check_etag, "maintenance": check_maintenance,
+    "solver": check_solver, "horizon": check_horizon,
+    "sweep": check_sweep, "metrics": check_metrics,
+    "asgi": check_asgi,
+    "events": check_events,
+    "snapshot": check_snapshot,
+    "timeline": check_timeline,
+    "certificates": check_certificates
+}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Checks of the MetroPal API's observable behaviour")
+    parser.add_argument("checks", nargs="*", help=f"checks to run: {', '.join(sorted(CHECKS))} (default: all)")
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.checks if name not in CHECKS]
+    if unknown:
+        parser.error(f"unknown checks: {', '.join(unknown)}")
+    ok = True
+    for name in args.checks or sorted(CHECKS):
+        with sandbox():
+            ok = CHECKS[name](app.test_client()) and ok
+    return 0 if ok else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,29 +1,190 @@
-from flask import Flask, jsonify, request
+from flask import Flask, jsonify, request, Response, stream_with_context, g
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
-import os, json, datetime
-from data_loader import load_trains, load_maintenance_logs, load_daily_requirements, load_full_train_data
-from optimizer import optimize
+import os, json, datetime, hashlib, time, io, queue, threading
+from itertools import islice
+from urllib.parse import urlencode
+import audit as audit_log
+import metrics
+import events
+from data_loader import load_trains, load_maintenance_logs, load_maintenance_history, load_daily_requirements, load_full_train_data, load_train_data_range, load_train_timeline, load_certificate_index, DATA_BACKEND
+import data_loader
+from result_cache import cached_optimize
+import result_cache
+from batch import iter_batch, run_batch, check_options as check_batch_options
+from incremental import apply_updates, UpdateError
+from horizon import plan_horizon, MAX_HORIZON_DAYS, DAILY_KM
+from sweep import sweep, weight_grid, weight_samples, MAX_WEIGHT_SETS
+from conflicts import rule_stats
+from records import TrainRecord, FIELDS as TRAIN_FIELDS
+from certificates import CERTIFICATES, GATING_MODES
+from listing import ListArgsError, split_values, filter_rows, filter_date_range, sort_rows, check_date, date_args, page_args, paginate
 
-BASE_DIR = os.path.dirname(os.path.dirname(__file__))
-AUDIT_FILE = os.path.join(BASE_DIR, "backend_audit.json")
+class JSONProvider(DefaultJSONProvider):
+    """Serializes TrainRecords like the dicts they were loaded from"""
+
+    @staticmethod
+    def default(o):
+        if isinstance(o, TrainRecord):
+            return o.to_dict()
+        return DefaultJSONProvider.default(o)
 
 app = Flask(__name__)
-CORS(app)
+app.json = JSONProvider(app)
+CORS(app, expose_headers=["ETag", "Last-Modified", "X-Total-Count", "Link"])
 
 @app.route("/api/trains", methods=["GET"])
 def api_trains():
     return jsonify(load_trains())
 
+# list endpoint query parameter -> record field
+TRAIN_FILTERS = {
+    "train_id": "train_id", "status": "job_card_status", "action": "recommended_action",
+    "maintenance_type": "maintenance_type", "bay": "stabling_bay_id"
+}
+MAINTENANCE_FILTERS = {"train_id": "train_id", "type": "type_of_maintenance"}
+MAINTENANCE_FIELDS = ("log_id", "train_id", "maintenance_date", "type_of_maintenance", "km_at_maintenance")
+
 @app.route("/api/full_trains", methods=["GET"])
 def api_full_trains():
     # optional date parameter ?date=YYYY-MM-DD
-    date = request.args.get("date")
-    data = load_full_train_data(date)
-    return jsonify(data)
+    # or a range ?from=YYYY-MM-DD&to=YYYY-MM-DD returning {date: [trains]}
+    # filters: ?train_id=&status=&action=&maintenance_type=&bay= (comma separated values)
+    # ?sort=field,-field and ?offset=&limit= (over trains, or over dates for a range)
+    version, modified = data_loader.source_version()
+    etag = _list_etag(version)
+    if _not_modified(etag, modified):
+        return _with_validators(Response(status=304), etag, modified)
+    
+    try:
+        offset, limit = page_args(request.args)
+        sort = request.args.get("sort")
+        filters = {field: split_values(request.args.get(arg)) for arg, field in TRAIN_FILTERS.items()}
+        
+        start, end, date = date_args(request.args, "from", "to", "date")
+        if start or end:
+            by_date = load_train_data_range(start, end)
+            dates, total = paginate(list(by_date), offset, limit)
+            data = {d: sort_rows(filter_rows(by_date[d], filters), sort, TRAIN_FIELDS) for d in dates}
+        else:
+            trains = sort_rows(filter_rows(load_full_train_data(date), filters), sort, TRAIN_FIELDS)
+            data, total = paginate(trains, offset, limit)
+    except ListArgsError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    return _list_response(data, etag, modified, total, offset, limit)
 
 @app.route("/api/maintenance", methods=["GET"])
 def api_maintenance():
-    return jsonify(load_maintenance_logs())
+    # filters: ?train_id=&type= (comma separated values), ?from=&to= on maintenance_date
+    # ?sort=field,-field and ?offset=&limit=
+    version, modified = data_loader.source_version("maintenance_log.json")
+    etag = _list_etag(version)
+    if _not_modified(etag, modified):
+        return _with_validators(Response(status=304), etag, modified)
+    
+    try:
+        offset, limit = page_args(request.args)
+        filters = {field: split_values(request.args.get(arg)) for arg, field in MAINTENANCE_FILTERS.items()}
+        logs = filter_rows(load_maintenance_logs(), filters)
+        logs = filter_date_range(logs, "maintenance_date", *date_args(request.args, "from", "to"))
+        logs = sort_rows(logs, request.args.get("sort"), MAINTENANCE_FIELDS)
+        data, total = paginate(logs, offset, limit)
+    except ListArgsError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    return _list_response(data, etag, modified, total, offset, limit)
+
+@app.route("/api/maintenance/<train_id>", methods=["GET"])
+def api_train_maintenance(train_id):
+    """One train's maintenance history, oldest first, optionally within ?from=&to="""
+    version, modified = data_loader.source_version("maintenance_log.json")
+    etag = _list_etag(version)
+    if _not_modified(etag, modified):
+        return _with_validators(Response(status=304), etag, modified)
+    
+    try:
+        offset, limit = page_args(request.args)
+        start, end = date_args(request.args, "from", "to")
+    except ListArgsError as e:
+        return jsonify({"error": str(e)}), 400
+    history = load_maintenance_history(train_id, start, end)
+    if history is None:
+        return jsonify({"error": f"No maintenance history for train {train_id}"}), 404
+    data, total = paginate(history, offset, limit)
+    return _list_response(data, etag, modified, total, offset, limit)
+
+@app.route("/api/trains/<train_id>/timeline", methods=["GET"])
+def api_train_timeline(train_id):
+    """One train's fitness, mileage, action and status per date, oldest first,
+       optionally within ?from=&to=; ?fields=a,b picks the series returned"""
+    version, modified = data_loader.source_version()
+    etag = _list_etag(version)
+    if _not_modified(etag, modified):
+        return _with_validators(Response(status=304), etag, modified)
+    
+    fields = request.args.get("fields")
+    fields = [f.strip() for f in fields.split(",") if f.strip()] if fields else data_loader.TIMELINE_FIELDS
+    unknown = [f for f in fields if f not in TRAIN_FIELDS or f == "train_id"]
+    if unknown:
+        return jsonify({"error": f"Unknown fields: {', '.join(unknown)}"}), 400
+    
+    try:
+        start, end = date_args(request.args, "from", "to")
+    except ListArgsError as e:
+        return jsonify({"error": str(e)}), 400
+    timeline = load_train_timeline(train_id, start, end, fields)
+    if timeline is None:
+        return jsonify({"error": f"No records for train {train_id}"}), 404
+    dates, series = timeline
+    return _with_validators(jsonify({
+        "train_id": train_id,
+        "from": start,
+        "to": end,
+        "dates": dates,
+        "series": series
+    }), etag, modified)
+
+@app.route("/api/certificates/expiring", methods=["GET"])
+def api_certificates_expiring():
+    """Certificates lapsing within ?within_days= (default 30) of ?date= (default today), soonest
+       first. ?type=rs_cert_expiry,... picks certificate types; ?include_expired=1 adds ones
+       already expired. Paged with ?offset=&limit=."""
+    version, modified = data_loader.source_version()
+    etag = _list_etag(version)
+    if _not_modified(etag, modified):
+        return _with_validators(Response(status=304), etag, modified)
+    
+    try:
+        offset, limit = page_args(request.args)
+        within_days = int(request.args.get("within_days", 30))
+        day = request.args.get("date")
+        ref = datetime.date.fromisoformat(day) if day else datetime.date.today()
+    except ListArgsError as e:
+        return jsonify({"error": str(e)}), 400
+    except ValueError:
+        return jsonify({"error": "within_days must be an integer and date YYYY-MM-DD"}), 400
+    if within_days < 0:
+        return jsonify({"error": "within_days must not be negative"}), 400
+    types = split_values(request.args.get("type")) or CERTIFICATES
+    unknown = [t for t in types if t not in CERTIFICATES]
+    if unknown:
+        return jsonify({"error": f"Unknown certificate types: {', '.join(sorted(unknown))}"}), 400
+    
+    include_expired = request.args.get("include_expired", "").lower() in ("1", "true", "yes")
+    start = None if include_expired else ref.isoformat()
+    end = (ref + datetime.timedelta(days=within_days)).isoformat()
+    index = load_certificate_index(day)
+    data, total = paginate([
+        {
+            "train_id": index.records[i]["train_id"],
+            "certificate": cert,
+            "expiry": expiry,
+            "days_left": (datetime.date.fromisoformat(expiry) - ref).days  # indexed expiries are valid dates
+        }
+        for expiry, cert, i in index.expiring(start, end, [c for c in CERTIFICATES if c in types])
+    ], offset, limit)
+    return _list_response(data, etag, modified, total, offset, limit)
 
 @app.route("/api/daily_requirements", methods=["GET"])
 def api_daily_requirements():
@@ -37,7 +198,17 @@ def api_optimize():
         "punctuality": 80, "maintenance": 60, "cleaning": 50, "branding": 80, "mileage": 50
     })
     
-    result = optimize(weights)
+    options = _response_options(payload)
+    if options is None:
+        return jsonify({"error": f"detail must be one of {', '.join(DETAIL_LEVELS)}"}), 400
+    detail, fields, explain = options
+    try:
+        solver = _solver_options(payload)
+        certificates = _certificate_mode(payload)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    result = cached_optimize(weights, explain=explain, solver=solver, certificates=certificates)
     
     # Enhanced audit logging
     audit = {
@@ -50,12 +221,12 @@ def api_optimize():
             "total_trains": result.get("summary", {}).get("total_trains", 0),
             "conflicts_found": result.get("summary", {}).get("conflicts_found", 0)
         },
-        "plan": result.get("plan", []),
+        "plan": _audit_plan(result),
         "conflicts": result.get("conflicts", [])
     }
     
     _save_audit(audit)
-    return jsonify(result)
+    return jsonify(_shape_result(result, detail, fields))
 
 @app.route("/api/optimize_date", methods=["POST"])
 def api_optimize_date():
@@ -72,7 +243,21 @@ def api_optimize_date():
     
     requirements = payload.get("requirements", {"service": 15, "standby": 5})
     
-    result = optimize(weights, date_str=date_str, requirements=requirements)
+    options = _response_options(payload)
+    if options is None:
+        return jsonify({"error": f"detail must be one of {', '.join(DETAIL_LEVELS)}"}), 400
+    detail, fields, explain = options
+    try:
+        check_date("date", date_str)
+        solver = _solver_options(payload)
+        certificates = _certificate_mode(payload)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    result = cached_optimize(
+        weights, date_str=date_str, requirements=requirements, explain=explain, solver=solver,
+        certificates=certificates
+    )
     
     # Enhanced audit logging for date-specific optimization
     audit = {
@@ -87,12 +272,12 @@ def api_optimize_date():
             "total_trains": result.get("summary", {}).get("total_trains", 0),
             "conflicts_found": result.get("summary", {}).get("conflicts_found", 0)
         },
-        "plan": result.get("plan", []),
+        "plan": _audit_plan(result),
         "conflicts": result.get("conflicts", [])
     }
     
     _save_audit(audit)
-    return jsonify(result)
+    return jsonify(_shape_result(result, detail, fields))
 
 @app.route("/api/optimize_batch", methods=["POST"])
 def api_optimize_batch():
@@ -109,74 +294,274 @@ def api_optimize_batch():
     
     requirements = payload.get("requirements", {"service": 15, "standby": 5})
     
-    results = {}
-    for date_str in dates:
-        try:
-            result = optimize(weights, date_str=date_str, requirements=requirements)
-            results[date_str] = result
-        except Exception as e:
-            results[date_str] = {"error": str(e)}
+    # Optional pool overrides; ?stream=1 (or "stream": true) returns NDJSON lines as dates finish
+    executor = payload.get("executor")
+    workers = payload.get("workers")
+    stream = payload.get("stream") or request.args.get("stream") in ("1", "true")
+    options = _response_options(payload)
+    if options is None:
+        return jsonify({"error": f"detail must be one of {', '.join(DETAIL_LEVELS)}"}), 400
+    detail, fields, explain = options
+    try:
+        for d in dates:
+            check_date("dates", d)
+        check_batch_options(executor, workers)
+        solver = _solver_options(payload)
+        certificates = _certificate_mode(payload)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     
-    # Audit batch optimization
-    audit = {
+    def batch_audit(results):
+        # Audit batch optimization
+        return {
+            "timestamp": datetime.datetime.utcnow().isoformat() + "Z",
+            "optimization_type": "batch",
+            "dates": dates,
+            "weights": weights,
+            "requirements": requirements,
+            "results_summary": {
+                "total_dates": len(dates),
+                "successful": len([r for r in results.values() if "error" not in r]),
+                "failed": len([r for r in results.values() if "error" in r])
+            }
+        }
+    
+    if stream:
+        def generate():
+            results = {}
+            for date_str, result in iter_batch(
+                dates, weights, requirements, executor, workers, explain, solver, certificates
+            ):
+                results[date_str] = result
+                yield json.dumps({"date": date_str, "result": _shape_result(result, detail, fields)}) + "\n"
+            _save_audit(batch_audit(results))
+        return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+    
+    results = run_batch(dates, weights, requirements, executor, workers, explain, solver, certificates)
+    _save_audit(batch_audit(results))
+    return jsonify({d: _shape_result(r, detail, fields) for d, r in results.items()})
+
+@app.route("/api/optimize_incremental", methods=["POST"])
+def api_optimize_incremental():
+    """Apply live status changes for one or more trains to a maintained plan"""
+    payload = request.get_json() or {}
+    
+    updates = payload.get("updates", [])
+    if not updates or not all(isinstance(u, dict) and u.get("train_id") for u in updates):
+        return jsonify({"error": "Updates array of {train_id, ...fields} is required"}), 400
+    
+    weights = payload.get("weights", {
+        "punctuality": 80, "maintenance": 60, "cleaning": 50, "branding": 80, "mileage": 50
+    })
+    date_str = payload.get("date")
+    requirements = payload.get("requirements", {"service": 15, "standby": 5}) if date_str else None
+    
+    try:
+        check_date("date", date_str)
+        return jsonify(apply_updates(weights, updates, date_str=date_str, requirements=requirements))
+    except (ListArgsError, UpdateError) as e:
+        return jsonify({"error": str(e)}), 400
+
+@app.route("/api/optimize_horizon", methods=["POST"])
+def api_optimize_horizon():
+    """Plan consecutive days, carrying mileage, cleaning and maintenance state from one day to the next"""
+    payload = request.get_json() or {}
+    
+    start_date = payload.get("start_date") or payload.get("date")
+    days = payload.get("days", 7)
+    if not isinstance(days, int) or not 1 <= days <= MAX_HORIZON_DAYS:
+        return jsonify({"error": f"days must be between 1 and {MAX_HORIZON_DAYS}"}), 400
+    try:
+        if start_date:
+            datetime.date.fromisoformat(start_date)
+        daily_km = float(payload.get("daily_km", DAILY_KM))
+    except (TypeError, ValueError):
+        return jsonify({"error": "start_date must be YYYY-MM-DD and daily_km a number"}), 400
+    
+    weights = payload.get("weights", {
+        "punctuality": 80, "maintenance": 60, "cleaning": 50, "branding": 80, "mileage": 50
+    })
+    
+    # Without requirements each day uses its row in daily_requirements.json
+    requirements = payload.get("requirements")
+    
+    options = _response_options(payload)
+    if options is None:
+        return jsonify({"error": f"detail must be one of {', '.join(DETAIL_LEVELS)}"}), 400
+    detail, fields, explain = options
+    
+    result = plan_horizon(weights, start_date, days, requirements, daily_km, explain)
+    if "error" in result:
+        return jsonify(result), 404
+    
+    _save_audit({
         "timestamp": datetime.datetime.utcnow().isoformat() + "Z",
-        "optimization_type": "batch",
-        "dates": dates,
+        "optimization_type": "horizon",
+        "date": result["start_date"],
+        "days": days,
         "weights": weights,
         "requirements": requirements,
-        "results_summary": {
-            "total_dates": len(dates),
-            "successful": len([r for r in results.values() if "error" not in r]),
-            "failed": len([r for r in results.values() if "error" in r])
-        }
-    }
+        "results_summary": [{
+            "date": day["date"],
+            "conflicts_found": day["summary"]["conflicts_found"],
+            "assignments_changed": len(day["changed"])
+        } for day in result["days"]]
+    })
+    result["days"] = [_shape_result(day, detail, fields) for day in result["days"]]
+    return jsonify(result)
+
+@app.route("/api/optimize_sweep", methods=["POST"])
+def api_optimize_sweep():
+    """Evaluate many weight sets against one date in a single batched scoring pass"""
+    payload = request.get_json() or {}
     
-    _save_audit(audit)
-    return jsonify(results)
+    weights = payload.get("weights", {
+        "punctuality": 80, "maintenance": 60, "cleaning": 50, "branding": 80, "mileage": 50
+    })
+    date_str = payload.get("date")
+    requirements = payload.get("requirements", {"service": 15, "standby": 5}) if date_str else None
+    
+    # Weight sets: an explicit list, a grid {key: [values]} or random samples over {key: [low, high]};
+    # keys that aren't varied keep the base weights. Changes are reported against the base weights.
+    try:
+        check_date("date", date_str)
+        if payload.get("weight_sets") is not None:
+            weight_sets = [dict(weights, **w) for w in payload["weight_sets"]]
+        elif payload.get("grid"):
+            grid = payload["grid"]
+            size = 1
+            for values in grid.values():
+                size *= len(values)
+            if size > MAX_WEIGHT_SETS:
+                raise ValueError(f"grid has {size} weight sets, at most {MAX_WEIGHT_SETS} are allowed")
+            weight_sets = weight_grid(weights, grid)
+        elif payload.get("samples"):
+            samples = int(payload["samples"])
+            if samples > MAX_WEIGHT_SETS:
+                raise ValueError(f"At most {MAX_WEIGHT_SETS} samples are allowed")
+            ranges = payload.get("ranges") or {k: [0, 100] for k in weights}
+            weight_sets = weight_samples(weights, ranges, samples, payload.get("seed"))
+        else:
+            raise ValueError("One of weight_sets, grid or samples is required")
+        if not weight_sets or len(weight_sets) > MAX_WEIGHT_SETS:
+            raise ValueError(f"Between 1 and {MAX_WEIGHT_SETS} weight sets are allowed")
+        for w in weight_sets + [weights]:
+            if not all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in w.values()):
+                raise ValueError("Weights must be numbers")
+    except (TypeError, ValueError, AttributeError) as e:
+        return jsonify({"error": str(e)}), 400
+    
+    result = sweep(weight_sets, date_str, requirements, baseline=weights,
+                   include_assignments=bool(payload.get("include_assignments")))
+    if "error" in result:
+        return jsonify(result), 404
+    
+    if (request.args.get("detail") or payload.get("detail")) == "summary":
+        for r in result["results"]:
+            r.pop("changed_trains", None)
+    
+    _save_audit({
+        "timestamp": datetime.datetime.utcnow().isoformat() + "Z",
+        "optimization_type": "sweep",
+        "date": result["date"],
+        "weights": weights,
+        "requirements": requirements,
+        "results_summary": {"weight_sets": len(weight_sets)}
+    })
+    return jsonify(result)
 
 @app.route("/api/conflicts", methods=["GET"])
 def api_conflicts():
     """Get recent conflicts from audit log"""
     try:
-        if os.path.exists(AUDIT_FILE):
-            with open(AUDIT_FILE, "r", encoding="utf-8") as f:
-                audits = json.load(f)
-            
-            # Extract conflicts from recent optimizations
-            recent_conflicts = []
-            for audit in audits[:10]:  # Last 10 optimizations
-                if audit.get("conflicts"):
-                    recent_conflicts.append({
-                        "timestamp": audit.get("timestamp"),
-                        "date": audit.get("date"),
-                        "conflicts": audit.get("conflicts")
-                    })
-            
-            return jsonify(recent_conflicts)
-        return jsonify([])
+        # Extract conflicts from recent optimizations
+        recent_conflicts = []
+        for audit in islice(audit_log.iter_recent(), 10):  # Last 10 optimizations
+            if audit.get("conflicts"):
+                recent_conflicts.append({
+                    "timestamp": audit.get("timestamp"),
+                    "date": audit.get("date"),
+                    "conflicts": audit.get("conflicts")
+                })
+        
+        return jsonify(recent_conflicts)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route("/api/conflict_rules", methods=["GET"])
+def api_conflict_rules():
+    """Get per-rule evaluation counts and timings of the conflict checks"""
+    return jsonify(rule_stats())
+
+@app.route("/api/cache", methods=["GET"])
+def api_cache_stats():
+    """Get optimization result cache hit/miss metrics"""
+    return jsonify(result_cache.stats())
+
+@app.route("/api/cache/invalidate", methods=["POST"])
+def api_cache_invalidate():
+    """Drop cached data files and optimization results after a data change"""
+    data_loader.invalidate()
+    result_cache.invalidate()
+    version = data_loader.data_version()
+    events.publish("data_version", {"data_version": version})
+    return jsonify({"status": "ok", "data_version": version})
+
+@app.route("/api/stream", methods=["GET"])
+def api_stream():
+    """Server-sent events: optimization, conflicts and data_version as they happen.
+       Reconnecting clients get what they missed via Last-Event-ID.
+       Served from here, each open stream holds a worker thread for as long as the client
+       stays connected; in deployment serve it through asgi.py, which holds none."""
+    last_id = events.parse_last_event_id(
+        request.headers.get("Last-Event-ID") or request.args.get("last_event_id")
+    )
+    frames = queue.Queue(events.QUEUE_SIZE)
+    lagged = threading.Event()
+    
+    def deliver(frame):
+        try:
+            frames.put_nowait(frame)
+        except queue.Full:
+            # too slow: end the stream, the client reconnects and replays from its last id
+            lagged.set()
+            events.bus.unsubscribe(deliver)
+    
+    first = events.bus.subscribe(deliver, last_id)
+    
+    def generate():
+        try:
+            yield b"retry: 3000\n\n"
+            yield from first
+            while not lagged.is_set():
+                try:
+                    yield frames.get(timeout=events.HEARTBEAT_SECONDS)
+                except queue.Empty:
+                    yield events.HEARTBEAT
+        finally:
+            events.bus.unsubscribe(deliver)
+    
+    response = Response(generate(), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
 @app.route("/api/audit", methods=["GET"])
 def api_audit():
     """Get audit log with optional filtering"""
     try:
-        if os.path.exists(AUDIT_FILE):
-            with open(AUDIT_FILE, "r", encoding="utf-8") as f:
-                audits = json.load(f)
-            
-            # Optional filtering
-            limit = request.args.get("limit", type=int)
-            optimization_type = request.args.get("type")
-            
-            if optimization_type:
-                audits = [a for a in audits if a.get("optimization_type") == optimization_type]
-            
-            if limit:
-                audits = audits[:limit]
-            
-            return jsonify(audits)
-        return jsonify([])
+        # Optional filtering
+        limit = request.args.get("limit", type=int)
+        optimization_type = request.args.get("type")
+        
+        audits = islice(audit_log.iter_recent(), audit_log.RECENT_WINDOW)
+        if optimization_type:
+            audits = (a for a in audits if a.get("optimization_type") == optimization_type)
+        
+        if limit:
+            audits = islice(audits, limit)
+        
+        return jsonify(list(audits))
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -184,58 +569,254 @@ def api_audit():
 def api_stats():
     """Get optimization statistics"""
     try:
-        if os.path.exists(AUDIT_FILE):
-            with open(AUDIT_FILE, "r", encoding="utf-8") as f:
-                audits = json.load(f)
-            
-            total_optimizations = len(audits)
-            current_date_opts = len([a for a in audits if a.get("optimization_type") == "current_date"])
-            date_specific_opts = len([a for a in audits if a.get("optimization_type") == "date_specific"])
-            batch_opts = len([a for a in audits if a.get("optimization_type") == "batch"])
-            
-            total_conflicts = sum(len(a.get("conflicts", [])) for a in audits)
-            avg_conflicts = total_conflicts / max(1, total_optimizations)
-            
-            return jsonify({
-                "total_optimizations": total_optimizations,
-                "optimization_types": {
-                    "current_date": current_date_opts,
-                    "date_specific": date_specific_opts,
-                    "batch": batch_opts
-                },
-                "total_conflicts": total_conflicts,
-                "avg_conflicts_per_optimization": round(avg_conflicts, 2),
-                "last_optimization": audits[0].get("timestamp") if audits else None
-            })
+        total_optimizations = 0
+        type_counts = {"current_date": 0, "date_specific": 0, "batch": 0, "horizon": 0, "sweep": 0}
+        total_conflicts = 0
+        last_optimization = None
+        
+        for a in islice(audit_log.iter_recent(), audit_log.RECENT_WINDOW):
+            if total_optimizations == 0:
+                last_optimization = a.get("timestamp")
+            total_optimizations += 1
+            if a.get("optimization_type") in type_counts:
+                type_counts[a.get("optimization_type")] += 1
+            total_conflicts += len(a.get("conflicts", []))
+        
+        avg_conflicts = total_conflicts / max(1, total_optimizations)
+        
         return jsonify({
-            "total_optimizations": 0,
-            "optimization_types": {"current_date": 0, "date_specific": 0, "batch": 0},
-            "total_conflicts": 0,
-            "avg_conflicts_per_optimization": 0,
-            "last_optimization": None
+            "total_optimizations": total_optimizations,
+            "optimization_types": type_counts,
+            "total_conflicts": total_conflicts,
+            "avg_conflicts_per_optimization": round(avg_conflicts, 2),
+            "last_optimization": last_optimization
         })
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+def _list_etag(version):
+    """Strong validator for a list response: the source data version plus the query.
+       Today's date is included since the default date of /api/full_trains follows it."""
+    query = urlencode(sorted(request.args.items(multi=True)))
+    key = f"{version}|{datetime.date.today().isoformat()}|{request.path}?{query}"
+    return hashlib.sha1(key.encode()).hexdigest()[:20]
+
+def _not_modified(etag, modified):
+    """Whether the client's cached copy (If-None-Match / If-Modified-Since) is still current"""
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    if request.if_modified_since and modified:
+        return modified <= request.if_modified_since
+    return False
+
+def _with_validators(response, etag, modified):
+    response.set_etag(etag)
+    if modified:
+        response.last_modified = modified
+    response.headers["Cache-Control"] = "no-cache"  # cache, but revalidate every time
+    return response
+
+def _list_response(data, etag, modified, total, offset, limit):
+    """JSON list (or {date: list}) with validators, X-Total-Count and Link paging headers"""
+    response = _with_validators(jsonify(data), etag, modified)
+    response.headers["X-Total-Count"] = str(total)
+    if limit is not None:
+        links = []
+        if offset + limit < total:
+            links.append(f'<{_page_url(offset + limit)}>; rel="next"')
+        if offset > 0:
+            links.append(f'<{_page_url(max(0, offset - limit))}>; rel="prev"')
+        if links:
+            response.headers["Link"] = ", ".join(links)
+    return response
+
+def _page_url(offset):
+    args = request.args.copy()
+    args["offset"] = str(offset)
+    return f"{request.base_url}?{urlencode(list(args.items(multi=True)))}"
+
+DETAIL_LEVELS = ("summary", "assignments", "full")
+ASSIGNMENT_FIELDS = ("train_id", "assignment", "score")
+
+def _response_options(payload):
+    """(detail, fields, explain) from ?detail=&fields= or the request body, None if detail is unknown.
+       detail: "summary" (no plan or conflicts), "assignments" (plan without reasons) or "full".
+       fields: plan entry keys to keep, e.g. ?fields=train_id,assignment.
+       Reasons are only computed when the response will include them."""
+    detail = request.args.get("detail") or payload.get("detail")
+    if detail is None:
+        # older clients send "explain": false for plans without reasons
+        detail = "full" if payload.get("explain", True) is not False else "assignments"
+    if detail not in DETAIL_LEVELS:
+        return None
+    fields = request.args.get("fields") or payload.get("fields")
+    if isinstance(fields, str):
+        fields = [f.strip() for f in fields.split(",") if f.strip()]
+    explain = detail == "full" and (not fields or "reasons" in fields)
+    return detail, fields or None, explain
+
+def _solver_options(payload):
+    """Options for the exact solver when the request asks for it with "mode": "solver" (or ?mode=solver)
+       and/or "solver": {"time_budget": s, "capacities": {"IBL": n, ...}, "backend": "flow"|"pulp"}.
+       None keeps the greedy ranking."""
+    options = payload.get("solver")
+    mode = request.args.get("mode") or payload.get("mode") or ("solver" if options is not None else "greedy")
+    if mode not in ("greedy", "solver"):
+        raise ValueError("mode must be greedy or solver")
+    if mode == "greedy":
+        return None
+    options = options or {}
+    if not isinstance(options, dict) or not isinstance(options.get("capacities", {}), dict):
+        raise ValueError("solver must be an object like {\"time_budget\": 1, \"capacities\": {\"IBL\": 10}}")
+    try:
+        float(options.get("time_budget", 0))
+        for value in options.get("capacities", {}).values():
+            int(value)
+    except (TypeError, ValueError):
+        raise ValueError("solver time_budget and capacities must be numbers")
+    return options
+
+def _certificate_mode(payload):
+    """Certificate gating from ?certificates= or the body: "off", "flag" or "exclude".
+       None leaves it to METROPAL_CERT_GATING."""
+    mode = request.args.get("certificates") or payload.get("certificates")
+    if mode is not None and mode not in GATING_MODES:
+        raise ValueError(f"certificates must be one of {', '.join(GATING_MODES)}")
+    return mode
+
+def _shape_result(result, detail, fields=None):
+    """Copy of an optimize result cut down to the requested detail level and plan fields.
+       Results may be shared with the cache, so they are never modified in place."""
+    if "error" in result or (detail == "full" and not fields):
+        return result
+    shaped = {k: v for k, v in result.items() if k != "plan"}
+    if detail == "summary":
+        shaped.pop("conflicts", None)
+        return shaped
+    keep = fields or (ASSIGNMENT_FIELDS if detail == "assignments" else None)
+    shaped["plan"] = [
+        {k: p[k] for k in keep if k in p} if keep else p for p in result.get("plan", [])
+    ]
+    return shaped
+
+def _audit_plan(result):
+    """Plan entries as stored in the audit log: assignments only, no reasons"""
+    return [{k: p[k] for k in ASSIGNMENT_FIELDS if k in p} for p in result.get("plan", [])]
+
 def _save_audit(audit):
     """Helper function to save audit entries"""
     try:
-        if os.path.exists(AUDIT_FILE):
-            with open(AUDIT_FILE, "r", encoding="utf-8") as f:
-                arr = json.load(f)
-        else:
-            arr = []
-        
-        arr.insert(0, audit)
-        
-        # Keep only last 1000 entries to prevent file from growing too large
-        if len(arr) > 1000:
-            arr = arr[:1000]
-        
-        with open(AUDIT_FILE, "w", encoding="utf-8") as f:
-            json.dump(arr, f, indent=2)
-    except Exception as e:
-        print("Audit write error:", e)
+        with metrics.phase("audit_write"):
+            audit_log.append(audit)
+    except Exception:
+        app.logger.exception("Audit write failed")
+    _publish_audit(audit)
+
+def _publish_audit(audit):
+    """Pushes an optimization (and its conflicts, if any) to /api/stream listeners"""
+    summary_key = "result_summary" if "result_summary" in audit else "results_summary"
+    events.publish("optimization", {
+        "timestamp": audit.get("timestamp"),
+        "optimization_type": audit.get("optimization_type"),
+        "date": audit.get("date"),
+        "summary": audit.get(summary_key)
+    })
+    if audit.get("conflicts"):
+        # same shape as the /api/conflicts entries
+        events.publish("conflicts", {
+            "timestamp": audit.get("timestamp"),
+            "date": audit.get("date"),
+            "conflicts": audit.get("conflicts")
+        })
+
+# --- Metrics and profiling ---
+
+# METROPAL_PROFILING=1 lets a request ask for a profile (X-Profile header or ?profile=1);
+# the response body is then the profile report instead of the endpoint's output
+PROFILING = os.environ.get("METROPAL_PROFILING", "").lower() in ("1", "true", "yes")
+PROFILE_LINES = 40
+
+@metrics.register_collector
+def _cache_metrics():
+    s = result_cache.stats()
+    return [
+        ("metropal_result_cache_hits_total", "counter", "Optimize results served from the cache", [({}, s["hits"])]),
+        ("metropal_result_cache_misses_total", "counter", "Optimize results computed", [({}, s["misses"])]),
+        ("metropal_result_cache_size", "gauge", "Optimize results held in the cache", [({}, s["size"])])
+    ]
+
+@metrics.register_collector
+def _rule_metrics():
+    stats = rule_stats()
+    return [
+        ("metropal_conflict_rule_seconds_total", "counter", "Time spent evaluating each conflict rule",
+         [({"rule": name}, s["seconds"]) for name, s in sorted(stats.items())]),
+        ("metropal_conflict_rule_evaluations_total", "counter", "Times each conflict rule was evaluated",
+         [({"rule": name}, s["evaluations"]) for name, s in sorted(stats.items())])
+    ]
+
+def _profile_mode():
+    """None, "cprofile" or "pyinstrument" for the current request"""
+    if not PROFILING:
+        return None
+    value = request.headers.get("X-Profile") or request.args.get("profile")
+    if not value or value.lower() in ("0", "false", "no"):
+        return None
+    return "pyinstrument" if value.lower() == "pyinstrument" else "cprofile"
+
+def _start_profiler(mode):
+    if mode == "pyinstrument":
+        try:
+            from pyinstrument import Profiler
+            profiler = Profiler()
+            profiler.start()
+            return mode, profiler
+        except ImportError:
+            pass
+    import cProfile
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return "cprofile", profiler
+
+def _profile_report(mode, profiler):
+    if mode == "pyinstrument":
+        profiler.stop()
+        return profiler.output_text()
+    import pstats
+    profiler.disable()
+    out = io.StringIO()
+    pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(PROFILE_LINES)
+    return out.getvalue()
+
+@app.before_request
+def _before_request():
+    g.request_started = time.perf_counter()
+    mode = _profile_mode()
+    if mode:
+        g.profiler = _start_profiler(mode)
+
+@app.after_request
+def _after_request(response):
+    started = g.pop("request_started", None)
+    if started is not None:
+        endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+        metrics.HTTP_LATENCY.observe(
+            time.perf_counter() - started,
+            method=request.method, endpoint=endpoint, status=str(response.status_code)
+        )
+    profiler = g.pop("profiler", None)
+    if profiler is not None:
+        report = _profile_report(*profiler)
+        response = Response(report, mimetype="text/plain", status=response.status_code)
+    return response
+
+@app.route("/metrics", methods=["GET"])
+def api_metrics():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+if DATA_BACKEND == "sqlite":
+    from repository import remove_session
+    app.teardown_appcontext(remove_session)
 
 @app.route("/")
 def root():
@@ -250,5 +831,15 @@ def not_found(error):
 def internal_error(error):
     return jsonify({"error": "Internal server error"}), 500
 
+def create_app(preload=None):
+    """App factory for WSGI servers. With preload (default: METROPAL_PRELOAD) the data is
+       loaded and frozen first, so a pre-fork server shares one snapshot with all its
+       workers; see gunicorn.conf.py."""
+    if preload is None:
+        preload = os.environ.get("METROPAL_PRELOAD", "").lower() in ("1", "true", "yes")
+    if preload:
+        data_loader.freeze()
+    return app
+
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5000, debug=True)
\ No newline at end of file
@@ -0,0 +1,303 @@
+"""ASGI entry point: serves the Flask app from an asyncio server.
+
+    uvicorn asgi:app --host 0.0.0.0 --port 5000
+    hypercorn asgi:app
+
+Open connections are held by the event loop and only a request being worked on
+occupies a thread. Requests run on two bounded thread pools, so many idle or slow
+dashboard connections don't turn into as many threads:
+
+  cpu  /api/optimize* (scoring, solver, sweeps)  METROPAL_ASGI_CPU_WORKERS threads
+  io   everything else (cached reads, audit log) METROPAL_ASGI_IO_WORKERS threads
+
+Each pool queues at most METROPAL_ASGI_MAX_PENDING requests; past that a request is
+answered 503 with Retry-After at once instead of waiting without bound. A lane slot is
+only held until the app returns its response. Streamed responses (the NDJSON batch) are
+then drained on a thread of their own, inside the context the request was handled in,
+and forwarded chunk by chunk; at most STREAM_READ_AHEAD chunks are read ahead of a slow
+client.
+
+/api/stream is served here directly on the event loop rather than through Flask, so
+open event streams cost no thread at all.
+"""
+import asyncio, contextvars, io, os, sys, threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+from app import app as flask_app
+import batch, data_loader, events
+
+CPU_WORKERS = int(os.environ.get("METROPAL_ASGI_CPU_WORKERS", os.cpu_count() or 1))
+IO_WORKERS = int(os.environ.get("METROPAL_ASGI_IO_WORKERS", 16))
+MAX_PENDING = int(os.environ.get("METROPAL_ASGI_MAX_PENDING", 256))
+MAX_BODY = int(os.environ.get("METROPAL_ASGI_MAX_BODY", 16 * 1024 * 1024))
+STREAM_READ_AHEAD = 8
+
+CPU_PATHS = ("/api/optimize",)
+
+_END = object()
+
+class _Lane:
+    """A thread pool plus the admission limit in front of it"""
+
+    def __init__(self, name, workers, max_pending):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"metropal-{name}")
+        self.slots = asyncio.Semaphore(workers)
+        self.limit = workers + max_pending
+        self.inflight = 0
+
+    async def run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, _released, fn, *args)
+
+def _released(fn, *args):
+    """fn(*args), then the lane thread's database session goes back to the pool"""
+    try:
+        return fn(*args)
+    finally:
+        data_loader.remove_session()
+
+_lanes = {
+    "cpu": _Lane("cpu", CPU_WORKERS, MAX_PENDING),
+    "io": _Lane("io", IO_WORKERS, MAX_PENDING)
+}
+
+def _lane_for(path):
+    return _lanes["cpu" if path.startswith(CPU_PATHS) else "io"]
+
+def _environ(scope, body):
+    """The WSGI environ for an ASGI http scope (PEP 3333 strings are latin-1)"""
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf8").decode("latin1"),
+        "PATH_INFO": scope["path"].encode("utf8").decode("latin1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "REMOTE_ADDR": client[0],
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "CONTENT_LENGTH": str(len(body)),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False
+    }
+    for name, value in scope.get("headers", []):
+        name = name.decode("latin1").upper().replace("-", "_")
+        value = value.decode("latin1")
+        if name == "CONTENT_LENGTH":
+            continue
+        if name == "CONTENT_TYPE":
+            environ["CONTENT_TYPE"] = value
+            continue
+        key = "HTTP_" + name
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+def _start(environ):
+    """Calls the WSGI app in a context of its own. Returns (status, headers, body, stream):
+       the whole body when the app gave a Content-Length, else no body and stream =
+       (context, result) for _drain to iterate in the same context."""
+    context = contextvars.Context()
+    return context.run(_call_app, context, environ)
+
+def _call_app(context, environ):
+    response = {}
+
+    def start_response(status, headers, exc_info=None):
+        response["status"] = int(status.split(" ", 1)[0])
+        response["headers"] = [(k.lower().encode("latin1"), v.encode("latin1")) for k, v in headers]
+
+    result = flask_app(environ, start_response)
+    if any(k == b"content-length" for k, _ in response["headers"]):
+        try:
+            body = b"".join(result)
+        finally:
+            _close(result)
+        return response["status"], response["headers"], body, None
+    return response["status"], response["headers"], None, (context, result)
+
+def _close(result):
+    if hasattr(result, "close"):
+        result.close()
+
+def _drain(context, result, deliver, credits, stop):
+    """Iterates a streamed response on the calling thread, inside the context the app call
+       ran in (Flask's stream_with_context pops its request context there), handing each
+       chunk to deliver. Takes a credit per chunk, so it stays a few chunks ahead of the client."""
+    def iterate():
+        chunks = iter(result)
+        try:
+            while True:
+                credits.acquire()
+                chunk = _END if stop.is_set() else next(chunks, _END)
+                if chunk is _END:
+                    return _END
+                if chunk:
+                    deliver(chunk)
+        except Exception as e:
+            return e
+        finally:
+            _close(result)
+            data_loader.remove_session()
+    deliver(context.run(iterate))
+
+async def _send_stream(send, context, result):
+    loop = asyncio.get_running_loop()
+    chunks = asyncio.Queue()
+    credits = threading.Semaphore(STREAM_READ_AHEAD)
+    stop = threading.Event()
+
+    def deliver(chunk):
+        try:
+            loop.call_soon_threadsafe(chunks.put_nowait, chunk)
+        except RuntimeError:  # loop closed while the response was still streaming
+            pass
+
+    threading.Thread(
+        target=_drain, args=(context, result, deliver, credits, stop), name="metropal-stream", daemon=True
+    ).start()
+    try:
+        while True:
+            chunk = await chunks.get()
+            if chunk is _END:
+                break
+            if isinstance(chunk, Exception):
+                raise chunk
+            await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            credits.release()
+        await send({"type": "http.response.body", "body": b""})
+    finally:
+        stop.set()
+        credits.release()  # wakes the drain thread if it is waiting for the client
+
+async def _read_body(receive):
+    """The request body, or None if the client went away or sent more than MAX_BODY"""
+    parts, size = [], 0
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return None
+        part = message.get("body", b"")
+        size += len(part)
+        if size > MAX_BODY:
+            return None
+        parts.append(part)
+        if not message.get("more_body"):
+            return b"".join(parts)
+
+async def _simple(send, status, message, headers=()):
+    await send({
+        "type": "http.response.start", "status": status,
+        "headers": [(b"content-type", b"text/plain; charset=utf-8"), *headers]
+    })
+    await send({"type": "http.response.body", "body": message.encode()})
+
+async def _stream(scope, receive, send):
+    """/api/stream without a worker thread: the bus hands frames to this loop"""
+    loop = asyncio.get_running_loop()
+    frames = asyncio.Queue(events.QUEUE_SIZE)
+    lagged = asyncio.Event()
+
+    def offer(frame):
+        try:
+            frames.put_nowait(frame)
+        except asyncio.QueueFull:
+            lagged.set()
+
+    def deliver(frame):
+        loop.call_soon_threadsafe(offer, frame)
+
+    headers = {k.decode("latin1").lower(): v.decode("latin1") for k, v in scope.get("headers", [])}
+    last_id = headers.get("last-event-id")
+    if last_id is None:
+        last_id = parse_qs(scope.get("query_string", b"").decode("latin1")).get("last_event_id", [None])[0]
+    first = events.bus.subscribe(deliver, events.parse_last_event_id(last_id))
+    disconnected = asyncio.ensure_future(_wait_disconnect(receive))
+    try:
+        await send({"type": "http.response.start", "status": 200, "headers": [
+            (b"content-type", b"text/event-stream; charset=utf-8"),
+            (b"cache-control", b"no-cache"),
+            (b"x-accel-buffering", b"no"),
+            (b"access-control-allow-origin", b"*")
+        ]})
+        await send({"type": "http.response.body", "body": b"retry: 3000\n\n" + b"".join(first), "more_body": True})
+        while not lagged.is_set() and not disconnected.done():
+            getter = asyncio.ensure_future(frames.get())
+            done, _ = await asyncio.wait(
+                [getter, disconnected], timeout=events.HEARTBEAT_SECONDS, return_when=asyncio.FIRST_COMPLETED
+            )
+            if getter in done:
+                await send({"type": "http.response.body", "body": getter.result(), "more_body": True})
+            else:
+                getter.cancel()
+                if not disconnected.done():
+                    await send({"type": "http.response.body", "body": events.HEARTBEAT, "more_body": True})
+        if not disconnected.done():
+            await send({"type": "http.response.body", "body": b""})
+    finally:
+        events.bus.unsubscribe(deliver)
+        disconnected.cancel()
+
+async def _wait_disconnect(receive):
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+async def _http(scope, receive, send):
+    if scope["path"] == "/api/stream" and scope["method"] == "GET":
+        await _stream(scope, receive, send)
+        return
+    lane = _lane_for(scope["path"])
+    if lane.inflight >= lane.limit:
+        await _simple(send, 503, "Server busy, retry shortly", [(b"retry-after", b"1")])
+        return
+    lane.inflight += 1
+    try:
+        body = await _read_body(receive)
+        if body is None:
+            await _simple(send, 413, "Request body too large or incomplete")
+            return
+        async with lane.slots:
+            status, headers, body, stream = await lane.run(_start, _environ(scope, body))
+    finally:
+        lane.inflight -= 1
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    if stream is None:
+        await send({"type": "http.response.body", "body": body})
+    else:
+        await _send_stream(send, *stream)
+
+def _warm():
+    """Parses the data files once so the first requests don't pay for it"""
+    data_loader.load_full_train_data()
+    data_loader.load_maintenance_logs()
+    data_loader.load_daily_requirements()
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            try:
+                await _lanes["io"].run(_warm)
+            except Exception as e:
+                print("Data warm-up failed:", e)
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            batch.shutdown_pools()
+            for lane in _lanes.values():
+                lane.executor.shutdown(wait=False)
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+async def app(scope, receive, send):
+    if scope["type"] == "http":
+        await _http(scope, receive, send)
+    elif scope["type"] == "lifespan":
+        await _lifespan(receive, send)
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run("asgi:app", host="0.0.0.0", port=5000)
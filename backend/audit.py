@@ -0,0 +1,124 @@
+import os, json, gzip, shutil, threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+BASE_DIR = os.path.dirname(os.path.dirname(__file__))
+AUDIT_FILE = os.path.join(BASE_DIR, "backend_audit.jsonl")
+LEGACY_AUDIT_FILE = os.path.join(BASE_DIR, "backend_audit.json")
+
+# Rotate once the live log passes this size, keeping this many gzipped backups
+MAX_BYTES = int(os.environ.get("METROPAL_AUDIT_MAX_BYTES", 10 * 1024 * 1024))
+BACKUP_COUNT = int(os.environ.get("METROPAL_AUDIT_BACKUPS", 5))
+
+# How many recent entries the API readers look at (the old JSON file kept 1000)
+RECENT_WINDOW = 1000
+
+_thread_lock = threading.Lock()
+
+@contextmanager
+def file_lock(path, thread_lock):
+    """Exclusive lock on path + ".lock", shared by the threads holding thread_lock in this
+       process and by other worker processes"""
+    with thread_lock:
+        with open(path + ".lock", "a+b") as lf:
+            if fcntl:
+                fcntl.flock(lf.fileno(), fcntl.LOCK_EX)
+            else:
+                lf.seek(0)
+                msvcrt.locking(lf.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(lf.fileno(), fcntl.LOCK_UN)
+                else:
+                    lf.seek(0)
+                    msvcrt.locking(lf.fileno(), msvcrt.LK_UNLCK, 1)
+
+def _locked():
+    return file_lock(AUDIT_FILE, _thread_lock)
+
+def _backup_path(n):
+    return f"{AUDIT_FILE}.{n}.gz"
+
+def _rotate():
+    """Shifts gzipped backups up by one and compresses the live log into .1.gz"""
+    for n in range(BACKUP_COUNT - 1, 0, -1):
+        if os.path.exists(_backup_path(n)):
+            os.replace(_backup_path(n), _backup_path(n + 1))
+    with open(AUDIT_FILE, "rb") as src, gzip.open(_backup_path(1), "wb") as dst:
+        shutil.copyfileobj(src, dst)
+    open(AUDIT_FILE, "wb").close()
+
+def _migrate_legacy():
+    """Converts the old newest-first backend_audit.json array into the JSONL log once"""
+    if os.path.exists(AUDIT_FILE) or not os.path.exists(LEGACY_AUDIT_FILE):
+        return
+    try:
+        with open(LEGACY_AUDIT_FILE, "r", encoding="utf-8") as f:
+            entries = json.load(f)
+    except (OSError, ValueError):
+        return
+    with open(AUDIT_FILE, "w", encoding="utf-8") as f:
+        for entry in reversed(entries):
+            f.write(json.dumps(entry, separators=(",", ":")) + "\n")
+    os.replace(LEGACY_AUDIT_FILE, LEGACY_AUDIT_FILE + ".migrated")
+
+def append(entry):
+    """Appends one audit entry as a single JSON line, rotating the log when it gets too big"""
+    line = (json.dumps(entry, separators=(",", ":")) + "\n").encode("utf-8")
+    with _locked():
+        _migrate_legacy()
+        with open(AUDIT_FILE, "ab") as f:
+            f.write(line)
+            size = f.tell()
+        if MAX_BYTES and size > MAX_BYTES and BACKUP_COUNT > 0:
+            _rotate()
+
+def _lines_reversed(path, block_size=64 * 1024):
+    """Yields the lines of a file from last to first, reading it backwards in blocks"""
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        pos = f.tell()
+        pending = b""
+        while pos > 0:
+            step = min(block_size, pos)
+            pos -= step
+            f.seek(pos)
+            lines = (f.read(step) + pending).split(b"\n")
+            pending = lines[0]
+            for line in reversed(lines[1:]):
+                yield line
+        yield pending
+
+def _gz_lines_reversed(path):
+    with gzip.open(path, "rb") as f:
+        lines = f.read().split(b"\n")
+    return reversed(lines)
+
+def iter_recent():
+    """Yields audit entries newest first: the live log, then the rotated backups.
+       Only as much of the log is read as the caller consumes (backups are read whole)."""
+    if not os.path.exists(AUDIT_FILE) and os.path.exists(LEGACY_AUDIT_FILE):
+        with _locked():
+            _migrate_legacy()
+    if os.path.exists(AUDIT_FILE):
+        yield from _parse(_lines_reversed(AUDIT_FILE))
+    for n in range(1, BACKUP_COUNT + 1):
+        if os.path.exists(_backup_path(n)):
+            yield from _parse(_gz_lines_reversed(_backup_path(n)))
+
+def _parse(lines):
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            # a line still being written by another process
+            continue
@@ -0,0 +1,87 @@
+import os, threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from data_loader import load_full_train_data, remove_session
+from optimizer import optimize
+import live_updates
+
+# Pool used to fan batch dates out: "thread" (default) or "process"
+EXECUTORS = ("thread", "process")
+BATCH_EXECUTOR = os.environ.get("METROPAL_BATCH_EXECUTOR", "thread")
+BATCH_WORKERS = int(os.environ.get("METROPAL_BATCH_WORKERS", os.cpu_count() or 1))
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def _get_pool(kind):
+    """One long-lived pool of BATCH_WORKERS per kind, shared by every request so process
+       workers stay warm; a request's own parallelism is how many futures it keeps in flight"""
+    with _pools_lock:
+        pool = _pools.get(kind)
+        if pool is None:
+            cls = ProcessPoolExecutor if kind == "process" else ThreadPoolExecutor
+            pool = _pools[kind] = cls(max_workers=BATCH_WORKERS)
+        return pool
+
+def check_options(executor=None, workers=None):
+    """Raises ValueError unless executor is one of EXECUTORS and workers a positive integer"""
+    if executor is not None and executor not in EXECUTORS:
+        raise ValueError(f"executor must be one of {', '.join(EXECUTORS)}")
+    if workers is not None and (isinstance(workers, bool) or not isinstance(workers, int) or workers < 1):
+        raise ValueError("workers must be a positive integer")
+
+def shutdown_pools():
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.shutdown(wait=False)
+        _pools.clear()
+
+def _optimize_one(date_str, trains, weights, requirements, explain=True, solver=None, certificates=None):
+    try:
+        return optimize(weights, date_str=date_str, requirements=requirements, trains=trains,
+                        explain=explain, solver=solver, certificates=certificates)
+    except Exception as e:
+        return {"error": str(e)}
+    finally:
+        remove_session()
+
+def fleet_snapshot(dates):
+    """Each requested date's fleet with its live updates, loaded once in the calling process"""
+    return {d: live_updates.apply_to(load_full_train_data(date=d), d) for d in dict.fromkeys(dates)}
+
+def iter_batch(dates, weights, requirements, executor=None, workers=None, explain=True, solver=None,
+               certificates=None):
+    """Optimizes every date on a worker pool, yielding (date, result) as each one completes"""
+    kind = executor or BATCH_EXECUTOR
+    check_options(kind, workers)
+    snapshot = fleet_snapshot(dates)
+    workers = max(1, min(workers or BATCH_WORKERS, BATCH_WORKERS, len(snapshot)))
+
+    if workers == 1 and kind != "process":
+        for d, trains in snapshot.items():
+            yield d, _optimize_one(d, trains, weights, requirements, explain, solver, certificates)
+        return
+
+    pool = _get_pool(kind)
+    pending = iter(snapshot.items())
+    futures = {}
+    while True:
+        # top up to `workers` dates in flight, the next one submitted as each finishes
+        for d, trains in pending:
+            futures[pool.submit(_optimize_one, d, trains, weights, requirements, explain, solver, certificates)] = d
+            if len(futures) >= workers:
+                break
+        if not futures:
+            return
+        done, _ = wait(futures, return_when=FIRST_COMPLETED)
+        for future in done:
+            d = futures.pop(future)
+            try:
+                yield d, future.result()
+            except Exception as e:  # e.g. a broken process pool
+                yield d, {"error": str(e)}
+
+def run_batch(dates, weights, requirements, executor=None, workers=None, explain=True, solver=None,
+              certificates=None):
+    """Like iter_batch but returns {date: result} in the order the dates were given"""
+    done = dict(iter_batch(dates, weights, requirements, executor, workers, explain, solver, certificates))
+    return {d: done[d] for d in dict.fromkeys(dates)}
@@ -0,0 +1,168 @@
+"""Benchmarks for data loading, scoring, conflict detection, batch optimize,
+audit writes and the Flask endpoints over synthetic fleets.
+
+    python benchmark.py --trains 25 1000 10000 --days 7 365 --output bench.json
+
+Each (trains, days) case generates its own dataset with generate_data.generate()
+in a temporary directory and points data_loader and the audit log at it.
+Results are written as JSON for regression tracking.
+"""
+import argparse, datetime, json, os, platform, statistics, subprocess, sys, tempfile, time
+import numpy as np
+
+import data_loader
+import audit
+from generate_data import generate
+from optimizer import optimize, _fleet_columns, _score_columns
+from conflicts import detect_conflicts, index_trains
+from batch import run_batch
+import result_cache
+
+DEFAULT_WEIGHTS = {"punctuality": 80, "maintenance": 60, "cleaning": 50, "branding": 80, "mileage": 50}
+
+def time_it(fn, repeat, setup=None):
+    """Runs fn `repeat` times and returns timing stats in seconds"""
+    samples = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    return {
+        "repeat": repeat,
+        "min_s": min(samples),
+        "median_s": statistics.median(samples),
+        "mean_s": statistics.fmean(samples),
+        "max_s": max(samples)
+    }
+
+def build_dataset(data_dir, trains, days, seed):
+    """Writes the data files the backend reads for a synthetic fleet"""
+    data = generate(num_trains=trains, simulation_days=days, seed=seed)
+    with open(os.path.join(data_dir, "full_train_data.json"), "w") as f:
+        json.dump(data, f)
+    requirements = [{
+        "date": d,
+        "service_trains_required": round(trains * 0.6),
+        "standby_trains_required": round(trains * 0.15),
+        "special_event": None
+    } for d in data]
+    with open(os.path.join(data_dir, "daily_requirements.json"), "w") as f:
+        json.dump(requirements, f)
+    for name in ("train_fleet.json", "maintenance_log.json"):
+        with open(os.path.join(data_dir, name), "w") as f:
+            json.dump([], f)
+    return list(data)
+
+def run_case(trains, days, args):
+    results = []
+
+    def record(name, stats, **extra):
+        results.append({"name": name, "trains": trains, "days": days, **stats, **extra})
+        print(f"  {name:<24} median {stats['median_s'] * 1000:10.3f} ms", file=sys.stderr)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        dates = []
+        record("generate_dataset", time_it(lambda: dates.extend(build_dataset(tmp, trains, days, args.seed)), 1))
+
+        data_loader.DATA_DIR = tmp
+        audit.AUDIT_FILE = os.path.join(tmp, "audit.jsonl")
+        audit.LEGACY_AUDIT_FILE = os.path.join(tmp, "audit.json")
+        day = dates[-1]
+        requirements = {"service": round(trains * 0.6), "standby": round(trains * 0.15)}
+
+        record("load_cold", time_it(lambda: data_loader.load_full_train_data(day), args.repeat,
+                                    setup=data_loader.invalidate))
+        record("load_warm", time_it(lambda: data_loader.load_full_train_data(day), args.repeat))
+
+        fleet = data_loader.load_full_train_data(day)
+        record("columns", time_it(lambda: _fleet_columns(fleet), args.repeat))
+        cols = _fleet_columns(fleet)
+        record("scoring", time_it(lambda: _score_columns(cols, DEFAULT_WEIGHTS), args.repeat))
+
+        result = optimize(DEFAULT_WEIGHTS, date_str=day, requirements=requirements)
+        index = index_trains(fleet)
+        record("conflict_detection", time_it(
+            lambda: detect_conflicts(result["plan"], index, DEFAULT_WEIGHTS), args.repeat
+        ), conflicts=len(result["conflicts"]))
+        record("optimize", time_it(
+            lambda: optimize(DEFAULT_WEIGHTS, date_str=day, requirements=requirements), args.repeat
+        ))
+
+        batch_dates = dates[-args.batch_dates:]
+        record("optimize_batch", time_it(
+            lambda: run_batch(batch_dates, DEFAULT_WEIGHTS, requirements), args.repeat
+        ), dates=len(batch_dates))
+
+        entry = {
+            "timestamp": datetime.datetime.utcnow().isoformat() + "Z",
+            "optimization_type": "date_specific",
+            "date": day,
+            "weights": DEFAULT_WEIGHTS,
+            "plan": result["plan"],
+            "conflicts": result["conflicts"]
+        }
+        record("audit_write", time_it(lambda: audit.append(entry), args.repeat))
+
+        if not args.skip_api:
+            from app import app
+            client = app.test_client()
+            record("api_full_trains", time_it(lambda: client.get(f"/api/full_trains?date={day}"), args.repeat))
+            record("api_optimize_date", time_it(lambda: client.post("/api/optimize_date", json={
+                "date": day, "weights": DEFAULT_WEIGHTS, "requirements": requirements
+            }), args.repeat, setup=result_cache.invalidate))
+            record("api_optimize_batch", time_it(lambda: client.post("/api/optimize_batch", json={
+                "dates": batch_dates, "weights": DEFAULT_WEIGHTS, "requirements": requirements
+            }), args.repeat), dates=len(batch_dates))
+
+        data_loader.invalidate()
+    return results
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the MetroPal optimizer and API")
+    parser.add_argument("--trains", type=int, nargs="+", default=[25, 250, 1000])
+    parser.add_argument("--days", type=int, nargs="+", default=[7, 30])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--batch-dates", type=int, default=7, help="dates per batch optimize")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--skip-api", action="store_true", help="don't time the Flask endpoints")
+    parser.add_argument("--output", help="write JSON results here instead of stdout")
+    args = parser.parse_args(argv)
+
+    original_paths = data_loader.DATA_DIR, audit.AUDIT_FILE, audit.LEGACY_AUDIT_FILE
+    results = []
+    try:
+        for trains in args.trains:
+            for days in args.days:
+                print(f"{trains} trains x {days} days", file=sys.stderr)
+                results.extend(run_case(trains, days, args))
+    finally:
+        data_loader.DATA_DIR, audit.AUDIT_FILE, audit.LEGACY_AUDIT_FILE = original_paths
+
+    report = {
+        "meta": {
+            "timestamp": datetime.datetime.utcnow().isoformat() + "Z",
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count()
+        },
+        "results": results
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+
+if __name__ == "__main__":
+    main()
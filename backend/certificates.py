@@ -0,0 +1,56 @@
+"""Fitness certificate expiry index for one day's fleet.
+
+Per certificate type the fleet's expiry dates are kept sorted, so "which trains
+have an expired certificate on D" is one bisect per type (the answer is the
+prefix before D) and "which lapse between D1 and D2" is two. ISO dates compare
+in date order, so the strings are sorted as they are. Expiries that aren't a
+YYYY-MM-DD date (empty, malformed, another type) are left out of the index.
+"""
+import bisect, datetime
+
+CERTIFICATES = ("rs_cert_expiry", "sig_cert_expiry", "telecom_cert_expiry")
+
+# certificate gating in optimize(): "off", "flag" (report conflicts) or "exclude" (force IBL)
+GATING_MODES = ("off", "flag", "exclude")
+
+def expiry_of(record, cert):
+    """The record's cert expiry as a YYYY-MM-DD string, or None when it has no valid one"""
+    value = record.get(cert)
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    if not isinstance(value, str) or len(value) != 10:
+        return None
+    try:
+        datetime.date.fromisoformat(value)
+    except ValueError:
+        return None
+    return value
+
+class CertificateIndex:
+    def __init__(self, records):
+        self.records = records
+        self.by_type = {}
+        for cert in CERTIFICATES:
+            expiries = ((expiry_of(r, cert), i) for i, r in enumerate(records))
+            pairs = sorted((d, i) for d, i in expiries if d)
+            self.by_type[cert] = ([d for d, _ in pairs], [i for _, i in pairs])
+
+    def expired(self, on_date):
+        """{record position: [(certificate, expiry)]} for certificates that expired before on_date"""
+        out = {}
+        for cert, (dates, positions) in self.by_type.items():
+            k = bisect.bisect_left(dates, on_date)
+            for i in range(k):
+                out.setdefault(positions[i], []).append((cert, dates[i]))
+        return out
+
+    def expiring(self, start=None, end=None, types=CERTIFICATES):
+        """[(expiry, certificate, record position)] with start <= expiry <= end, soonest first"""
+        out = []
+        for cert in types:
+            dates, positions = self.by_type[cert]
+            lo = bisect.bisect_left(dates, start) if start else 0
+            hi = bisect.bisect_right(dates, end) if end else len(dates)
+            out.extend((dates[i], cert, positions[i]) for i in range(lo, hi))
+        out.sort()
+        return out
@@ -0,0 +1,221 @@
+"""Compact columnar snapshot of full_train_data.json.
+
+A snapshot is a directory holding one raw binary file per field plus meta.json:
+
+    meta.json        fields, dtypes, dates, per-date row offsets and string dictionaries
+    <field>.bin      fixed-width column for every train-day, rows grouped by date
+
+Strings (train_id, branding_company, maintenance_type, stabling_bay_id, ...) are
+dictionary-encoded as int32 codes, dates are int32 ordinals, and missing values
+use a sentinel. Columns are memory-mapped, so reading one date only touches that
+date's rows:
+
+    python columnar.py --source ../data/full_train_data.json --output ../data/full_train_data.columnar
+"""
+import argparse, datetime, json, os, shutil, time
+import numpy as np
+from records import TrainRecord
+
+SNAPSHOT_DIR = "full_train_data.columnar"
+FORMAT_VERSION = 1
+
+# Record fields in full_train_data.json order, with their storage kind
+FIELDS = [
+    ("train_id", "str"),
+    ("fitness_score", "float"),
+    ("last_maintenance_date", "date"),
+    ("maintenance_due", "bool"),
+    ("job_card_status", "str"),
+    ("maintenance_type", "str"),
+    ("mileage_since_maintenance", "int"),
+    ("total_mileage", "int"),
+    ("last_cleaning_date", "date"),
+    ("needs_cleaning", "bool"),
+    ("rs_cert_expiry", "date"),
+    ("sig_cert_expiry", "date"),
+    ("telecom_cert_expiry", "date"),
+    ("branding_active", "int"),
+    ("branding_start_date", "date"),
+    ("branding_priority", "float"),
+    ("branding_company", "str"),
+    ("recommended_action", "str"),
+    ("stabling_bay_id", "str"),
+]
+DTYPES = {"str": "<i4", "date": "<i4", "bool": "i1", "int": "<i8", "float": "<f8"}
+MISSING = {"str": -1, "date": -1, "bool": -1, "int": np.iinfo(np.int64).min, "float": np.nan}
+
+# --- Writing ---
+
+class _Encoder:
+    """Turns one day's records into fixed-width column arrays"""
+
+    def __init__(self):
+        self.dictionaries = {name: {} for name, kind in FIELDS if kind == "str"}
+        self._ordinals = {}
+
+    def _ordinal(self, value):
+        o = self._ordinals.get(value)
+        if o is None:
+            o = self._ordinals[value] = datetime.date.fromisoformat(value).toordinal()
+        return o
+
+    def encode(self, records):
+        out = {}
+        for name, kind in FIELDS:
+            values = [r.get(name) for r in records]
+            missing = MISSING[kind]
+            if kind == "str":
+                codes = self.dictionaries[name]
+                values = [missing if v is None else codes.setdefault(v, len(codes)) for v in values]
+            elif kind == "date":
+                values = [self._ordinal(v) if v else missing for v in values]
+            elif kind == "bool":
+                values = [missing if v is None else int(bool(v)) for v in values]
+            else:
+                values = [missing if v is None else v for v in values]
+            out[name] = np.asarray(values, dtype=DTYPES[kind])
+        return out
+
+def write_snapshot(dated_records, out_dir):
+    """Writes (date_str, records) pairs to a snapshot directory, one day at a time.
+       The snapshot is built next to out_dir and swapped in when complete."""
+    tmp_dir = out_dir + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    encoder = _Encoder()
+    files = {name: open(os.path.join(tmp_dir, f"{name}.bin"), "wb") for name, _ in FIELDS}
+    dates, offsets = [], [0]
+    try:
+        for date_str, records in dated_records:
+            for name, column in encoder.encode(records).items():
+                files[name].write(column.tobytes())
+            dates.append(date_str)
+            offsets.append(offsets[-1] + len(records))
+    finally:
+        for f in files.values():
+            f.close()
+
+    # dates are kept sorted in meta; rows stay in file order and are found via offsets
+    order = sorted(range(len(dates)), key=dates.__getitem__)
+    meta = {
+        "version": FORMAT_VERSION,
+        "rows": offsets[-1],
+        "fields": [{"name": name, "kind": kind, "dtype": DTYPES[kind]} for name, kind in FIELDS],
+        "dates": [dates[i] for i in order],
+        "spans": [[offsets[i], offsets[i + 1]] for i in order],
+        "dictionaries": {name: list(codes) for name, codes in encoder.dictionaries.items()},
+    }
+    with open(os.path.join(tmp_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+
+    if os.path.exists(out_dir):
+        old_dir = out_dir + ".old"
+        shutil.rmtree(old_dir, ignore_errors=True)
+        os.replace(out_dir, old_dir)
+        os.replace(tmp_dir, out_dir)
+        shutil.rmtree(old_dir, ignore_errors=True)
+    else:
+        os.replace(tmp_dir, out_dir)
+    return meta["rows"]
+
+# --- Reading ---
+
+class ColumnarSnapshot:
+    """Read-only view over a snapshot directory with memory-mapped columns"""
+
+    def __init__(self, path, meta=None):
+        self.path = path
+        if meta is None:
+            with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        if meta.get("version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported columnar snapshot version {meta.get('version')}")
+        self.fields = [(f["name"], f["kind"]) for f in meta["fields"]]
+        self.dates = meta["dates"]
+        self.spans = {d: tuple(s) for d, s in zip(meta["dates"], meta["spans"])}
+        self.dictionaries = meta["dictionaries"]
+        self._columns = {}
+        self._iso = {}
+        self._by_train = None
+        for f in meta["fields"]:
+            file_path = os.path.join(path, f"{f['name']}.bin")
+            # np.memmap can't map an empty file
+            if meta["rows"]:
+                self._columns[f["name"]] = np.memmap(file_path, dtype=f["dtype"], mode="r", shape=(meta["rows"],))
+            else:
+                self._columns[f["name"]] = np.empty(0, dtype=f["dtype"])
+
+    def columns(self, date):
+        """Raw column slices (views into the mapped files) for one date"""
+        start, end = self.spans[date]
+        return {name: self._columns[name][start:end] for name, _ in self.fields}
+
+    def _iso_date(self, ordinal):
+        s = self._iso.get(ordinal)
+        if s is None:
+            s = self._iso[ordinal] = datetime.date.fromordinal(ordinal).isoformat()
+        return s
+
+    def _decode(self, name, kind, values):
+        """Stored column values (a list) back to record values"""
+        if kind == "str":
+            lookup = self.dictionaries[name]
+            return [None if v < 0 else lookup[v] for v in values]
+        if kind == "date":
+            return [None if v < 0 else self._iso_date(v) for v in values]
+        if kind == "bool":
+            return [None if v < 0 else bool(v) for v in values]
+        if kind == "int":
+            return [None if v == MISSING["int"] else v for v in values]
+        return [None if v != v else v for v in values]  # NaN marks a missing float
+
+    def records(self, date):
+        """One date's rows decoded back into TrainRecords"""
+        cols = self.columns(date)
+        names, decoded = [], []
+        for name, kind in self.fields:
+            names.append(name)
+            decoded.append(self._decode(name, kind, cols[name].tolist()))
+        return [TrainRecord.from_dict(dict(zip(names, row))) for row in zip(*decoded)]
+
+    def train_rows(self, train_id):
+        """(dates, row positions) of one train's records, oldest first; None for an unknown
+           train. The train-major index is built on first use from the train_id column."""
+        if self._by_train is None:
+            codes = np.asarray(self._columns["train_id"])
+            row_date = np.empty(len(codes), dtype=np.int64)
+            for k, d in enumerate(self.dates):
+                start, end = self.spans[d]
+                row_date[start:end] = k
+            order = np.lexsort((row_date, codes))  # by train, then by date
+            bounds = np.flatnonzero(np.diff(codes[order])) + 1
+            lookup = self.dictionaries["train_id"]
+            by_train = {}
+            for rows in np.split(order, bounds):
+                if len(rows) and codes[rows[0]] >= 0:
+                    by_train[lookup[codes[rows[0]]]] = ([self.dates[k] for k in row_date[rows].tolist()], rows)
+            self._by_train = by_train
+        return self._by_train.get(train_id)
+
+    def series(self, rows, fields):
+        """{field: [values]} for the given row positions"""
+        kinds = dict(self.fields)
+        return {name: self._decode(name, kinds[name], self._columns[name][rows].tolist()) for name in fields}
+
+def main(argv=None):
+    from import_json import iter_dated_records
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    data_dir = os.path.join(os.path.dirname(here), "data")
+    parser = argparse.ArgumentParser(description="Convert full_train_data.json to a columnar snapshot")
+    parser.add_argument("--source", default=os.path.join(data_dir, "full_train_data.json"))
+    parser.add_argument("--output", default=os.path.join(data_dir, SNAPSHOT_DIR))
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    rows = write_snapshot(iter_dated_records(args.source), args.output)
+    print(f"Wrote {rows:,} rows to {args.output} in {time.perf_counter() - started:.2f}s")
+
+if __name__ == "__main__":
+    main()
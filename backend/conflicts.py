@@ -0,0 +1,141 @@
+import time, threading
+
+# Conflict rules, evaluated in registration order. Each rule declares which
+# assignments it applies to and, optionally, a weights predicate that turns
+# it on; its check receives the train record and assignment and returns a
+# conflict dict or None.
+RULES = []
+
+# Per-rule counters accumulated across calls: evaluations, conflicts, seconds
+_rule_stats = {}
+_stats_lock = threading.Lock()
+
+def conflict_rule(name, assignments, enabled=None):
+    """Decorator registering a conflict check under the given name"""
+    def register(check):
+        RULES.append({
+            "name": name,
+            "assignments": frozenset(assignments),
+            "enabled": enabled,
+            "check": check
+        })
+        _rule_stats[name] = {"evaluations": 0, "conflicts": 0, "seconds": 0.0}
+        return check
+    return register
+
+def index_trains(trains):
+    """train_id -> train record, keeping the first record for duplicated ids"""
+    index = {}
+    for t in trains:
+        index.setdefault(t["train_id"], t)
+    return index
+
+def detect_conflicts(plan, trains_by_id, weights):
+    """Runs every enabled rule over the plan, one rule at a time so each is timed once per
+       call. Conflicts are returned grouped by rule, in rule registration order."""
+    active = [r for r in RULES if r["enabled"] is None or r["enabled"](weights)]
+    rows = []
+    for p in plan:
+        tr = trains_by_id.get(p["train_id"])
+        if tr:
+            rows.append((tr, p["assignment"]))
+    clock = time.perf_counter
+
+    found, evaluations, seconds = [], [], []
+    for rule in active:
+        check, assignments = rule["check"], rule["assignments"]
+        t0 = clock()
+        applicable = [(tr, a) for tr, a in rows if a in assignments]
+        conflicts = [c for c in (check(tr, a) for tr, a in applicable) if c]
+        seconds.append(clock() - t0)
+        evaluations.append(len(applicable))
+        found.append(conflicts)
+
+    with _stats_lock:
+        for k, rule in enumerate(active):
+            stats = _rule_stats[rule["name"]]
+            stats["evaluations"] += evaluations[k]
+            stats["conflicts"] += len(found[k])
+            stats["seconds"] += seconds[k]
+
+    return [c for group in found for c in group]
+
+def rule_stats():
+    """Snapshot of the per-rule timing counters"""
+    with _stats_lock:
+        return {name: dict(stats) for name, stats in _rule_stats.items()}
+
+def reset_rule_stats():
+    with _stats_lock:
+        for stats in _rule_stats.values():
+            stats.update(evaluations=0, conflicts=0, seconds=0.0)
+
+# --- Built-in rules ---
+
+# Check for branded trains in IBL when branding priority is high
+@conflict_rule("branding_in_ibl", ["IBL"], enabled=lambda w: w.get("branding", 0) > 60)
+def _branding_in_ibl(tr, assignment):
+    if tr.get("branding_active", 0) == 1:
+        return {
+            "train_id": tr["train_id"],
+            "issue": f"Branded train ({tr.get('branding_company', 'Unknown')}) assigned to IBL while branding priority is high",
+            "severity": "medium",
+            "branding_priority": tr.get("branding_priority", 0)
+        }
+
+# Check for high-fitness trains in IBL (potential resource waste)
+@conflict_rule("high_fitness_in_ibl", ["IBL"])
+def _high_fitness_in_ibl(tr, assignment):
+    fitness_score = tr.get("fitness_score", 0)
+    if fitness_score > 0.8:  # High fitness threshold (0-1 scale)
+        return {
+            "train_id": tr["train_id"],
+            "issue": f"High-fitness train ({fitness_score:.1%}) assigned to IBL",
+            "severity": "low"
+        }
+
+# Check for maintenance overdue trains in active service
+@conflict_rule("overdue_in_service", ["Service", "Standby"])
+def _overdue_in_service(tr, assignment):
+    if tr.get("maintenance_due", False):
+        return {
+            "train_id": tr["train_id"],
+            "issue": f"Maintenance overdue train assigned to {assignment}",
+            "severity": "high",
+            "mileage_since_maintenance": tr.get("mileage_since_maintenance", 0)
+        }
+
+# Check for high mileage trains in service
+HIGH_MILEAGE_THRESHOLD = 18000  # 90% of 20,000 km maintenance interval
+
+@conflict_rule("high_mileage", ["Service", "Standby"])
+def _high_mileage(tr, assignment):
+    mileage = tr.get("mileage_since_maintenance", 0)
+    if mileage > HIGH_MILEAGE_THRESHOLD:
+        return {
+            "train_id": tr["train_id"],
+            "issue": f"High-mileage train ({mileage:,} km) assigned to {assignment} - nearing maintenance interval",
+            "severity": "medium",
+            "mileage_since_maintenance": mileage
+        }
+
+# Check for trains with open job cards in service
+@conflict_rule("open_job_card", ["Service", "Standby"])
+def _open_job_card(tr, assignment):
+    if tr.get("job_card_status") == "Open":
+        return {
+            "train_id": tr["train_id"],
+            "issue": f"Train with open job card ({tr.get('maintenance_type', 'Unknown')}) assigned to {assignment}",
+            "severity": "high" if tr.get("maintenance_type") in ["Major Repair", "Critical Failure"] else "medium"
+        }
+
+# Check for trains needing cleaning in service when cleaning priority is high
+@conflict_rule("needs_cleaning", ["Service"], enabled=lambda w: w.get("cleaning", 0) > 50)
+def _needs_cleaning(tr, assignment):
+    if tr.get("needs_cleaning", False):
+        return {
+            "train_id": tr["train_id"],
+            "issue": "Train needing cleaning assigned to Service while cleaning priority is high",
+            "severity": "low",
+            "last_cleaning_date": tr.get("last_cleaning_date")
+        }
@@ -1,44 +1,319 @@
-import json, os, datetime
+import json, os, datetime, threading, bisect, hashlib, gc
+from records import TrainRecord
+from certificates import CertificateIndex
 BASE_DIR = os.path.dirname(os.path.dirname(__file__))
 DATA_DIR = os.path.join(BASE_DIR, "data")
 
+# Where the dated fleet records come from: "json" (full_train_data.json), "sqlite" (metro.db)
+# or "columnar" (the memory-mapped snapshot written by columnar.py)
+DATA_BACKEND = os.environ.get("METROPAL_DATA_BACKEND", "json")
+
+# Process-wide cache of parsed data files: path -> ((mtime_ns, size), value).
+# Each file is parsed once and re-parsed only when its mtime/size changes.
+# Values are shared between callers, so treat them as read-only.
+_cache = {}
+_cache_lock = threading.Lock()
+
+# Set by freeze(): files already loaded are served without checking them on disk
+# until reload(), so every worker of a pre-fork server answers from the same snapshot.
+_frozen = False
+
+def _file_stamp(path):
+    st = os.stat(path)
+    return (st.st_mtime_ns, st.st_size)
+
+def _load_cached(name, build=None):
+    """Returns the parsed (and optionally indexed) contents of a data file,
+       reusing the in-memory copy while the file is unchanged on disk."""
+    p = os.path.join(DATA_DIR, name)
+    if _frozen:
+        entry = _cache.get(p)
+        if entry is not None:
+            return entry[1]
+    stamp = _file_stamp(p)
+    entry = _cache.get(p)
+    if entry is not None and entry[0] == stamp:
+        return entry[1]
+    with _cache_lock:
+        # another thread may have reloaded while we waited for the lock
+        entry = _cache.get(p)
+        if entry is not None and entry[0] == stamp:
+            return entry[1]
+        with open(p, "r", encoding="utf-8") as f:
+            raw = json.load(f)
+        value = build(raw) if build else raw
+        _cache[p] = (stamp, value)
+        return value
+
+def invalidate(name=None):
+    """Drops cached data so the next load re-reads it from disk.
+       With no name every cached file is dropped."""
+    with _cache_lock:
+        if name is None:
+            _cache.clear()
+        else:
+            _cache.pop(os.path.join(DATA_DIR, name), None)
+
+def preload():
+    """Parses every data file the API reads, so it happens once before serving"""
+    loaders = [load_trains, load_maintenance_logs, load_daily_requirements]
+    if DATA_BACKEND != "sqlite":
+        loaders.append(load_full_train_data)
+    for load in loaders:
+        try:
+            load()
+        except (OSError, ValueError) as e:
+            print("Preload skipped:", e)
+
+def freeze():
+    """Snapshot mode for pre-fork servers: preloads the data, stops re-checking the files
+       and moves everything loaded so far into the GC's permanent generation. Workers forked
+       afterwards start out sharing those pages copy-on-write, and their collections no
+       longer write to them. The cached objects stay ordinary mutable Python objects, though:
+       reference counting and any write in a worker still copy the pages it touches. With
+       METROPAL_DATA_BACKEND=columnar the fleet is a read-only memory map instead, opened
+       here before the fork, which workers share for good."""
+    global _frozen
+    preload()
+    gc.collect()
+    gc.freeze()
+    _frozen = True
+
+def reload():
+    """Re-reads the data files. In snapshot mode the new data is frozen in turn, so workers
+       forked after this (gunicorn's HUP) share the new snapshot."""
+    global _frozen
+    frozen, _frozen = _frozen, False
+    invalidate()
+    if frozen:
+        gc.unfreeze()  # the old snapshot becomes collectable again
+        freeze()
+
+def _fleet_paths():
+    """Files the dated fleet records are read from under the current backend"""
+    if DATA_BACKEND == "sqlite":
+        import repository
+        return [repository.DB_PATH, repository.DB_PATH + "-wal"]
+    if DATA_BACKEND == "columnar":
+        return [os.path.join(DATA_DIR, _COLUMNAR_META)]
+    return [os.path.join(DATA_DIR, "full_train_data.json")]
+
+def _served_stamp(path):
+    """(mtime_ns, size) of the data being served from path: in snapshot mode the stamp the
+       snapshot was loaded with, so validators only change once reload() serves new data"""
+    if _frozen:
+        entry = _cache.get(path)
+        if entry is not None:
+            return entry[0]
+    return _file_stamp(path)
+
+def _version_of(paths):
+    parts = []
+    for p in paths:
+        try:
+            parts.append("%d:%d" % _served_stamp(p))
+        except OSError:
+            parts.append("-")
+    return hashlib.sha1("|".join(parts).encode()).hexdigest()[:16]
+
+def data_version():
+    """Short stamp that changes whenever the fleet, maintenance log or requirements data being
+       served changes."""
+    return _version_of(_fleet_paths() + [
+        os.path.join(DATA_DIR, "maintenance_log.json"),
+        os.path.join(DATA_DIR, "daily_requirements.json")
+    ])
+
+def source_version(name=None):
+    """(stamp, last modified datetime in UTC) of one data file, or of the fleet records
+       when name is None. Used for HTTP validators on the list endpoints."""
+    paths = _fleet_paths() if name is None else [os.path.join(DATA_DIR, name)]
+    mtimes = []
+    for p in paths:
+        try:
+            mtimes.append(_served_stamp(p)[0] / 1e9)
+        except OSError:
+            pass
+    modified = datetime.datetime.fromtimestamp(int(max(mtimes)), datetime.timezone.utc) if mtimes else None
+    return _version_of(paths), modified
+
+_COLUMNAR_META = os.path.join("full_train_data.columnar", "meta.json")
+
+def _columnar_snapshot():
+    from columnar import ColumnarSnapshot
+    path = os.path.dirname(os.path.join(DATA_DIR, _COLUMNAR_META))
+    return _load_cached(_COLUMNAR_META, lambda meta: ColumnarSnapshot(path, meta))
+
+def _index_full_train_data(raw):
+    # records are converted once per load; the parsed dicts are dropped with raw
+    by_date = {d: [TrainRecord.from_dict(t) for t in trains] for d, trains in raw.items()}
+    dates = sorted(by_date)
+    # train-major view of the same records: train_id -> (sorted dates, records in the same
+    # order, {field: values per date} filled in as fields are asked for)
+    by_train = {}
+    for d in dates:
+        for record in by_date[d]:
+            entry = by_train.get(record.train_id)
+            if entry is None:
+                entry = by_train[record.train_id] = ([], [], {})
+            entry[0].append(d)
+            entry[1].append(record)
+    # per-date certificate indexes are built on first use by load_certificate_index
+    return {"by_date": by_date, "dates": dates, "by_train": by_train, "certificates": {}}
+
+def _index_maintenance_logs(raw):
+    # train_id -> (sorted maintenance dates, entries in the same order)
+    grouped = {}
+    for entry in raw:
+        grouped.setdefault(entry.get("train_id"), []).append(entry)
+    by_train = {}
+    for train_id, entries in grouped.items():
+        entries.sort(key=lambda e: e.get("maintenance_date") or "")
+        by_train[train_id] = ([e.get("maintenance_date") or "" for e in entries], entries)
+    return {"rows": raw, "by_train": by_train}
+
+def _index_daily_requirements(raw):
+    by_date = {}
+    for d in raw:
+        by_date.setdefault(d.get("date"), d)
+    return {"rows": raw, "by_date": by_date}
+
 def load_trains():
-    p = os.path.join(DATA_DIR, "train_fleet.json")
-    with open(p, "r", encoding="utf-8") as f:
-        return json.load(f)
+    return _load_cached("train_fleet.json")
 
 def load_maintenance_logs():
-    p = os.path.join(DATA_DIR, "maintenance_log.json")
-    with open(p, "r", encoding="utf-8") as f:
-        return json.load(f)
+    return _load_cached("maintenance_log.json", _index_maintenance_logs)["rows"]
+
+def load_maintenance_history(train_id, start=None, end=None):
+    """One train's maintenance log entries with start <= maintenance_date <= end, oldest first.
+       Returns None for a train with no history."""
+    history = _load_cached("maintenance_log.json", _index_maintenance_logs)["by_train"].get(train_id)
+    if history is None:
+        return None
+    dates, entries = history
+    lo = bisect.bisect_left(dates, start) if start else 0
+    hi = bisect.bisect_right(dates, end) if end else len(dates)
+    return entries[lo:hi]
+
+def last_maintenance_date(train_id, on_or_before=None):
+    """Date of the train's latest logged maintenance up to on_or_before (YYYY-MM-DD), or None"""
+    try:
+        history = _load_cached("maintenance_log.json", _index_maintenance_logs)["by_train"].get(train_id)
+    except OSError:  # no maintenance log on disk
+        return None
+    if not history:
+        return None
+    dates = history[0]
+    k = bisect.bisect_right(dates, on_or_before) if on_or_before else len(dates)
+    return dates[k - 1] if k else None
 
 def load_daily_requirements():
-    p = os.path.join(DATA_DIR, "daily_requirements.json")
-    with open(p, "r", encoding="utf-8") as f:
-        return json.load(f)
+    return _load_cached("daily_requirements.json", _index_daily_requirements)["rows"]
+
+def remove_session(exc=None):
+    """Releases the calling thread's database session (sqlite backend). Flask does this at the
+       end of each request; pool threads working outside one call it when they are done."""
+    if DATA_BACKEND == "sqlite":
+        import repository
+        repository.remove_session()
 
 def load_full_train_data(date=None):
-    """Loads full_train_data.json and returns a flat list for the requested date.
+    """Loads full_train_data.json and returns a flat list of TrainRecords for the requested date.
        If date is None, uses today's date in YYYY-MM-DD or falls back to the latest date available."""
-    p = os.path.join(DATA_DIR, "full_train_data.json")
-    with open(p, "r", encoding="utf-8") as f:
-        raw = json.load(f)
+    if DATA_BACKEND == "sqlite":
+        import repository
+        return repository.load_full_train_data(date)
     if date is None:
         today = datetime.date.today().isoformat()
     else:
         today = date
+    if DATA_BACKEND == "columnar":
+        snapshot = _columnar_snapshot()
+        if today in snapshot.spans:
+            return snapshot.records(today)
+        return snapshot.records(snapshot.dates[-1]) if snapshot.dates else []
+    idx = _load_cached("full_train_data.json", _index_full_train_data)
+    raw = idx["by_date"]
     if today in raw:
         return raw[today]
-    keys = sorted(raw.keys())
+    keys = idx["dates"]
     if keys:
         return raw[keys[-1]]
     return []
 
+def load_train_data_range(start=None, end=None):
+    """Returns {date: [TrainRecords]} for start <= date <= end (YYYY-MM-DD, either bound optional)."""
+    if DATA_BACKEND == "sqlite":
+        import repository
+        return repository.load_train_data_range(start, end)
+    if DATA_BACKEND == "columnar":
+        snapshot = _columnar_snapshot()
+        dates = snapshot.dates
+        lo = bisect.bisect_left(dates, start) if start else 0
+        hi = bisect.bisect_right(dates, end) if end else len(dates)
+        return {d: snapshot.records(d) for d in dates[lo:hi]}
+    idx = _load_cached("full_train_data.json", _index_full_train_data)
+    dates = idx["dates"]
+    lo = bisect.bisect_left(dates, start) if start else 0
+    hi = bisect.bisect_right(dates, end) if end else len(dates)
+    return {d: idx["by_date"][d] for d in dates[lo:hi]}
+
+# Series /api/trains/<id>/timeline returns when no fields are asked for
+TIMELINE_FIELDS = (
+    "fitness_score", "mileage_since_maintenance", "total_mileage", "recommended_action",
+    "job_card_status", "maintenance_due", "needs_cleaning"
+)
+
+def load_train_timeline(train_id, start=None, end=None, fields=TIMELINE_FIELDS):
+    """One train's values per date for start <= date <= end, oldest first:
+       (dates, {field: [values]}). Returns None for a train that isn't in the data."""
+    if DATA_BACKEND == "sqlite":
+        import repository
+        return repository.load_train_timeline(train_id, start, end, fields)
+    if DATA_BACKEND == "columnar":
+        snapshot = _columnar_snapshot()
+        entry = snapshot.train_rows(train_id)
+        if entry is None:
+            return None
+        dates, rows = entry
+        lo = bisect.bisect_left(dates, start) if start else 0
+        hi = bisect.bisect_right(dates, end) if end else len(dates)
+        return dates[lo:hi], snapshot.series(rows[lo:hi], fields)
+    entry = _load_cached("full_train_data.json", _index_full_train_data)["by_train"].get(train_id)
+    if entry is None:
+        return None
+    dates, records, series = entry
+    lo = bisect.bisect_left(dates, start) if start else 0
+    hi = bisect.bisect_right(dates, end) if end else len(dates)
+    out = {}
+    for f in fields:
+        values = series.get(f)
+        if values is None:
+            values = series[f] = [r.get(f) for r in records]
+        out[f] = values[lo:hi]
+    return dates[lo:hi], out
+
+def load_certificate_index(date=None):
+    """CertificateIndex over the records load_full_train_data(date) returns. The JSON backend
+       builds one per date the first time it is asked for and keeps it with the loaded data;
+       the others index the day's records on each call."""
+    if DATA_BACKEND in ("sqlite", "columnar"):
+        return CertificateIndex(load_full_train_data(date))
+    idx = _load_cached("full_train_data.json", _index_full_train_data)
+    day = date or datetime.date.today().isoformat()
+    if day not in idx["by_date"]:
+        if not idx["dates"]:
+            return CertificateIndex([])
+        day = idx["dates"][-1]
+    index = idx["certificates"].get(day)
+    if index is None:
+        index = idx["certificates"].setdefault(day, CertificateIndex(idx["by_date"][day]))
+    return index
+
 def today_requirement(today=None):
-    dr = load_daily_requirements()
+    idx = _load_cached("daily_requirements.json", _index_daily_requirements)
     if today is None:
         today = datetime.date.today().isoformat()
-    for d in dr:
-        if d.get("date")==today:
-            return d
-    return dr[-1]
+    if today in idx["by_date"]:
+        return idx["by_date"][today]
+    return idx["rows"][-1]
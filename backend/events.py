@@ -0,0 +1,99 @@
+"""In-process pub/sub behind the /api/stream server-sent events channel.
+
+Each event is serialized once, when it is published, and the encoded bytes are
+handed to every subscriber, so fan-out cost doesn't grow with payload size. A
+subscriber is any callable taking those bytes: the Flask stream puts them on a
+queue, the ASGI stream hands them to its event loop.
+
+The last REPLAY_SIZE events are kept so a reconnecting client (EventSource sends
+Last-Event-ID) receives what it missed. Events are per process; with several
+workers each client sees the events of the worker it is connected to.
+"""
+import json, os, threading, time
+from collections import deque
+import data_loader
+
+REPLAY_SIZE = 256
+QUEUE_SIZE = 1024  # events buffered per subscriber before it is dropped as too slow
+HEARTBEAT_SECONDS = float(os.environ.get("METROPAL_STREAM_HEARTBEAT", 15))
+POLL_SECONDS = float(os.environ.get("METROPAL_STREAM_POLL", 2))
+
+HEARTBEAT = b": keepalive\n\n"
+
+def encode(event_id, name, data):
+    """One SSE frame; without an id the client's Last-Event-ID is left as it was"""
+    payload = json.dumps(data, separators=(",", ":"), default=str)
+    head = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{head}event: {name}\ndata: {payload}\n\n".encode("utf-8")
+
+class EventBus:
+    def __init__(self, replay_size=REPLAY_SIZE):
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._recent = deque(maxlen=replay_size)  # (id, frame)
+        self._next_id = 1
+        self._watcher = None
+
+    def publish(self, name, data):
+        with self._lock:
+            event_id = self._next_id
+            self._next_id += 1
+            frame = encode(event_id, name, data)
+            self._recent.append((event_id, frame))
+            subscribers = list(self._subscribers)
+        for deliver in subscribers:
+            try:
+                deliver(frame)
+            except Exception as e:
+                print("Event delivery error:", e)
+        return event_id
+
+    def subscribe(self, deliver, last_event_id=None):
+        """Registers deliver(frame). Returns the frames to send first: a hello with the
+           current data version, then anything published after last_event_id."""
+        with self._lock:
+            self._subscribers.add(deliver)
+            missed = []
+            if last_event_id is not None:
+                missed = [frame for event_id, frame in self._recent if event_id > last_event_id]
+            hello = encode(None, "hello", {"data_version": data_loader.data_version()})
+            self._start_watcher()
+        return [hello] + missed
+
+    def unsubscribe(self, deliver):
+        with self._lock:
+            self._subscribers.discard(deliver)
+
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+    def _start_watcher(self):
+        if self._watcher is None or not self._watcher.is_alive():
+            self._watcher = threading.Thread(target=self._watch_data, name="metropal-data-watch", daemon=True)
+            self._watcher.start()
+
+    def _watch_data(self):
+        """Publishes data_version when the data files change, while anyone is listening"""
+        version = data_loader.data_version()
+        while True:
+            time.sleep(POLL_SECONDS)
+            with self._lock:
+                if not self._subscribers:
+                    self._watcher = None
+                    return
+            current = data_loader.data_version()
+            if current != version:
+                version = current
+                self.publish("data_version", {"data_version": current})
+
+bus = EventBus()
+
+def publish(name, data):
+    return bus.publish(name, data)
+
+def parse_last_event_id(value):
+    try:
+        return int(value) if value else None
+    except ValueError:
+        return None
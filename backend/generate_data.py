@@ -1,8 +1,13 @@
-import pandas as pd
+import argparse
 import numpy as np
-from datetime import datetime, timedelta
-import random
+from datetime import datetime, date
 import json
+import time
+
+try:
+    import orjson  # optional, several times faster for the JSON writers
+except ImportError:
+    orjson = None
 
 CONFIG = {
     "num_trains": 25,
@@ -20,112 +25,216 @@ CONFIG = {
     }
 }
 
-random.seed(CONFIG["seed"])
-np.random.seed(CONFIG["seed"])
-
-def get_health_and_certs(mileage_since_maint, maint_interval, current_date):
-    degradation_factor = min(1.0, mileage_since_maint / (maint_interval * 1.5))
-    vibration_level = max(0.1, 1.0 - degradation_factor - random.uniform(0, 0.2))
-    brake_pad_health = max(0.1, 1.0 - degradation_factor - random.uniform(0, 0.15))
-    hvac_health = max(0.1, 1.0 - degradation_factor - random.uniform(0, 0.1))
-    fitness_score = min(vibration_level, brake_pad_health, hvac_health)
-    rs_expiry_days = max(1, np.random.randint(1, 90) - int(degradation_factor * 30))
-    rs_cert_expiry = current_date + timedelta(days=rs_expiry_days)
-    sig_cert_expiry = current_date + timedelta(days=np.random.randint(5, 120))
-    telecom_cert_expiry = current_date + timedelta(days=np.random.randint(5, 180))
-    return fitness_score, rs_cert_expiry, sig_cert_expiry, telecom_cert_expiry
-
-def get_job_card(mileage_since_maint, maint_interval):
-    if mileage_since_maint > maint_interval:
-        return "Open", random.choice(["Major Repair", "Critical Failure"])
-    if random.random() < 0.15:
-        return "Open", "Minor Defect"
-    return "Closed", "Routine"
-
-def update_branding_status(current_date, branding_start, branding_end, contract_length):
-    if current_date > branding_end:
-        branding_start = current_date
-        branding_end = branding_start + timedelta(days=contract_length)
-        branding_active = 1
-        branding_company = random.choice(CONFIG["branding_companies"])
-    else:
-        branding_active = 1 if branding_start <= current_date <= branding_end else 0
-        branding_company = None if not branding_active else random.choice(CONFIG["branding_companies"])
-    days_remaining = max(0, (branding_end - current_date).days)
-    branding_priority = 1 / (1 + days_remaining)
-    return branding_active, branding_start, branding_end, branding_priority, branding_company
+ACTIONS = np.array(["Revenue Service", "Standby (Cleaning)", "Maintenance (IBL)"], dtype=object)
+SERVICE, CLEANING, MAINTENANCE = 0, 1, 2
+JOB_TYPES = np.array(["Routine", "Minor Defect", "Major Repair", "Critical Failure"], dtype=object)
+
+DATE_FIELDS = (
+    "last_maintenance_date", "last_cleaning_date", "rs_cert_expiry", "sig_cert_expiry",
+    "telecom_cert_expiry", "branding_start_date",
+)
+
+class _IsoDates:
+    """Caches ordinal -> 'YYYY-MM-DD' so each calendar day is formatted once"""
+
+    def __init__(self):
+        self._cache = {}
+
+    def __call__(self, ordinals):
+        cache = self._cache
+        out = []
+        for o in ordinals:
+            s = cache.get(o)
+            if s is None:
+                s = cache[o] = date.fromordinal(o).isoformat()
+            out.append(s)
+        return out
 
 # --- Main Data Generation ---
-all_data_by_date = {}
-train_states = []
-for i in range(CONFIG["num_trains"]):
-    mileage_since_maintenance = np.random.randint(1000, CONFIG["maintenance_interval_mileage"] + 5000)
-    avg_daily_mileage = sum(CONFIG["daily_mileage_range"]) / 2
-    days_since_maintenance = int(mileage_since_maintenance / avg_daily_mileage)
-    train_states.append({
-        "train_id": f"KMRL-T{str(i+1).zfill(2)}",
-        "total_mileage": 100000 + (i * 2000) + np.random.randint(0, 30000),
-        "mileage_since_maintenance": mileage_since_maintenance,
-        "last_cleaning_date": CONFIG["start_date"] - timedelta(days=np.random.randint(0, 10)),
-        "last_maintenance_date": CONFIG["start_date"] - timedelta(days=days_since_maintenance),
-        "branding_start_date": CONFIG["start_date"] - timedelta(days=np.random.randint(1, 120)),
-    })
-
-for day in range(CONFIG["simulation_days"]):
-    current_date = CONFIG["start_date"] + timedelta(days=day)
-    date_key = current_date.strftime('%Y-%m-%d')
-    daily_records = []
-    
-    for train in train_states:
-        fitness_score, rs_cert, sig_cert, telecom_cert = get_health_and_certs(
-            train["mileage_since_maintenance"], CONFIG["maintenance_interval_mileage"], current_date
-        )
-        job_card_status, maint_type = get_job_card(
-            train["mileage_since_maintenance"], CONFIG["maintenance_interval_mileage"]
-        )
-        maint_due = train["mileage_since_maintenance"] > CONFIG["maintenance_interval_mileage"]
-        needs_cleaning = (current_date - train["last_cleaning_date"]).days > 7
-        
-        branding_end = train["branding_start_date"] + timedelta(days=CONFIG["contract_duration_days"])
-        brand_active, new_brand_start, _, brand_priority, brand_company = update_branding_status(
-            current_date, train["branding_start_date"], branding_end, CONFIG["contract_duration_days"]
+def iter_days(num_trains=None, simulation_days=None, seed=None, start_date=None):
+    """Simulates the whole fleet one day at a time with NumPy array operations.
+       Yields (date_key, columns) where columns maps each record field to a
+       per-train array (dates as ordinals); only one day is alive at a time."""
+    num_trains = CONFIG["num_trains"] if num_trains is None else num_trains
+    simulation_days = CONFIG["simulation_days"] if simulation_days is None else simulation_days
+    seed = CONFIG["seed"] if seed is None else seed
+    start_date = CONFIG["start_date"] if start_date is None else start_date
+    start = start_date.toordinal()
+    rng = np.random.default_rng(seed)
+
+    interval = CONFIG["maintenance_interval_mileage"]
+    contract = CONFIG["contract_duration_days"]
+    low, high = CONFIG["daily_mileage_range"]
+    companies = np.array(CONFIG["branding_companies"], dtype=object)
+    bays = {k: np.array(v, dtype=object) for k, v in CONFIG["stabling_bays"].items()}
+    n = num_trains
+
+    # --- Initial fleet state ---
+    train_ids = np.array([f"KMRL-T{str(i + 1).zfill(2)}" for i in range(n)], dtype=object)
+    mileage_since = rng.integers(1000, interval + 5000, n)
+    total_mileage = 100000 + np.arange(n) * 2000 + rng.integers(0, 30000, n)
+    last_maintenance = start - (mileage_since / ((low + high) / 2)).astype(np.int64)
+    last_cleaning = start - rng.integers(0, 10, n)
+    branding_start = start - rng.integers(1, 120, n)
+
+    for day in range(simulation_days):
+        today = start + day
+
+        # health degrades with mileage since the last maintenance
+        degradation = np.minimum(1.0, mileage_since / (interval * 1.5))
+        noise = rng.random((3, n)) * np.array([[0.2], [0.15], [0.1]])  # vibration, brakes, HVAC
+        fitness = np.maximum(0.1, 1.0 - degradation - noise).min(axis=0)
+        rs_cert = today + np.maximum(1, rng.integers(1, 90, n) - (degradation * 30).astype(np.int64))
+        sig_cert = today + rng.integers(5, 120, n)
+        telecom_cert = today + rng.integers(5, 180, n)
+
+        # job cards: overdue trains get a major one, others a random minor defect
+        maintenance_due = mileage_since > interval
+        minor = ~maintenance_due & (rng.random(n) < 0.15)
+        job_open = maintenance_due | minor
+        job_type = np.where(maintenance_due, 2 + rng.integers(0, 2, n), np.where(minor, 1, 0))
+        needs_cleaning = (today - last_cleaning) > 7
+
+        # branding contracts renew once they run out
+        renew = today > branding_start + contract
+        branding_start = np.where(renew, today, branding_start)
+        branding_end = branding_start + contract
+        branding_active = renew | ((branding_start <= today) & (today <= branding_end))
+        branding_priority = 1 / (1 + np.maximum(0, branding_end - today))
+        company = np.where(branding_active, companies[rng.integers(0, len(companies), n)], None)
+
+        action = np.where(job_open, MAINTENANCE, np.where(needs_cleaning, CLEANING, SERVICE))
+        bay = np.where(
+            action == MAINTENANCE, bays["IBL"][rng.integers(0, len(bays["IBL"]), n)],
+            np.where(action == CLEANING, bays["CBL"][rng.integers(0, len(bays["CBL"]), n)],
+                     bays["SBL"][rng.integers(0, len(bays["SBL"]), n)])
         )
 
-        rec_action = "Maintenance (IBL)" if job_card_status == "Open" or maint_due else \
-                     "Standby (Cleaning)" if needs_cleaning else "Revenue Service"
-
-        bay_id = random.choice(CONFIG["stabling_bays"]["IBL"]) if rec_action == "Maintenance (IBL)" else \
-                 random.choice(CONFIG["stabling_bays"]["CBL"]) if rec_action == "Standby (Cleaning)" else \
-                 random.choice(CONFIG["stabling_bays"]["SBL"])
-
-        record = {
-            "train_id": train["train_id"], "fitness_score": round(fitness_score, 3),
-            "last_maintenance_date": train["last_maintenance_date"].strftime('%Y-%m-%d'),
-            "maintenance_due": maint_due, "job_card_status": job_card_status, "maintenance_type": maint_type,
-            "mileage_since_maintenance": train["mileage_since_maintenance"], "total_mileage": train["total_mileage"],
-            "last_cleaning_date": train["last_cleaning_date"].strftime('%Y-%m-%d'), "needs_cleaning": needs_cleaning,
-            "rs_cert_expiry": rs_cert.strftime('%Y-%m-%d'), "sig_cert_expiry": sig_cert.strftime('%Y-%m-%d'),
-            "telecom_cert_expiry": telecom_cert.strftime('%Y-%m-%d'), "branding_active": brand_active,
-            "branding_start_date": new_brand_start.strftime('%Y-%m-%d'), "branding_priority": round(brand_priority, 3),
-            "branding_company": brand_company, "recommended_action": rec_action, "stabling_bay_id": bay_id
+        yield date.fromordinal(today).isoformat(), {
+            "train_id": train_ids,
+            "fitness_score": np.round(fitness, 3),
+            "last_maintenance_date": last_maintenance,
+            "maintenance_due": maintenance_due,
+            "job_card_status": np.where(job_open, "Open", "Closed").astype(object),
+            "maintenance_type": JOB_TYPES[job_type],
+            "mileage_since_maintenance": mileage_since,
+            "total_mileage": total_mileage,
+            "last_cleaning_date": last_cleaning,
+            "needs_cleaning": needs_cleaning,
+            "rs_cert_expiry": rs_cert,
+            "sig_cert_expiry": sig_cert,
+            "telecom_cert_expiry": telecom_cert,
+            "branding_active": branding_active.astype(np.int64),
+            "branding_start_date": branding_start,
+            "branding_priority": np.round(branding_priority, 3),
+            "branding_company": company,
+            "recommended_action": ACTIONS[action],
+            "stabling_bay_id": bay
         }
-        daily_records.append(record)
-        
-        if rec_action == "Revenue Service":
-            train["total_mileage"] += np.random.randint(*CONFIG["daily_mileage_range"])
-            train["mileage_since_maintenance"] += np.random.randint(*CONFIG["daily_mileage_range"])
-        elif rec_action == "Maintenance (IBL)":
-            train["mileage_since_maintenance"] = 0
-            train["last_maintenance_date"] = current_date
-        elif rec_action == "Standby (Cleaning)":
-            train["last_cleaning_date"] = current_date
-        train["branding_start_date"] = new_brand_start
-        
-    all_data_by_date[date_key] = daily_records
-
-output_filename = "full_train_data.json"
-output_path = f"../data/{output_filename}" 
-with open(output_path, 'w') as f:
-    json.dump(all_data_by_date, f, indent=2)
-
-print(f"\n✅ Successfully generated and saved data to '{output_path}'")
\ No newline at end of file
+
+        # --- Carry state into the next day (new arrays, the yielded ones stay valid) ---
+        in_service = action == SERVICE
+        total_mileage = total_mileage + np.where(in_service, rng.integers(low, high, n), 0)
+        mileage_since = mileage_since + np.where(in_service, rng.integers(low, high, n), 0)
+        in_maintenance = action == MAINTENANCE
+        mileage_since = np.where(in_maintenance, 0, mileage_since)
+        last_maintenance = np.where(in_maintenance, today, last_maintenance)
+        last_cleaning = np.where(action == CLEANING, today, last_cleaning)
+
+def iter_records(num_trains=None, simulation_days=None, seed=None, start_date=None):
+    """Like iter_days but yields (date_key, [record dicts]) in the full_train_data.json shape"""
+    iso = _IsoDates()
+    for date_key, cols in iter_days(num_trains, simulation_days, seed, start_date):
+        fields = list(cols)
+        values = [iso(cols[f].tolist()) if f in DATE_FIELDS else cols[f].tolist() for f in fields]
+        yield date_key, [dict(zip(fields, row)) for row in zip(*values)]
+
+def generate(num_trains=None, simulation_days=None, seed=None, start_date=None):
+    """Returns {date: [train records]} for the whole simulation (holds it all in memory)"""
+    return dict(iter_records(num_trains, simulation_days, seed, start_date))
+
+# --- Writers: each streams day by day ---
+def _dumps(value):
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, separators=(",", ":")).encode("utf-8")
+
+def write_json(days, path):
+    """{date: [records]} like data/full_train_data.json, written one date at a time"""
+    with open(path, "wb") as f:
+        f.write(b"{")
+        for k, (date_key, records) in enumerate(days):
+            f.write(b",\n" if k else b"\n")
+            f.write(_dumps(date_key) + b": " + _dumps(records))
+        f.write(b"\n}\n")
+
+def write_jsonl(days, path):
+    """One {"date": ..., "trains": [...]} object per line"""
+    with open(path, "wb") as f:
+        for date_key, records in days:
+            f.write(_dumps({"date": date_key, "trains": records}) + b"\n")
+
+def write_sqlite(days, path):
+    """Upserts straight into a SQLite database with the TrainInventory schema"""
+    from import_json import import_records
+    import_records(days, path, batch_size=20000, log=lambda msg: None)
+
+def write_columnar(days, path):
+    """Memory-mapped columnar snapshot directory (see columnar.py)"""
+    from columnar import write_snapshot
+    write_snapshot(days, path)
+
+def write_parquet(column_days, path):
+    """Columnar Parquet file, one row group per day (needs pyarrow)"""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise SystemExit("Parquet output needs pyarrow: pip install pyarrow")
+    epoch = date(1970, 1, 1).toordinal()
+    writer = None
+    try:
+        for date_key, cols in column_days:
+            arrays = {"date": pa.array([date_key] * len(cols["train_id"]), pa.string())}
+            for field, values in cols.items():
+                if field in DATE_FIELDS:
+                    arrays[field] = pa.array(values - epoch, pa.int32()).cast(pa.date32())
+                elif values.dtype == object:
+                    arrays[field] = pa.array(values.tolist(), pa.string())
+                else:
+                    arrays[field] = pa.array(values)
+            table = pa.table(arrays)
+            if writer is None:
+                writer = pq.ParquetWriter(path, table.schema)
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate synthetic fleet data")
+    parser.add_argument("--trains", type=int, default=CONFIG["num_trains"])
+    parser.add_argument("--days", type=int, default=CONFIG["simulation_days"])
+    parser.add_argument("--seed", type=int, default=CONFIG["seed"])
+    parser.add_argument("--start-date", type=lambda s: datetime.strptime(s, "%Y-%m-%d"),
+                        default=CONFIG["start_date"], help="YYYY-MM-DD")
+    parser.add_argument("--format", choices=["json", "jsonl", "sqlite", "columnar", "parquet"], default="json")
+    parser.add_argument("--output", default="../data/full_train_data.json")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    sim = (args.trains, args.days, args.seed, args.start_date)
+    output_path = args.output
+    if args.format == "parquet":
+        write_parquet(iter_days(*sim), output_path)
+    else:
+        writer = {"json": write_json, "jsonl": write_jsonl, "sqlite": write_sqlite,
+                  "columnar": write_columnar}[args.format]
+        writer(iter_records(*sim), output_path)
+
+    print(f"\n✅ Successfully generated {args.trains * args.days:,} train-days "
+          f"({args.trains} trains x {args.days} days) to '{output_path}' "
+          f"in {time.perf_counter() - started:.1f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+"""gunicorn settings for a multi-worker deployment:
+
+    gunicorn -c gunicorn.conf.py
+
+The app is created in the master with the data snapshot loaded and frozen
+(app.create_app(preload=True)), then forked, so workers start from one copy of the
+parsed fleet, maintenance and requirements data instead of parsing their own.
+Those are Python objects shared copy-on-write: pages a worker touches (reference
+counts included) become private to it over time. For a fleet that stays shared,
+serve it from the columnar snapshot (columnar.py), which is memory-mapped read-only:
+
+    METROPAL_DATA_BACKEND=columnar gunicorn -c gunicorn.conf.py
+
+After the data files change, reload with
+
+    kill -HUP <master pid>
+
+The master re-reads and re-freezes the snapshot, then replaces the workers with
+ones forked from it. Until then every worker keeps serving the old snapshot.
+
+Each open /api/stream connection holds one of a worker's METROPAL_THREADS threads
+until the client goes away, so a few dashboards can starve the API. Serve the event
+stream through asgi.py instead (uvicorn asgi:app), which keeps open streams on its
+event loop, e.g. by routing /api/stream to it at the proxy. Events are per worker
+process either way: the dashboard re-fetches /api/conflicts after an optimization
+rather than relying on the stream alone.
+"""
+import os
+
+wsgi_app = "app:create_app(preload=True)"
+preload_app = True
+bind = os.environ.get("METROPAL_BIND", "0.0.0.0:5000")
+workers = int(os.environ.get("METROPAL_WORKERS", (os.cpu_count() or 1) * 2 + 1))
+worker_class = "gthread"
+threads = int(os.environ.get("METROPAL_THREADS", 4))
+# the NDJSON batch and /api/stream hold their connection open
+timeout = int(os.environ.get("METROPAL_WORKER_TIMEOUT", 120))
+
+def on_reload(server):
+    import data_loader
+    data_loader.reload()
+    server.log.info("Data snapshot reloaded, version %s", data_loader.data_version())
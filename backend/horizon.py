@@ -0,0 +1,123 @@
+"""Rolling-horizon planning: a plan for each of several consecutive days, where each
+day starts from the fleet state the previous day's plan leaves behind.
+
+State is carried forward the way generate_data.py simulates it:
+
+  Service  runs the day's mileage; fitness wears down with it, and a train past
+           the maintenance interval gets an open job card
+  Standby  is cleaned if it needed cleaning
+  IBL      trains with open job cards or maintenance due are maintained: mileage
+           since maintenance resets and the job card closes
+
+One PlanSession is kept for the whole horizon. Each new day applies updates for the
+trains whose state changed and moves the session's date, which every maintenance age
+is measured from, so the day is rescored in one vectorised pass.
+"""
+import datetime
+from data_loader import load_full_train_data, today_requirement
+from conflicts import detect_conflicts
+from incremental import PlanSession
+from generate_data import CONFIG
+import live_updates
+
+MAINTENANCE_INTERVAL_KM = CONFIG["maintenance_interval_mileage"]
+DAILY_KM = sum(CONFIG["daily_mileage_range"]) // 2
+CLEANING_INTERVAL_DAYS = 7
+RESTORED_FITNESS = 0.9  # fitness right after maintenance, before any wear
+MAX_HORIZON_DAYS = 90
+
+def _requirements_for(date_str, requirements):
+    """(service, standby) for one day: the request's numbers, else daily_requirements.json"""
+    if requirements:
+        return requirements.get("service", 15), requirements.get("standby", 5)
+    try:
+        req = today_requirement(date_str)
+        return req.get("service_trains_required", 15), req.get("standby_trains_required", 5)
+    except Exception:
+        return 15, 5
+
+def _days_between(earlier, later):
+    try:
+        return (datetime.date.fromisoformat(later) - datetime.date.fromisoformat(earlier)).days
+    except (TypeError, ValueError):
+        return None
+
+def carry_forward(trains, assignment, day, next_day, daily_km=DAILY_KM):
+    """Updates [{train_id, field: value}] for the state each train is in on next_day,
+       given the plan it followed on day. Trains whose state doesn't change are left out."""
+    wear = daily_km / (MAINTENANCE_INTERVAL_KM * 1.5)  # generate_data's degradation per km
+    updates = []
+    for t in trains:
+        tid = t["train_id"]
+        assigned = assignment.get(tid)
+        u = {}
+        if assigned == "Service":
+            mileage = (t.get("mileage_since_maintenance") or 0) + daily_km
+            u["mileage_since_maintenance"] = mileage
+            u["total_mileage"] = (t.get("total_mileage") or 0) + daily_km
+            u["fitness_score"] = round(max(0.1, (t.get("fitness_score") or 0) - wear), 3)
+            if mileage > MAINTENANCE_INTERVAL_KM and not t.get("maintenance_due"):
+                u.update(maintenance_due=True, job_card_status="Open", maintenance_type="Major Repair",
+                         recommended_action="Maintenance (IBL)")
+        elif assigned == "Standby" and t.get("needs_cleaning"):
+            u.update(last_cleaning_date=day, needs_cleaning=False)
+        elif assigned == "IBL" and (
+            t.get("recommended_action") == "Maintenance (IBL)" or
+            t.get("job_card_status") == "Open" or t.get("maintenance_due")
+        ):
+            u.update(mileage_since_maintenance=0, last_maintenance_date=day, maintenance_due=False,
+                     job_card_status="Closed", maintenance_type="Routine",
+                     recommended_action="Revenue Service",
+                     fitness_score=max(t.get("fitness_score") or 0, RESTORED_FITNESS))
+
+        last_cleaning = u.get("last_cleaning_date", t.get("last_cleaning_date"))
+        age = _days_between(last_cleaning, next_day)
+        needs_cleaning = age is not None and age > CLEANING_INTERVAL_DAYS
+        if needs_cleaning != bool(u.get("needs_cleaning", t.get("needs_cleaning"))):
+            u["needs_cleaning"] = needs_cleaning
+        if u:
+            u["train_id"] = tid
+            updates.append(u)
+    return updates
+
+def plan_horizon(weights, start_date=None, days=7, requirements=None, daily_km=DAILY_KM, explain=True):
+    """Plans days consecutive dates from start_date (default today). Each day's result has the
+       optimize() shape plus "changed": trains whose assignment differs from the day before."""
+    start = datetime.date.fromisoformat(start_date) if start_date else datetime.date.today()
+    dates = [(start + datetime.timedelta(days=k)).isoformat() for k in range(days)]
+    trains = live_updates.apply_to(load_full_train_data(date=dates[0]), dates[0])
+    if not trains:
+        return {"error": f"No data available for date {dates[0]}"}
+
+    service, standby = _requirements_for(dates[0], requirements)
+    session = PlanSession(weights, dates[0], {"service": service, "standby": standby}, trains)
+    results = []
+    previous = None
+    for k, d in enumerate(dates):
+        if k:
+            session.advance(d, carry_forward(session.trains, previous, dates[k - 1], d, daily_km))
+            session.set_requirements(*_requirements_for(d, requirements))
+        plan = session.plan(explain)
+        assignment = {p["train_id"]: p["assignment"] for p in plan}
+        by_id = {t["train_id"]: t for t in session.trains}
+        conflicts = detect_conflicts(plan, by_id, weights)
+        summary = session.summary()
+        service_scores = [p["score"] for p in plan if p["assignment"] == "Service"]
+        summary.update(
+            conflicts_found=len(conflicts),
+            avg_service_score=round(sum(service_scores) / max(1, len(service_scores)), 3)
+        )
+        results.append({
+            "date": d,
+            "service_needed": session.service_needed,
+            "standby_needed": session.standby_needed,
+            "plan": plan,
+            "conflicts": conflicts,
+            "changed": [] if previous is None else [
+                {"train_id": tid, "from": previous.get(tid), "to": a}
+                for tid, a in assignment.items() if previous.get(tid) != a
+            ],
+            "summary": summary
+        })
+        previous = assignment
+    return {"start_date": dates[0], "days": results}
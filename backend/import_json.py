@@ -1,44 +1,151 @@
-import json
+import argparse, json, os, time
 from datetime import datetime
+from functools import lru_cache
 from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
 from models import Base, TrainInventory
+from repository import DB_PATH
 
-engine = create_engine('sqlite:///metro.db')
-Base.metadata.create_all(engine)
-Session = sessionmaker(bind=engine)
-session = Session()
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_SOURCE = os.path.join(BASE_DIR, "data", "full_train_data.json")
+
+DATE_FIELDS = (
+    "last_maintenance_date", "last_cleaning_date", "rs_cert_expiry", "sig_cert_expiry",
+    "telecom_cert_expiry", "branding_start_date",
+)
+FIELDS = (
+    "train_id", "fitness_score", "last_maintenance_date", "maintenance_due", "job_card_status",
+    "maintenance_type", "mileage_since_maintenance", "total_mileage", "last_cleaning_date",
+    "needs_cleaning", "rs_cert_expiry", "sig_cert_expiry", "telecom_cert_expiry", "branding_active",
+    "branding_start_date", "branding_priority", "branding_company", "recommended_action",
+    "stabling_bay_id",
+)
 
 def parse_date(d):
     return datetime.strptime(d, "%Y-%m-%d").date() if d else None
 
-with open('C:/Users/Anagha/Documents/GitHub/MetroPal/data/full_train_data.json', 'r') as f:
-    data = json.load(f)
-
-for date_str, trains in data.items():
-    for train in trains:
-        obj = TrainInventory(
-            date=parse_date(date_str),
-            train_id=train.get("train_id"),
-            fitness_score=train.get("fitness_score"),
-            last_maintenance_date=parse_date(train.get("last_maintenance_date")),
-            maintenance_due=train.get("maintenance_due"),
-            job_card_status=train.get("job_card_status"),
-            maintenance_type=train.get("maintenance_type"),
-            mileage_since_maintenance=train.get("mileage_since_maintenance"),
-            total_mileage=train.get("total_mileage"),
-            last_cleaning_date=parse_date(train.get("last_cleaning_date")),
-            needs_cleaning=train.get("needs_cleaning"),
-            rs_cert_expiry=parse_date(train.get("rs_cert_expiry")),
-            sig_cert_expiry=parse_date(train.get("sig_cert_expiry")),
-            telecom_cert_expiry=parse_date(train.get("telecom_cert_expiry")),
-            branding_active=train.get("branding_active"),
-            branding_start_date=parse_date(train.get("branding_start_date")),
-            branding_priority=train.get("branding_priority"),
-            branding_company=train.get("branding_company"),
-            recommended_action=train.get("recommended_action"),
-            stabling_bay_id=train.get("stabling_bay_id"),
-        )
-        session.add(obj)
-
-session.commit()
+def iter_dated_records(path, chunk_size=1 << 20):
+    """Streams (date_str, trains) pairs out of a {date: [trains]} JSON file.
+       Uses ijson when installed, otherwise decodes one date's list at a time
+       from a sliding buffer, so memory stays bounded by the largest day."""
+    try:
+        import ijson
+    except ImportError:
+        ijson = None
+    if ijson is not None:
+        with open(path, "rb") as f:
+            yield from ijson.kvitems(f, "", use_float=True)
+        return
+
+    decoder = json.JSONDecoder()
+    with open(path, "r", encoding="utf-8") as f:
+        buf = ""
+        pos = 0
+        eof = False
+
+        def fill():
+            nonlocal buf, pos, eof
+            chunk = f.read(chunk_size)
+            if not chunk:
+                eof = True
+            buf = buf[pos:] + chunk
+            pos = 0
+
+        def skip(chars):
+            # advances past whitespace and the given separators, reading more as needed
+            nonlocal pos
+            while True:
+                while pos < len(buf) and (buf[pos].isspace() or buf[pos] in chars):
+                    pos += 1
+                if pos < len(buf) or eof:
+                    return
+                fill()
+
+        def decode():
+            nonlocal pos
+            while True:
+                try:
+                    value, end = decoder.raw_decode(buf, pos)
+                    # a number at the end of the buffer may continue in the next chunk
+                    if end < len(buf) or eof:
+                        pos = end
+                        return value
+                except ValueError:
+                    if eof:
+                        raise
+                fill()
+
+        skip("{")
+        while True:
+            skip(",")
+            if pos < len(buf) and buf[pos] == "}" or (eof and pos >= len(buf)):
+                return
+            key = decode()
+            skip(":")
+            yield key, decode()
+
+@lru_cache(maxsize=1 << 16)
+def _iso_date(d):
+    # SQLite stores Date columns as YYYY-MM-DD text, so valid strings pass straight through
+    return parse_date(d).isoformat() if d else None
+
+def to_row(date_str, train):
+    """Positional parameters for UPSERT_SQL"""
+    return (_iso_date(date_str),) + tuple(
+        _iso_date(train.get(f)) if f in DATE_FIELDS else train.get(f) for f in FIELDS
+    )
+
+UPSERT_SQL = (
+    f"INSERT INTO {TrainInventory.__tablename__} (date, {', '.join(FIELDS)}) "
+    f"VALUES ({', '.join('?' * (len(FIELDS) + 1))}) "
+    f"ON CONFLICT (date, train_id) DO UPDATE SET "
+    + ", ".join(f"{f} = excluded.{f}" for f in FIELDS if f != "train_id")
+)
+
+def import_records(dated_records, db_path, batch_size=5000, log=print):
+    """Upserts (date_str, trains) pairs into db_path in batched transactions.
+       Safe to rerun: existing (date, train_id) rows are updated in place. Returns (rows, seconds)."""
+    engine = create_engine(f"sqlite:///{db_path}")
+    Base.metadata.create_all(engine)
+    for index in TrainInventory.__table__.indexes:
+        index.create(engine, checkfirst=True)
+
+    started = time.perf_counter()
+    total = 0
+    batch = []
+
+    def flush():
+        nonlocal total
+        if not batch:
+            return
+        with engine.begin() as conn:
+            conn.exec_driver_sql(UPSERT_SQL, batch)  # executemany on the raw cursor
+        total += len(batch)
+        batch.clear()
+
+    for date_str, trains in dated_records:
+        batch.extend(to_row(date_str, t) for t in trains)
+        if len(batch) >= batch_size:
+            flush()
+            elapsed = time.perf_counter() - started
+            log(f"  {total:,} rows ({total / max(elapsed, 1e-9):,.0f} rows/sec) up to {date_str}")
+    flush()
+    engine.dispose()
+    return total, time.perf_counter() - started
+
+def import_file(source, db_path, batch_size=5000, log=print):
+    """Streams a {date: [trains]} JSON file into db_path, see import_records"""
+    return import_records(iter_dated_records(source), db_path, batch_size, log)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import dated fleet records from JSON into SQLite")
+    parser.add_argument("--source", default=DEFAULT_SOURCE, help="full_train_data.json style file")
+    parser.add_argument("--db", default=DB_PATH, help="SQLite database file")
+    parser.add_argument("--batch-size", type=int, default=5000, help="rows per transaction")
+    args = parser.parse_args(argv)
+
+    rows, seconds = import_file(args.source, args.db, args.batch_size)
+    print(f"Imported {rows:,} rows into {args.db} in {seconds:.2f}s "
+          f"({rows / max(seconds, 1e-9):,.0f} rows/sec)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,335 @@
+import datetime, math, threading
+from bisect import bisect_left, insort
+from collections import OrderedDict
+from data_loader import load_full_train_data, data_version
+from optimizer import _fleet_columns, _normalizers, _score_columns, _reasons, _resolve_requirements
+from conflicts import detect_conflicts
+from records import TrainRecord
+import live_updates
+
+MAX_SESSIONS = 32
+
+# how update values are checked before they touch a session
+NUMERIC_FIELDS = {
+    "fitness_score": float, "branding_priority": float, "mileage_since_maintenance": int,
+    "total_mileage": int, "km_since_last_maintenance": int, "branding_active": int
+}
+BOOL_FIELDS = ("maintenance_due", "needs_cleaning")
+DATE_FIELDS = (
+    "last_maintenance_date", "last_cleaning_date", "rs_cert_expiry", "sig_cert_expiry",
+    "telecom_cert_expiry", "branding_start_date"
+)
+
+class UpdateError(ValueError):
+    pass
+
+def _checked(update):
+    """An update's field values (without train_id), converted to the types the records hold.
+       Raises UpdateError for a value that can't be applied."""
+    tid = update.get("train_id")
+    out = {}
+    for key, value in update.items():
+        if key == "train_id":
+            continue
+        if key in NUMERIC_FIELDS:
+            try:
+                if isinstance(value, bool) or value is None:
+                    raise ValueError
+                number = float(value)
+                if not math.isfinite(number):
+                    raise ValueError
+            except (TypeError, ValueError):
+                raise UpdateError(f"{tid}: {key} must be a number, got {value!r}")
+            if NUMERIC_FIELDS[key] is int:
+                if not number.is_integer():
+                    raise UpdateError(f"{tid}: {key} must be a whole number, got {value!r}")
+                number = int(number)
+            value = number
+        elif key in BOOL_FIELDS:
+            if value not in (True, False):
+                raise UpdateError(f"{tid}: {key} must be true or false, got {value!r}")
+            value = bool(value)
+        elif key in DATE_FIELDS:
+            if value is not None:
+                try:
+                    datetime.date.fromisoformat(value)
+                    if len(value) != 10:
+                        raise ValueError
+                except (TypeError, ValueError):
+                    raise UpdateError(f"{tid}: {key} must be a YYYY-MM-DD date, got {value!r}")
+        elif value is not None and not isinstance(value, str):
+            raise UpdateError(f"{tid}: {key} must be a string, got {value!r}")
+        out[key] = value
+    return out
+
+def _checked_options(weights, requirements):
+    """Raises UpdateError unless weights map names to numbers and requirements to whole numbers"""
+    if not isinstance(weights, dict) or not all(
+        isinstance(v, (int, float)) and not isinstance(v, bool) for v in weights.values()
+    ):
+        raise UpdateError("weights must be an object of numbers")
+    if requirements is not None and (not isinstance(requirements, dict) or not all(
+        isinstance(v, int) and not isinstance(v, bool) for v in requirements.values()
+    )):
+        raise UpdateError("requirements must be an object of whole numbers")
+
+class PlanSession:
+    """A day's plan kept live so single-train updates only rescore and reposition those trains.
+
+       Eligible trains are held in a list sorted by (-score, fleet position), the same order
+       optimize() ranks them in, so a train's assignment follows from its rank:
+       Service for the first service_needed, then Standby, then IBL."""
+
+    def __init__(self, weights, date_str=None, requirements=None, trains=None):
+        self.weights = weights
+        self.date = date_str or datetime.date.today().isoformat()
+        self.service_needed, self.standby_needed = _resolve_requirements(date_str, requirements)
+        # position in the date's live update log this session has applied; None for a fleet
+        # passed in, which is planned as given
+        self.applied = None
+        if trains is None:
+            trains = load_full_train_data(date=date_str) if date_str else load_full_train_data()
+            trains, self.applied = live_updates.overlay(trains, self.date)
+        # private copies: updates must not leak into the shared data cache
+        self.trains = [TrainRecord.from_dict(t) for t in trains]
+        self.index = {}
+        for i, t in enumerate(self.trains):
+            self.index.setdefault(t["train_id"], i)
+        self.lock = threading.RLock()
+        self._rebuild()
+
+    # --- ranking ---
+
+    def _rebuild(self, order=None):
+        """Rescores the whole fleet. order lists every fleet position in the order to sort them
+           from; the previous ranking makes the sort close to linear when little moved."""
+        self.cols = _fleet_columns(self.trains, self.date)
+        self.norms = _normalizers(self.cols)
+        self.scores = _score_columns(self.cols, self.weights, self.norms)
+        maintenance = self.cols["maintenance"]
+        scores = self.scores.tolist()
+        order = range(len(scores)) if order is None else order
+        self.ranking = sorted((-scores[i], i) for i in order if not maintenance[i])
+        self.assignment = {self.trains[i]["train_id"]: self._assignment_of(i) for i in self.index.values()}
+
+    def _key(self, i):
+        return (-float(self.scores[i]), i)
+
+    def _assignment_at(self, rank):
+        if rank < self.service_needed:
+            return "Service"
+        if rank < self.service_needed + self.standby_needed:
+            return "Standby"
+        return "IBL"
+
+    def _assignment_of(self, i):
+        if self.cols["maintenance"][i]:
+            return "IBL"
+        return self._assignment_at(bisect_left(self.ranking, self._key(i)))
+
+    def _boundary_trains(self, reach):
+        """Fleet positions ranked within `reach` of the Service/Standby and Standby/IBL cut-offs"""
+        out = set()
+        for b in (self.service_needed, self.service_needed + self.standby_needed):
+            lo, hi = max(0, b - reach - 1), min(len(self.ranking), b + reach + 1)
+            out.update(i for _, i in self.ranking[lo:hi])
+        return out
+
+    # --- updates ---
+
+    def sync(self):
+        """Applies live updates other sessions or workers logged since this session was built"""
+        if self.applied is None:
+            return
+        with self.lock:
+            pending, position = live_updates.updates(self.date, self.applied)
+            if pending:
+                self.apply(pending, report=False)
+            self.applied = position
+
+    def apply(self, updates, report=True):
+        """Applies [{train_id, field: value, ...}] and returns what changed.
+           report=False only updates the ranking and skips building the changed entries.
+           Every value is checked (UpdateError) and the changed trains' columns are built
+           on copies before the session itself is touched."""
+        with self.lock:
+            staged, unknown = {}, []
+            for u in updates:
+                i = self.index.get(u.get("train_id"))
+                if i is None:
+                    unknown.append(u.get("train_id"))
+                    continue
+                values = _checked(u)
+                if i not in staged:
+                    staged[i] = self.trains[i].copy()
+                staged[i].update(values)
+            changed = list(staged)
+            fresh = _fleet_columns([staged[i] for i in changed], self.date) if changed else None
+            full_rescore = False
+
+            if changed:
+                candidates = set(changed) | self._boundary_trains(len(changed))
+                for i in changed:
+                    if not self.cols["maintenance"][i]:
+                        del self.ranking[bisect_left(self.ranking, self._key(i))]
+                    self.trains[i] = staged[i]
+
+                for name, values in fresh.items():
+                    self.cols[name][changed] = values
+
+                if _normalizers(self.cols) != self.norms:
+                    # fleet-wide mileage/age normalisation moved: every score changes
+                    full_rescore = True
+                    previous = self.assignment
+                    self._rebuild()
+                    self.assignment = previous  # diffed against below
+                    candidates = set(self.index.values())
+                else:
+                    self.scores[changed] = _score_columns(fresh, self.weights, self.norms)
+                    for name in ("mileage_metric", "cleaning_metric"):
+                        self.cols[name][changed] = fresh[name]
+                    for i in changed:
+                        if not self.cols["maintenance"][i]:
+                            insort(self.ranking, self._key(i))
+                    candidates |= self._boundary_trains(len(changed))
+            else:
+                candidates = set()
+
+            entries = []
+            for i in sorted(candidates, key=self._rank_order):
+                tid = self.trains[i]["train_id"]
+                previous = self.assignment.get(tid)
+                assignment = self._assignment_of(i)
+                self.assignment[tid] = assignment
+                if report and (assignment != previous or i in changed):
+                    entry = self._entry(i, assignment)
+                    entry["previous_assignment"] = previous
+                    entries.append(entry)
+
+            if not report:
+                return {"unknown_trains": unknown, "full_rescore": full_rescore}
+            return {
+                "date": self.date,
+                "changed": entries,
+                "conflicts": detect_conflicts(
+                    entries, {e["train_id"]: self.trains[self.index[e["train_id"]]] for e in entries}, self.weights
+                ),
+                "unknown_trains": unknown,
+                "full_rescore": full_rescore,
+                "summary": self.summary()
+            }
+
+    def _rank_order(self, i):
+        # plan order: ranked eligible trains first, then forced-IBL trains by fleet position
+        if self.cols["maintenance"][i]:
+            return (1, i, 0)
+        return (0, *self._key(i))
+
+    def _entry(self, i, assignment, explain=True):
+        entry = {
+            "train_id": self.trains[i]["train_id"],
+            "assignment": assignment,
+            "score": round(float(self.scores[i]), 3)
+        }
+        if explain:
+            rows = {name: values[i:i + 1].tolist() for name, values in self.cols.items()}
+            entry["reasons"] = _reasons(rows, 0)
+            if self.cols["maintenance"][i]:
+                entry["reasons"].append({"note": "Forced IBL due to maintenance status"})
+        return entry
+
+    def advance(self, date_str, updates=()):
+        """Moves the session to another day with updates [{train_id, field: value}] for the
+           trains whose state changed. Every train's maintenance age moves with the date, so
+           the whole fleet is rescored (one vectorised pass) and re-sorted starting from the
+           previous day's ranking."""
+        with self.lock:
+            for u in updates:
+                i = self.index.get(u.get("train_id"))
+                if i is not None:
+                    self.trains[i].update(_checked(u))
+            maintenance = self.cols["maintenance"]
+            order = [i for _, i in self.ranking] + [i for i in range(len(self.trains)) if maintenance[i]]
+            self.date = date_str
+            self._rebuild(order)
+
+    def set_requirements(self, service_needed, standby_needed):
+        """Changes the Service/Standby counts; assignments follow from the existing ranking"""
+        with self.lock:
+            if (service_needed, standby_needed) == (self.service_needed, self.standby_needed):
+                return
+            self.service_needed, self.standby_needed = service_needed, standby_needed
+            self.assignment = {self.trains[i]["train_id"]: self._assignment_of(i) for i in self.index.values()}
+
+    def summary(self):
+        eligible = len(self.ranking)
+        service = max(0, min(self.service_needed, eligible))
+        standby = max(0, min(self.standby_needed, eligible - service))
+        return {
+            "total_trains": len(self.index),
+            "service_assigned": service,
+            "standby_assigned": standby,
+            "ibl_assigned": len(self.index) - service - standby
+        }
+
+    def plan(self, explain=True):
+        """The full plan in optimize() order"""
+        with self.lock:
+            plan = [self._entry(i, self._assignment_at(k), explain) for k, (_, i) in enumerate(self.ranking)]
+            plan.extend(
+                self._entry(i, "IBL", explain) for i in self.index.values() if self.cols["maintenance"][i]
+            )
+            return plan
+
+_sessions = OrderedDict()
+_sessions_lock = threading.Lock()
+
+def get_session(weights, date_str=None, requirements=None):
+    """The live session for (date, weights, requirements), rebuilt when the underlying data changes.
+       Sessions are only a cache: the live updates themselves are kept in live_updates."""
+    key = (
+        date_str or datetime.date.today().isoformat(),
+        tuple(sorted(weights.items())),
+        tuple(sorted((requirements or {}).items())) if date_str else None
+    )
+    version = data_version()
+    with _sessions_lock:
+        entry = _sessions.get(key)
+        if entry is not None and entry[0] == version:
+            _sessions.move_to_end(key)
+            return entry[1]
+    session = PlanSession(weights, date_str, requirements)
+    with _sessions_lock:
+        _sessions[key] = (version, session)
+        _sessions.move_to_end(key)
+        while len(_sessions) > MAX_SESSIONS:
+            _sessions.popitem(last=False)
+    return session
+
+def _drop(session):
+    with _sessions_lock:
+        for key, (_, s) in list(_sessions.items()):
+            if s is session:
+                del _sessions[key]
+
+def apply_updates(weights, updates, date_str=None, requirements=None):
+    """Applies updates to the date's live plan and logs them in live_updates so every later
+       plan of the date includes them. Raises UpdateError, before anything changes, for
+       values that can't be applied."""
+    _checked_options(weights, requirements)
+    checked = [dict(_checked(u), train_id=u.get("train_id")) for u in updates]
+    session = get_session(weights, date_str, requirements)
+    try:
+        with session.lock:
+            session.sync()
+            result = session.apply(checked)
+            known = [u for u in checked if u["train_id"] in session.index]
+            before, after = live_updates.record(session.date, known)
+            if before == session.applied:
+                session.applied = after
+            # else another worker logged updates in between; sync() replays them with ours
+        return result
+    except Exception:
+        # the session may be half-updated or ahead of the log: never hand it out again
+        _drop(session)
+        raise
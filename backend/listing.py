@@ -0,0 +1,95 @@
+"""Filtering, sorting and paging for the list endpoints.
+
+Rows are train records or maintenance log entries; both are read with .get,
+so the helpers work on dicts and TrainRecords alike.
+"""
+import datetime
+
+MAX_PAGE_SIZE = 5000
+
+class ListArgsError(ValueError):
+    pass
+
+def split_values(arg):
+    """'a,b' -> {'a', 'b'}; None/empty -> None"""
+    if not arg:
+        return None
+    values = {v.strip() for v in arg.split(",") if v.strip()}
+    return values or None
+
+def filter_rows(rows, filters):
+    """Keeps rows whose field value is one of the allowed values, for every {field: values} given"""
+    active = [(field, values) for field, values in filters.items() if values]
+    if not active:
+        return rows
+    return [r for r in rows if all(r.get(field) in values for field, values in active)]
+
+def filter_date_range(rows, field, start=None, end=None):
+    """Keeps rows with start <= row[field] <= end (YYYY-MM-DD strings compare in date order)"""
+    if not start and not end:
+        return rows
+    out = []
+    for r in rows:
+        value = r.get(field)
+        if not value or (start and value < start) or (end and value > end):
+            continue
+        out.append(r)
+    return out
+
+def sort_rows(rows, sort, allowed):
+    """Sorts by a comma separated key list like 'fitness_score,-total_mileage'.
+       Missing values sort last in either direction."""
+    if not sort:
+        return rows
+    keys = []
+    for key in sort.split(","):
+        key = key.strip()
+        reverse = key.startswith("-")
+        field = key.lstrip("-+")
+        if field not in allowed:
+            raise ListArgsError(f"Cannot sort by {field!r}")
+        keys.append((field, reverse))
+    rows = list(rows)
+    # stable sorts applied from the last key to the first
+    for field, reverse in reversed(keys):
+        present = [r for r in rows if r.get(field) is not None]
+        missing = [r for r in rows if r.get(field) is None]
+        present.sort(key=lambda r: r.get(field), reverse=reverse)
+        rows = present + missing
+    return rows
+
+def check_date(name, value):
+    """value if it is None or a YYYY-MM-DD date, else ListArgsError naming the parameter"""
+    if value is not None:
+        try:
+            if len(value) != 10:
+                raise ValueError
+            datetime.date.fromisoformat(value)
+        except (TypeError, ValueError):
+            raise ListArgsError(f"{name} must be a YYYY-MM-DD date")
+    return value
+
+def date_args(args, *names):
+    """The ?name= values that are given, checked to be YYYY-MM-DD (None for missing ones)"""
+    return [check_date(name, args.get(name) or None) for name in names]
+
+def page_args(args):
+    """(offset, limit) from ?offset=&limit=; limit is None when no paging was asked for"""
+    try:
+        offset = int(args.get("offset", 0))
+        limit = args.get("limit")
+        limit = int(limit) if limit is not None else None
+    except ValueError:
+        raise ListArgsError("offset and limit must be integers")
+    if offset < 0 or (limit is not None and limit < 0):
+        raise ListArgsError("offset and limit must not be negative")
+    if limit is not None:
+        limit = min(limit, MAX_PAGE_SIZE)
+    return offset, limit
+
+def paginate(rows, offset, limit):
+    """(page, total) for a slice of rows"""
+    total = len(rows)
+    if limit is None:
+        return (rows[offset:] if offset else rows), total
+    return rows[offset:offset + limit], total
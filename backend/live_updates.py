@@ -0,0 +1,92 @@
+"""Live train status updates, kept per date on top of the fleet data files.
+
+Every update /api/optimize_incremental accepts is appended to a JSON Lines log shared by
+all worker processes. Plan sessions replay a date's updates when they are (re)built and
+catch up on ones another worker appended; optimize() applies them to the fleet it loads.
+A live change therefore holds whichever endpoint, worker, weights or cached session
+answers the next request, and survives session eviction and data reloads. Delete the
+log to drop every live update.
+
+Each process reads only what was appended since its last look.
+"""
+import json, os, threading
+import audit
+
+LIVE_UPDATES_FILE = os.environ.get(
+    "METROPAL_LIVE_UPDATES_FILE", os.path.join(audit.BASE_DIR, "backend_live_updates.jsonl")
+)
+
+_lock = threading.Lock()
+_log = {"inode": None, "offset": 0, "by_date": {}}  # by_date: date -> [update, ...] in log order
+
+def _refresh():
+    """Reads the lines appended since the last call (all of them if the log was replaced)"""
+    try:
+        st = os.stat(LIVE_UPDATES_FILE)
+    except FileNotFoundError:
+        _log.update(inode=None, offset=0, by_date={})
+        return
+    if st.st_ino != _log["inode"] or st.st_size < _log["offset"]:
+        _log.update(inode=st.st_ino, offset=0, by_date={})
+    if st.st_size == _log["offset"]:
+        return
+    with open(LIVE_UPDATES_FILE, "rb") as f:
+        f.seek(_log["offset"])
+        data = f.read()
+    end = data.rfind(b"\n") + 1  # a line still being written is picked up next time
+    for line in data[:end].splitlines():
+        if line.strip():
+            entry = json.loads(line)
+            _log["by_date"].setdefault(entry["date"], []).extend(entry["updates"])
+    _log["offset"] += end
+
+def updates(date_str, start=0):
+    """(date_str's updates from position start on, position after the last one)"""
+    with _lock:
+        _refresh()
+        logged = _log["by_date"].get(date_str, [])
+        return logged[start:], len(logged)
+
+def version(date_str):
+    """Number of live updates logged for date_str; changes whenever one is added"""
+    return updates(date_str, 0)[1]
+
+def record(date_str, checked):
+    """Appends checked updates [{train_id, field: value}] for date_str. Returns the date's log
+       positions (before, after) around them."""
+    if not checked:
+        position = version(date_str)
+        return position, position
+    line = (json.dumps({"date": date_str, "updates": checked}, separators=(",", ":")) + "\n").encode("utf-8")
+    with audit.file_lock(LIVE_UPDATES_FILE, _lock):
+        _refresh()
+        before = len(_log["by_date"].get(date_str, []))
+        with open(LIVE_UPDATES_FILE, "ab") as f:
+            f.write(line)
+        _refresh()
+        after = len(_log["by_date"].get(date_str, []))
+    return before, after
+
+def overlay(trains, date_str):
+    """(trains with date_str's live updates applied, log position they include). Changed
+       records are copies; without updates the list itself is returned, so shared data and
+       the indexes kept next to it are left alone."""
+    logged, position = updates(date_str)
+    changes = {}
+    for u in logged:
+        changes.setdefault(u["train_id"], {}).update((k, v) for k, v in u.items() if k != "train_id")
+    if not changes:
+        return trains, position
+    out, seen = [], set()
+    for t in trains:
+        values = changes.get(t["train_id"])
+        if values and t["train_id"] not in seen:  # the first record of an id, as sessions do
+            t = t.copy()
+            t.update(values)
+        seen.add(t["train_id"])
+        out.append(t)
+    return out, position
+
+def apply_to(trains, date_str):
+    """trains with date_str's live updates applied (see overlay)"""
+    return overlay(trains, date_str)[0]
@@ -1,10 +1,16 @@
-from sqlalchemy import Column, Integer, String, Float, Boolean, Date
+from sqlalchemy import Column, Integer, String, Float, Boolean, Date, Index
 from sqlalchemy.ext.declarative import declarative_base
 
 Base = declarative_base()
 
 class TrainInventory(Base):
     __tablename__ = "train_inventory"
+    __table_args__ = (
+        # one row per train per day; serves single-date and date-range lookups
+        Index("ix_train_inventory_date_train_id", "date", "train_id", unique=True),
+        # one train's history (the timeline) in date order
+        Index("ix_train_inventory_train_id_date", "train_id", "date"),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     date = Column(Date, nullable=False)
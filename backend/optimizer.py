@@ -1,5 +1,25 @@
 import math, datetime, json, os
-from data_loader import load_trains, today_requirement, load_maintenance_logs, load_full_train_data
+from functools import lru_cache
+import numpy as np
+from data_loader import load_trains, today_requirement, load_maintenance_logs, load_full_train_data, last_maintenance_date, load_certificate_index, DATA_BACKEND
+from conflicts import detect_conflicts, index_trains
+import solver as exact_solver
+import metrics
+import live_updates
+from certificates import CertificateIndex, GATING_MODES
+
+# Default certificate gating when a call doesn't choose: "off", "flag" or "exclude"
+CERT_GATING = os.environ.get("METROPAL_CERT_GATING", "off")
+if CERT_GATING not in GATING_MODES:
+    raise ValueError(f"METROPAL_CERT_GATING must be one of {', '.join(GATING_MODES)}, got {CERT_GATING!r}")
+
+@lru_cache(maxsize=8192)
+def _date_ordinal(datestr):
+    """Parses a YYYY-MM-DD string to a date ordinal, or None if it can't be parsed"""
+    try:
+        return datetime.datetime.strptime(datestr, "%Y-%m-%d").date().toordinal()
+    except Exception:
+        return None
 
 def _days_since(datestr, ref=None):
     """Calculate days since a given date string"""
@@ -7,31 +27,121 @@ def _days_since(datestr, ref=None):
         return 9999
     refd = datetime.date.today() if ref is None else ref
     try:
-        dt = datetime.datetime.strptime(datestr, "%Y-%m-%d").date()
-        return (refd - dt).days
-    except Exception:
+        ordinal = _date_ordinal(datestr)
+    except TypeError:  # unhashable value
+        return 9999
+    if ordinal is None:
         return 9999
+    return refd.toordinal() - ordinal
 
-def optimize(weights, date_str=None, requirements=None):
-    """
-    Enhanced optimize function that uses your existing data_loader:
-    - Uses load_full_train_data() from your data_loader.py
-    - Supports both current date and specific date optimization
-    - Improved scoring and conflict detection
-    """
+def _fleet_columns(trains, ref=None):
+    """Converts a day's fleet (list of train dicts) into NumPy feature arrays. Ages (days since
+       maintenance) are measured from ref, the day being planned: a date or YYYY-MM-DD string,
+       default today."""
+    n = len(trains)
+    refd = datetime.date.today() if ref is None else ref
+    if isinstance(refd, str):
+        refd = datetime.date.fromisoformat(refd)
+    ref_ordinal = refd.toordinal()
     
-    # Load data using your existing data loader
-    if date_str:
-        trains = load_full_train_data(date=date_str)
-        current_date = date_str
-    else:
-        trains = load_full_train_data()  # Uses today's date by default
-        current_date = datetime.date.today().strftime("%Y-%m-%d")
+    def column(values, dtype=float):
+        return np.fromiter(values, dtype=dtype, count=n)
     
-    if not trains:
-        return {"error": f"No data available for date {current_date}"}
+    def maintenance_date(t):
+        # records without a last_maintenance_date fall back to the maintenance log
+        return t.get("last_maintenance_date") or last_maintenance_date(t.get("train_id"), refd.isoformat())
     
-    # Determine requirements
+    def days_since(datestr):
+        if not datestr:
+            return 9999
+        try:
+            ordinal = _date_ordinal(datestr)
+        except TypeError:
+            return 9999
+        return 9999 if ordinal is None else ref_ordinal - ordinal
+    
+    return {
+        "fitness": column(t.get("fitness_score", 0) for t in trains),
+        "branded": column(1.0 if t.get("branding_active", 0) == 1 else 0.0 for t in trains),
+        "branding_active": column((bool(t.get("branding_active", 0)) for t in trains), bool),
+        "branding_priority": column(t.get("branding_priority", 0) for t in trains),
+        "mileage": column(t.get("mileage_since_maintenance", 0) for t in trains),
+        # normalisation also accepts the train_fleet.json field name
+        "mileage_norm": column(
+            t.get("km_since_last_maintenance", 0) or t.get("mileage_since_maintenance", 0) for t in trains
+        ),
+        "days_since_maintenance": column(days_since(maintenance_date(t)) for t in trains),
+        "needs_cleaning": column((bool(t.get("needs_cleaning", False)) for t in trains), bool),
+        "maintenance": column((
+            t.get("recommended_action") == "Maintenance (IBL)" or
+            t.get("job_card_status") == "Open" or
+            bool(t.get("maintenance_due", False))
+            for t in trains
+        ), bool),
+    }
+
+def _normalizers(cols):
+    """Fleet-wide (max_km, max_days) used to normalise mileage and maintenance age"""
+    max_km = cols["mileage_norm"].max() or 1
+    max_days = cols["days_since_maintenance"].max() or 1
+    return max_km, max_days
+
+def _score_terms(cols, norms=None):
+    """The per-train metrics the weights are applied to. mileage_metric and cleaning_metric
+       are also stored on cols for the reasons. norms overrides the fleet normalizers."""
+    # Calculate normalization factors for better scoring
+    max_km, max_days = norms if norms is not None else _normalizers(cols)
+    
+    mileage_metric = 1.0 - (cols["mileage"] / max_km) if max_km > 0 else np.zeros_like(cols["mileage"])
+    maintenance_metric = (
+        1.0 - (cols["days_since_maintenance"] / max_days) if max_days > 0
+        else np.zeros_like(cols["days_since_maintenance"])
+    )
+    cleaning_metric = np.where(cols["needs_cleaning"], 0.2, 0.8)
+    cols["mileage_metric"] = mileage_metric
+    cols["cleaning_metric"] = cleaning_metric
+    return {
+        "health": cols["fitness"],
+        "maintenance": maintenance_metric,
+        "cleaning": cleaning_metric,
+        "branding": cols["branded"] + cols["branding_priority"],  # halved after weighting
+        "mileage": mileage_metric
+    }
+
+def _score_columns(cols, weights, norms=None):
+    """Computes the weighted score of every train at once.
+       Adds terms in the same order as the original per-train loop so results match bit for bit.
+       norms overrides the fleet normalizers (e.g. when rescoring a subset of trains)."""
+    terms = _score_terms(cols, norms)
+    
+    # Normalize weights
+    weight_sum = sum(weights.get(k, 0) for k in weights) or 1
+    
+    health = terms["health"]
+    score = np.zeros(len(health))
+    score += (weights.get("punctuality", 0) / weight_sum) * health
+    score += (weights.get("readiness", 0) / weight_sum) * health  # Alternative name for health
+    score += (weights.get("maintenance", 0) / weight_sum) * terms["maintenance"]
+    score += (weights.get("cleaning", 0) / weight_sum) * terms["cleaning"]
+    score += (weights.get("branding", 0) / weight_sum) * terms["branding"] / 2
+    score += (weights.get("mileage", 0) / weight_sum) * terms["mileage"]
+    return score
+
+def _reasons(rows, i):
+    """Detailed reasons for transparency using your actual data"""
+    return [
+        {"metric": "fitness_score", "value": round(rows["fitness"][i], 3)},
+        {"metric": "maintenance_age_days", "value": int(rows["days_since_maintenance"][i])},
+        {"metric": "mileage_since_maintenance", "value": int(rows["mileage"][i])},
+        {"metric": "mileage_rank", "value": round(rows["mileage_metric"][i], 3)},
+        {"metric": "branding_active", "value": rows["branding_active"][i]},
+        {"metric": "branding_priority", "value": round(rows["branding_priority"][i], 3)},
+        {"metric": "needs_cleaning", "value": rows["needs_cleaning"][i]},
+        {"metric": "cleaning_score", "value": round(rows["cleaning_metric"][i], 2)}
+    ]
+
+def _resolve_requirements(date_str, requirements):
+    """(service_needed, standby_needed) for a run"""
     if date_str:
         # Use provided requirements or defaults for specific date
         if requirements:
@@ -51,199 +161,147 @@ def optimize(weights, date_str=None, requirements=None):
             service_needed = 15
             standby_needed = 5
     
-    # Calculate normalization factors for better scoring
-    max_km = max((t.get("km_since_last_maintenance", 0) or t.get("mileage_since_maintenance", 0) for t in trains)) or 1
-    max_days = max((_days_since(t.get("last_maintenance_date")) for t in trains)) or 1
-    
-    # --- Enhanced Scoring Logic ---
-    scored = []
-    for t in trains:
-        # Use your actual data structure from generate.py
-        health = t.get("fitness_score", 0)  # Already a value between 0-1
-        is_branded = 1.0 if t.get("branding_active", 0) == 1 else 0.0
-        branding_priority = t.get("branding_priority", 0)
-        
-        # Use your actual mileage field name
-        km = t.get("mileage_since_maintenance", 0)
-        mileage_metric = 1.0 - (km / max_km) if max_km > 0 else 0.0
-        
-        # Maintenance age scoring using your field
-        days = _days_since(t.get("last_maintenance_date", ""))
-        maintenance_metric = 1.0 - (days / max_days) if max_days > 0 else 0.0
-        
-        # Cleaning metric based on your needs_cleaning field
-        cleaning_metric = 0.8 if not t.get("needs_cleaning", False) else 0.2
-        
-        # Normalize weights
-        weight_sum = sum(weights.get(k, 0) for k in weights) or 1
-        
-        # Calculate weighted score using your data structure
-        score = 0.0
-        score += (weights.get("punctuality", 0) / weight_sum) * health
-        score += (weights.get("readiness", 0) / weight_sum) * health  # Alternative name for health
-        score += (weights.get("maintenance", 0) / weight_sum) * maintenance_metric  
-        score += (weights.get("cleaning", 0) / weight_sum) * cleaning_metric
-        score += (weights.get("branding", 0) / weight_sum) * (is_branded + branding_priority) / 2
-        score += (weights.get("mileage", 0) / weight_sum) * mileage_metric
-        
-        # Detailed reasons for transparency using your actual data
-        reasons = [
-            {"metric": "fitness_score", "value": round(health, 3)},
-            {"metric": "maintenance_age_days", "value": int(days)},
-            {"metric": "mileage_since_maintenance", "value": int(km)},
-            {"metric": "mileage_rank", "value": round(mileage_metric, 3)},
-            {"metric": "branding_active", "value": bool(t.get("branding_active", 0))},
-            {"metric": "branding_priority", "value": round(branding_priority, 3)},
-            {"metric": "needs_cleaning", "value": bool(t.get("needs_cleaning", False))},
-            {"metric": "cleaning_score", "value": round(cleaning_metric, 2)}
-        ]
-        
-        scored.append({"train": t, "score": score, "reasons": reasons})
-    
-    # --- Enhanced Assignment Logic ---
-    # Handle your actual data structure for maintenance detection
-    maintenance_trains = []
-    eligible = []
+    return service_needed, standby_needed
+
+def optimize(weights, date_str=None, requirements=None, trains=None, explain=True, solver=None, certificates=None):
+    """
+    Enhanced optimize function that uses your existing data_loader:
+    - Uses load_full_train_data() from your data_loader.py
+    - Supports both current date and specific date optimization
+    - Improved scoring and conflict detection
+    - Accepts an already loaded fleet via trains (e.g. a batch snapshot); a fleet it loads
+      itself includes the day's live updates (live_updates.py)
+    - explain=False leaves out the per-train reasons, which are only built when asked for
+    - solver={...} replaces the greedy ranking with the exact assignment in solver.py
+      (options: time_budget, capacities, backend); {} uses the defaults
+    - certificates="flag" reports Service/Standby trains with an expired fitness certificate
+      as conflicts, "exclude" forces them to IBL (default METROPAL_CERT_GATING, "off")
+    """
     
-    for s in scored:
-        train = s["train"]
-        # Check maintenance indicators from your data structure
-        is_maintenance = (
-            train.get("recommended_action") == "Maintenance (IBL)" or
-            train.get("job_card_status") == "Open" or
-            train.get("maintenance_due", False)
-        )
-        
-        if is_maintenance:
-            maintenance_trains.append(s)
+    # Load data using your existing data loader
+    loaded = trains is None
+    with metrics.phase("load"):
+        if date_str:
+            if trains is None:
+                trains = load_full_train_data(date=date_str)
+            current_date = date_str
         else:
-            eligible.append(s)
+            if trains is None:
+                trains = load_full_train_data()  # Uses today's date by default
+            current_date = datetime.date.today().strftime("%Y-%m-%d")
+        if loaded:
+            trains = live_updates.apply_to(trains, current_date)
     
-    # Sort eligible trains by score
-    eligible_sorted = sorted(eligible, key=lambda x: x["score"], reverse=True)
+    if not trains:
+        return {"error": f"No data available for date {current_date}"}
     
-    # Create optimized plan
-    plan = []
+    # Determine requirements
+    service_needed, standby_needed = _resolve_requirements(date_str, requirements)
     
-    # Assign Service trains (highest scores)
-    for s in eligible_sorted[:service_needed]:
-        plan.append({
-            "train_id": s["train"]["train_id"],
-            "assignment": "Service",
-            "score": round(s["score"], 3),
-            "reasons": s["reasons"]
-        })
+    # --- Enhanced Scoring Logic (columnar) ---
+    with metrics.phase("score"):
+        cols = _fleet_columns(trains, current_date)
+        score = _score_columns(cols, weights)
     
-    # Assign Standby trains (next highest scores)
-    for s in eligible_sorted[service_needed:service_needed + standby_needed]:
-        plan.append({
-            "train_id": s["train"]["train_id"],
-            "assignment": "Standby", 
-            "score": round(s["score"], 3),
-            "reasons": s["reasons"]
-        })
+    # --- Certificate gating: positions of trains with an expired certificate ---
+    gating = certificates or CERT_GATING
+    if gating not in GATING_MODES:
+        raise ValueError(f"certificates must be one of {', '.join(GATING_MODES)}")
+    expired = {}
+    if gating != "off":
+        with metrics.phase("certificates"):
+            # the JSON backend keeps an index per date next to the records it just returned;
+            # a fleet passed in (or read from another backend) is indexed here
+            index = load_certificate_index(date_str) if loaded and DATA_BACKEND == "json" else None
+            if index is None or index.records is not trains:  # reloaded in between
+                index = CertificateIndex(trains)
+            expired = index.expired(current_date)
     
-    # Assign remaining eligible trains to IBL
-    for s in eligible_sorted[service_needed + standby_needed:]:
-        plan.append({
-            "train_id": s["train"]["train_id"],
-            "assignment": "IBL",
-            "score": round(s["score"], 3),
-            "reasons": s["reasons"]
-        })
+    # --- Enhanced Assignment Logic ---
+    # Handle your actual data structure for maintenance detection
+    with metrics.phase("assign"):
+        excluded = []
+        if gating == "exclude" and solver is None and expired:
+            # the exact solver applies the same certificate constraint itself
+            cert_blocked = np.zeros(len(trains), dtype=bool)
+            cert_blocked[list(expired)] = True
+            eligible = np.flatnonzero(~(cols["maintenance"] | cert_blocked))
+            excluded = np.flatnonzero(cert_blocked & ~cols["maintenance"])
+            excluded = excluded[np.argsort(-score[excluded], kind="stable")].tolist()
+        else:
+            eligible = np.flatnonzero(~cols["maintenance"])
+        maintenance_idx = np.flatnonzero(cols["maintenance"]).tolist()
     
-    # Add maintenance trains
-    for s in maintenance_trains:
-        plan.append({
-            "train_id": s["train"]["train_id"],
-            "assignment": "IBL",
-            "score": round(s["score"], 3),
-            "reasons": s["reasons"] + [{"note": "Forced IBL due to maintenance status"}]
-        })
+        # Rank eligible trains by score, ties kept in fleet order (a stable sort, descending)
+        ranked = eligible[np.argsort(-score[eligible], kind="stable")].tolist()
     
-    # --- Enhanced Conflict Detection ---
-    conflict_alerts = []
+        scores = score.tolist()
+        rows = {k: v.tolist() for k, v in cols.items()} if explain else None
     
-    # Check for branded trains in IBL when branding priority is high
-    branding_weight = weights.get("branding", 0)
-    if branding_weight > 60:
-        for p in plan:
-            if p["assignment"] == "IBL":
-                tr = next((s["train"] for s in scored if s["train"]["train_id"] == p["train_id"]), None)
-                if tr and tr.get("branding_active", 0) == 1:
-                    conflict_alerts.append({
-                        "train_id": p["train_id"],
-                        "issue": f"Branded train ({tr.get('branding_company', 'Unknown')}) assigned to IBL while branding priority is high",
-                        "severity": "medium",
-                        "branding_priority": tr.get("branding_priority", 0)
-                    })
+        def entry(i, assignment):
+            p = {
+                "train_id": trains[i]["train_id"],
+                "assignment": assignment,
+                "score": round(scores[i], 3)
+            }
+            if explain:
+                p["reasons"] = _reasons(rows, i)
+            return p
     
-    # Check for high-fitness trains in IBL (potential resource waste)
-    for p in plan:
-        if p["assignment"] == "IBL":
-            tr = next((s["train"] for s in scored if s["train"]["train_id"] == p["train_id"]), None)
-            if tr:
-                fitness_score = tr.get("fitness_score", 0)
-                if fitness_score > 0.8:  # High fitness threshold (0-1 scale)
-                    conflict_alerts.append({
-                        "train_id": p["train_id"],
-                        "issue": f"High-fitness train ({fitness_score:.1%}) assigned to IBL",
-                        "severity": "low"
-                    })
+        # Create optimized plan
+        plan = []
+        solver_info = None
     
-    # Check for maintenance overdue trains in active service
-    for p in plan:
-        if p["assignment"] in ["Service", "Standby"]:
-            tr = next((s["train"] for s in scored if s["train"]["train_id"] == p["train_id"]), None)
-            if tr and tr.get("maintenance_due", False):
-                conflict_alerts.append({
-                    "train_id": p["train_id"],
-                    "issue": f"Maintenance overdue train assigned to {p['assignment']}",
-                    "severity": "high",
-                    "mileage_since_maintenance": tr.get("mileage_since_maintenance", 0)
-                })
-    
-    # Check for high mileage trains in service - FIXED: removed CONFIG reference
-    high_mileage_threshold = 18000  # 90% of 20,000 km maintenance interval
-    for p in plan:
-        if p["assignment"] in ["Service", "Standby"]:
-            tr = next((s["train"] for s in scored if s["train"]["train_id"] == p["train_id"]), None)
-            if tr:
-                mileage = tr.get("mileage_since_maintenance", 0)
-                if mileage > high_mileage_threshold:
-                    conflict_alerts.append({
-                        "train_id": p["train_id"],
-                        "issue": f"High-mileage train ({mileage:,} km) assigned to {p['assignment']} - nearing maintenance interval",
-                        "severity": "medium",
-                        "mileage_since_maintenance": mileage
-                    })
+        if solver is not None:
+            # Exact assignment with hard constraints, warm-started from the greedy ranking
+            warm_start = [exact_solver.IBL] * len(trains)
+            for i in ranked[:service_needed]:
+                warm_start[i] = exact_solver.SERVICE
+            for i in ranked[service_needed:service_needed + standby_needed]:
+                warm_start[i] = exact_solver.STANDBY
+            assigned, blocked, solver_info = exact_solver.solve(
+                trains, scores, weights, cols["maintenance"].tolist(), current_date,
+                service_needed, standby_needed, warm_start, solver
+            )
+            # Service, Standby and IBL each in score order, then every train kept out of service
+            for c, name in enumerate(exact_solver.CLASSES):
+                plan.extend(entry(i, name) for i in ranked if assigned[i] == c and i not in blocked)
+            for i in [i for i in ranked if i in blocked]:
+                p = entry(i, "IBL")
+                if explain:
+                    p["reasons"].extend({"note": f"Forced IBL: {r}"} for r in blocked[i])
+                plan.append(p)
+        else:
+            # Assign Service trains (highest scores)
+            plan.extend(entry(i, "Service") for i in ranked[:service_needed])
+        
+            # Assign Standby trains (next highest scores)
+            plan.extend(entry(i, "Standby") for i in ranked[service_needed:service_needed + standby_needed])
+        
+            # Assign remaining eligible trains to IBL
+            plan.extend(entry(i, "IBL") for i in ranked[service_needed + standby_needed:])
+            
+            # Trains kept out of service by an expired certificate
+            for i in excluded:
+                p = entry(i, "IBL")
+                if explain:
+                    p["reasons"].extend({"note": f"Forced IBL: {cert} expired on {expiry}"} for cert, expiry in expired[i])
+                plan.append(p)
     
-    # Check for trains with open job cards in service
-    for p in plan:
-        if p["assignment"] in ["Service", "Standby"]:
-            tr = next((s["train"] for s in scored if s["train"]["train_id"] == p["train_id"]), None)
-            if tr and tr.get("job_card_status") == "Open":
-                conflict_alerts.append({
-                    "train_id": p["train_id"],
-                    "issue": f"Train with open job card ({tr.get('maintenance_type', 'Unknown')}) assigned to {p['assignment']}",
-                    "severity": "high" if tr.get("maintenance_type") in ["Major Repair", "Critical Failure"] else "medium"
-                })
+        # Add maintenance trains
+        for i in maintenance_idx:
+            p = entry(i, "IBL")
+            if explain:
+                p["reasons"].append({"note": "Forced IBL due to maintenance status"})
+            plan.append(p)
     
-    # Check for trains needing cleaning in service when cleaning priority is high
-    cleaning_weight = weights.get("cleaning", 0)
-    if cleaning_weight > 50:
-        for p in plan:
-            if p["assignment"] == "Service":
-                tr = next((s["train"] for s in scored if s["train"]["train_id"] == p["train_id"]), None)
-                if tr and tr.get("needs_cleaning", False):
-                    conflict_alerts.append({
-                        "train_id": p["train_id"],
-                        "issue": "Train needing cleaning assigned to Service while cleaning priority is high",
-                        "severity": "low",
-                        "last_cleaning_date": tr.get("last_cleaning_date")
-                    })
+    # --- Enhanced Conflict Detection ---
+    with metrics.phase("conflicts"):
+        conflict_alerts = detect_conflicts(plan, index_trains(trains), weights)
+        if expired:
+            conflict_alerts.extend(_certificate_conflicts(plan, trains, expired))
     
-    return {
+    result = {
         "date": current_date,
         "service_needed": service_needed,
         "standby_needed": standby_needed,
@@ -261,6 +319,28 @@ def optimize(weights, date_str=None, requirements=None):
             )
         }
     }
+    if solver_info is not None:
+        result["solver"] = solver_info
+    metrics.OPTIMIZE_CALLS.inc(mode="greedy" if solver is None else "solver")
+    for c in conflict_alerts:
+        metrics.CONFLICTS.inc(severity=c.get("severity", "unknown"))
+    return result
+
+def _certificate_conflicts(plan, trains, expired):
+    """Conflicts for Service/Standby trains with a certificate that expired before the plan date"""
+    lapsed = {trains[i]["train_id"]: certs for i, certs in expired.items()}
+    conflicts = []
+    for p in plan:
+        if p["assignment"] in ("Service", "Standby") and p["train_id"] in lapsed:
+            for cert, expiry in lapsed[p["train_id"]]:
+                conflicts.append({
+                    "train_id": p["train_id"],
+                    "issue": f"Train with expired {cert} ({expiry}) assigned to {p['assignment']}",
+                    "severity": "high",
+                    "certificate": cert,
+                    "expiry": expiry
+                })
+    return conflicts
 
 # Backward compatibility function
 def optimize_plan(date_str, weights, requirements):
@@ -0,0 +1,113 @@
+import sys
+
+# Fields of a train-day record, in full_train_data.json order
+FIELDS = (
+    "train_id", "fitness_score", "last_maintenance_date", "maintenance_due", "job_card_status",
+    "maintenance_type", "mileage_since_maintenance", "total_mileage", "last_cleaning_date",
+    "needs_cleaning", "rs_cert_expiry", "sig_cert_expiry", "telecom_cert_expiry", "branding_active",
+    "branding_start_date", "branding_priority", "branding_company", "recommended_action",
+    "stabling_bay_id",
+)
+_FIELD_SET = frozenset(FIELDS)
+
+class TrainRecord:
+    """One train on one day, stored in slots instead of a per-record dict.
+
+       Reads like the JSON dict it came from: record["train_id"], record.get("fitness_score", 0),
+       "needs_cleaning" in record. A field missing from the source stays unset (so .get falls back
+       to its default and to_dict() leaves it out); keys outside FIELDS go to a small extra dict.
+       String values are interned, so the few distinct ids, dates and statuses are shared across
+       every day of history."""
+
+    __slots__ = FIELDS + ("extra",)
+
+    def __init__(self, **fields):
+        self.extra = None
+        self.update(fields)
+
+    @classmethod
+    def from_dict(cls, d):
+        record = cls.__new__(cls)
+        record.extra = None
+        record.update(d)
+        return record
+
+    def update(self, fields):
+        # runs for every record loaded from disk, so the lookups are hoisted
+        intern, known = sys.intern, _FIELD_SET
+        for key, value in fields.items():
+            if value.__class__ is str:
+                value = intern(value)
+            if key in known:
+                setattr(self, key, value)
+            else:
+                if self.extra is None:
+                    self.extra = {}
+                self.extra[key] = value
+
+    def __setitem__(self, key, value):
+        self.update({key: value})
+
+    def __getitem__(self, key):
+        if key in _FIELD_SET:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                pass
+        elif self.extra and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        if key in _FIELD_SET:
+            return getattr(self, key, default)
+        if self.extra:
+            return self.extra.get(key, default)
+        return default
+
+    def __contains__(self, key):
+        if key in _FIELD_SET:
+            return hasattr(self, key)
+        return bool(self.extra) and key in self.extra
+
+    def keys(self):
+        keys = [f for f in FIELDS if hasattr(self, f)]
+        if self.extra:
+            keys.extend(self.extra)
+        return keys
+
+    def items(self):
+        return self.to_dict().items()
+
+    def to_dict(self):
+        d = {f: getattr(self, f) for f in FIELDS if hasattr(self, f)}
+        if self.extra:
+            d.update(self.extra)
+        return d
+
+    def copy(self):
+        return TrainRecord.from_dict(self)
+
+    def __eq__(self, other):
+        if isinstance(other, TrainRecord):
+            other = other.to_dict()
+        return isinstance(other, dict) and self.to_dict() == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"TrainRecord({self.to_dict()!r})"
+
+    def __getstate__(self):
+        return self.to_dict()
+
+    def __setstate__(self, state):
+        self.extra = None
+        self.update(state)
+
+def as_record(train):
+    """A TrainRecord for a record dict (records pass through unchanged)"""
+    return train if isinstance(train, TrainRecord) else TrainRecord.from_dict(train)
+
+def as_records(trains):
+    return [as_record(t) for t in trains]
@@ -0,0 +1,125 @@
+import os, datetime, threading
+from sqlalchemy import create_engine, select, func
+from sqlalchemy.orm import sessionmaker, scoped_session
+from models import Base, TrainInventory
+from records import TrainRecord
+
+DB_PATH = os.environ.get("METROPAL_DB_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "metro.db"))
+
+# Columns in the same order as the records in full_train_data.json
+RECORD_COLUMNS = [
+    "train_id", "fitness_score", "last_maintenance_date", "maintenance_due", "job_card_status",
+    "maintenance_type", "mileage_since_maintenance", "total_mileage", "last_cleaning_date",
+    "needs_cleaning", "rs_cert_expiry", "sig_cert_expiry", "telecom_cert_expiry", "branding_active",
+    "branding_start_date", "branding_priority", "branding_company", "recommended_action",
+    "stabling_bay_id",
+]
+_DATE_COLUMNS = {
+    "last_maintenance_date", "last_cleaning_date", "rs_cert_expiry", "sig_cert_expiry",
+    "telecom_cert_expiry", "branding_start_date",
+}
+
+_engine = None
+_engine_pid = None
+_engine_lock = threading.Lock()
+Session = scoped_session(sessionmaker())
+
+def get_engine():
+    """One pooled engine per worker process; re-created after a fork"""
+    global _engine, _engine_pid
+    with _engine_lock:
+        if _engine is None or _engine_pid != os.getpid():
+            _engine = create_engine(f"sqlite:///{DB_PATH}")
+            _engine_pid = os.getpid()
+            Base.metadata.create_all(_engine)
+            # create_all skips indexes on tables that already exist
+            for index in TrainInventory.__table__.indexes:
+                index.create(_engine, checkfirst=True)
+            Session.remove()
+            Session.configure(bind=_engine)
+        return _engine
+
+def get_session():
+    get_engine()
+    return Session()
+
+def remove_session(exc=None):
+    """Releases the thread's session back to the pool (call at request teardown)"""
+    Session.remove()
+
+def _to_date(value):
+    """date from a YYYY-MM-DD string; raises ValueError for anything else"""
+    if value is None or isinstance(value, datetime.date):
+        return value
+    try:
+        if len(value) == 10:
+            return datetime.date.fromisoformat(value)
+    except (TypeError, ValueError):
+        pass
+    raise ValueError(f"expected a YYYY-MM-DD date, got {value!r}")
+
+_select_records = select(TrainInventory.date, *[TrainInventory.__table__.c[c] for c in RECORD_COLUMNS])
+
+def _to_record(row):
+    """A query row back as a TrainRecord shaped like a full_train_data.json record"""
+    record = {}
+    for name, value in zip(RECORD_COLUMNS, row[1:]):
+        if name in _DATE_COLUMNS:
+            value = value.isoformat() if value is not None else None
+        elif name == "branding_active":
+            value = int(value) if value is not None else None  # stored as 0/1 in the JSON
+        record[name] = value
+    return TrainRecord.from_dict(record)
+
+def available_dates():
+    session = get_session()
+    return [d.isoformat() for d in session.scalars(
+        select(TrainInventory.date).distinct().order_by(TrainInventory.date)
+    )]
+
+def load_full_train_data(date=None):
+    """Same contract as data_loader.load_full_train_data, served from SQLite"""
+    session = get_session()
+    target = _to_date(date) if date else datetime.date.today()
+    rows = session.execute(
+        _select_records.where(TrainInventory.date == target).order_by(TrainInventory.id)
+    ).all()
+    if not rows:
+        latest = session.scalar(select(func.max(TrainInventory.date)))
+        if latest is None:
+            return []
+        rows = session.execute(
+            _select_records.where(TrainInventory.date == latest).order_by(TrainInventory.id)
+        ).all()
+    return [_to_record(r) for r in rows]
+
+def load_train_data_range(start=None, end=None):
+    """{date: [records]} for start <= date <= end (either bound optional)"""
+    session = get_session()
+    query = _select_records
+    if start:
+        query = query.where(TrainInventory.date >= _to_date(start))
+    if end:
+        query = query.where(TrainInventory.date <= _to_date(end))
+    out = {}
+    for row in session.execute(query.order_by(TrainInventory.date, TrainInventory.id)):
+        out.setdefault(row[0].isoformat(), []).append(_to_record(row))
+    return out
+
+def load_train_timeline(train_id, start=None, end=None, fields=None):
+    """Same contract as data_loader.load_train_timeline: (dates, {field: [values]}) or None"""
+    session = get_session()
+    known = session.scalar(select(TrainInventory.id).where(TrainInventory.train_id == train_id).limit(1))
+    if known is None:
+        return None
+    query = _select_records.where(TrainInventory.train_id == train_id)
+    if start:
+        query = query.where(TrainInventory.date >= _to_date(start))
+    if end:
+        query = query.where(TrainInventory.date <= _to_date(end))
+    dates, records = [], []
+    for row in session.execute(query.order_by(TrainInventory.date)):
+        dates.append(row[0].isoformat())
+        records.append(_to_record(row))
+    fields = fields or RECORD_COLUMNS[1:]
+    return dates, {f: [r.get(f) for r in records] for f in fields}
@@ -0,0 +1,95 @@
+import os, time, datetime, threading, json
+from collections import OrderedDict
+from data_loader import data_version
+from optimizer import optimize
+import live_updates
+
+CACHE_SIZE = int(os.environ.get("METROPAL_RESULT_CACHE_SIZE", 256))
+CACHE_TTL = float(os.environ.get("METROPAL_RESULT_CACHE_TTL", 300))
+
+class ResultCache:
+    """Thread-safe LRU cache with a per-entry time to live"""
+
+    def __init__(self, maxsize=CACHE_SIZE, ttl=CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0
+            }
+
+_results = ResultCache()
+
+def _freeze(d):
+    return tuple(sorted((d or {}).items()))
+
+def cache_key(weights, date_str=None, requirements=None, explain=True, solver=None, certificates=None):
+    """(date, weights, requirements, data version and live updates, today, explain, solver
+       options, certificate gating). Zero weights
+       are dropped since they don't change scores or conflict gates; requirements only apply to
+       a given date. Today's date is included because an undated request plans for today."""
+    weights_key = tuple(sorted((k, v) for k, v in weights.items() if v))
+    today = datetime.date.today().isoformat()
+    solver_key = None if solver is None else json.dumps(solver, sort_keys=True)
+    if date_str:
+        version = (data_version(), live_updates.version(date_str))
+        return (date_str, weights_key, _freeze(requirements), version, today, bool(explain), solver_key, certificates)
+    version = (data_version(), live_updates.version(today))
+    return (today, weights_key, None, version, today, bool(explain), solver_key, certificates)
+
+def cached_optimize(weights, date_str=None, requirements=None, explain=True, solver=None, certificates=None):
+    """optimize() memoized on cache_key. The returned plan is shared, so don't mutate it."""
+    try:
+        key = cache_key(weights, date_str, requirements, explain, solver, certificates)
+        hash(key)
+    except TypeError:  # unhashable values in the payload, just compute
+        return optimize(weights, date_str=date_str, requirements=requirements, explain=explain, solver=solver,
+                        certificates=certificates)
+    result = _results.get(key)
+    if result is None:
+        result = optimize(weights, date_str=date_str, requirements=requirements, explain=explain, solver=solver,
+                          certificates=certificates)
+        _results.put(key, result)
+    return result
+
+def invalidate():
+    _results.clear()
+
+def stats():
+    return _results.stats()
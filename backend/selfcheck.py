@@ -0,0 +1,218 @@
+"""Randomised consistency checks for the planners that must agree with optimize().
+
+    python selfcheck.py                      # every check
+    python selfcheck.py incremental --rounds 300 --seed 1
+    python selfcheck.py solver --rounds 1500
+
+incremental  random update sequences applied to a PlanSession give the same plan
+             (train, assignment, score) as optimize() run from scratch on the
+             updated fleet, and every train that changed assignment is reported;
+             rejected updates leave the session untouched
+horizon      over random horizons from each data date, a train's maintenance age grows
+             by one day per planned day unless it was maintained (IBL) the day before,
+             and the first day's plan is the one optimize() gives for that date
+solver       on small random fleets (expired certificates, maintenance, bay
+             capacities, shunting costs) the exact solver's objective equals the
+             best assignment found by exhaustive search, and it reports
+             infeasible exactly when no assignment meets the targets
+
+Exits with status 1 and prints the failing case when a check fails.
+"""
+import argparse, datetime, itertools, random, sys
+
+from optimizer import optimize
+from incremental import PlanSession, UpdateError
+from horizon import plan_horizon
+from data_loader import load_train_data_range
+import solver
+
+WEIGHTS = {"punctuality": 80, "maintenance": 60, "cleaning": 50, "branding": 80, "mileage": 50}
+PLAN_DATE = "2025-09-20"
+
+def _random_date(rng, days_back=120):
+    day = datetime.date.fromisoformat(PLAN_DATE) - datetime.timedelta(days=rng.randint(0, days_back))
+    return day.isoformat()
+
+def random_train(rng, k):
+    return {
+        "train_id": f"T{k:03d}",
+        "fitness_score": round(rng.random(), 3),
+        "last_maintenance_date": _random_date(rng),
+        "maintenance_due": rng.random() < 0.1,
+        "job_card_status": "Open" if rng.random() < 0.1 else "Closed",
+        "mileage_since_maintenance": rng.randint(0, 20000),
+        "total_mileage": rng.randint(20000, 400000),
+        "last_cleaning_date": _random_date(rng, 14),
+        "needs_cleaning": rng.random() < 0.3,
+        "branding_active": int(rng.random() < 0.4),
+        "branding_priority": round(rng.random(), 2),
+        "recommended_action": "Revenue Service",
+    }
+
+def random_update(rng, trains):
+    t = rng.choice(trains)
+    u = {"train_id": t["train_id"]}
+    for field in rng.sample(["fitness_score", "mileage_since_maintenance", "needs_cleaning",
+                             "maintenance_due", "last_cleaning_date", "branding_active"], rng.randint(1, 3)):
+        if field == "fitness_score":
+            u[field] = round(rng.random(), 3)
+        elif field == "mileage_since_maintenance":
+            # occasionally past the fleet maximum, which moves the normalisers
+            u[field] = rng.randint(0, 25000)
+        elif field == "last_cleaning_date":
+            u[field] = _random_date(rng, 14)
+        elif field == "branding_active":
+            u[field] = int(rng.random() < 0.5)
+        else:
+            u[field] = rng.random() < 0.2
+    return u
+
+def _plan_key(plan):
+    return [(p["train_id"], p["assignment"], p["score"]) for p in plan]
+
+def check_incremental(rounds, seed):
+    rng = random.Random(seed)
+    bad_updates = [
+        {"fitness_score": "high"}, {"mileage_since_maintenance": None}, {"needs_cleaning": "yes"},
+        {"last_cleaning_date": "yesterday"}, {"total_mileage": 1.5}, {"job_card_status": 3},
+    ]
+    for r in range(rounds):
+        trains = [random_train(rng, k) for k in range(rng.randint(2, 40))]
+        requirements = {"service": rng.randint(0, 20), "standby": rng.randint(0, 8)}
+        session = PlanSession(WEIGHTS, PLAN_DATE, requirements, trains)
+        for step in range(rng.randint(1, 8)):
+            updates = [random_update(rng, session.trains) for _ in range(rng.randint(1, 3))]
+            previous = dict(session.assignment)
+            result = session.apply(updates)
+            expected = optimize(WEIGHTS, PLAN_DATE, requirements, trains=session.trains, explain=False)
+            if _plan_key(session.plan(explain=False)) != _plan_key(expected["plan"]):
+                print(f"incremental: round {r} step {step} differs from optimize() after {updates}")
+                return False
+            assignment = {p["train_id"]: p["assignment"] for p in expected["plan"]}
+            moved = {tid for tid, a in assignment.items() if previous[tid] != a}
+            reported = {e["train_id"] for e in result["changed"] if e["previous_assignment"] != e["assignment"]}
+            if session.assignment != assignment or reported != moved:
+                print(f"incremental: round {r} step {step} reported moves {sorted(reported)}, "
+                      f"expected {sorted(moved)} after {updates}")
+                return False
+
+        before = _plan_key(session.plan(explain=False))
+        bad = dict(rng.choice(bad_updates), train_id=session.trains[0]["train_id"])
+        try:
+            session.apply([random_update(rng, session.trains), bad])
+            print(f"incremental: round {r} accepted {bad}")
+            return False
+        except UpdateError:
+            pass
+        if _plan_key(session.plan(explain=False)) != before:
+            print(f"incremental: round {r} rejected update {bad} changed the session")
+            return False
+    print(f"incremental: {rounds} rounds ok")
+    return True
+
+def _ages(day):
+    return {
+        p["train_id"]: next(r["value"] for r in p["reasons"] if r.get("metric") == "maintenance_age_days")
+        for p in day["plan"]
+    }
+
+def check_horizon(rounds, seed):
+    rng = random.Random(seed)
+    dates = sorted(load_train_data_range())
+    if not dates:
+        print("horizon: no fleet data")
+        return False
+    for r in range(rounds):
+        start = rng.choice(dates)
+        requirements = {"service": rng.randint(0, 25), "standby": rng.randint(0, 10)}
+        days = rng.randint(2, 12)
+        result = plan_horizon(WEIGHTS, start, days, requirements, daily_km=rng.choice([150, 450, 2500]))
+        expected = optimize(WEIGHTS, start, requirements)
+        if _plan_key(result["days"][0]["plan"]) != _plan_key(expected["plan"]):
+            print(f"horizon: round {r} first day differs from optimize() for {start} {requirements}")
+            return False
+        for k in range(1, days):
+            before, after = result["days"][k - 1], result["days"][k]
+            ages, next_ages = _ages(before), _ages(after)
+            ibl = {p["train_id"] for p in before["plan"] if p["assignment"] == "IBL"}
+            for tid, age in next_ages.items():
+                grown = age == ages[tid] + 1 or age == ages[tid] == 9999  # 9999: no maintenance date
+                if age < 0 or not (grown or (tid in ibl and age == 1)):
+                    print(f"horizon: round {r} {tid} is {ages[tid]} days from maintenance on "
+                          f"{before['date']} and {age} on {after['date']}")
+                    return False
+    print(f"horizon: {rounds} rounds ok")
+    return True
+
+def _exhaustive(costs, allowed, targets, ibl_capacity):
+    """Lowest total cost over every assignment meeting the targets, or None"""
+    best = None
+    for assignment in itertools.product(range(3), repeat=len(costs)):
+        if any(not allowed[i][c] for i, c in enumerate(assignment)):
+            continue
+        if [assignment.count(c) for c in range(3)] != targets:
+            continue
+        if ibl_capacity is not None and targets[solver.IBL] > ibl_capacity:
+            continue
+        total = sum(costs[i][c] for i, c in enumerate(assignment))
+        if best is None or total < best:
+            best = total
+    return best
+
+def check_solver(rounds, seed):
+    rng = random.Random(seed)
+    for r in range(rounds):
+        n = rng.randint(1, 7)
+        trains = []
+        for k in range(n):
+            t = random_train(rng, k)
+            t["stabling_bay_id"] = rng.choice(["SBL-01", "CBL-02", "IBL-03", None])
+            if rng.random() < 0.2:
+                t[rng.choice(solver.CERTIFICATES)] = _random_date(rng, 30)  # expired before PLAN_DATE
+            trains.append(t)
+        scores = [round(rng.random(), 3) for _ in trains]
+        weights = dict(WEIGHTS, shunting=rng.choice([0, 0, 20, 60]))
+        maintenance = [rng.random() < 0.15 for _ in trains]
+        service, standby = rng.randint(0, n), rng.randint(0, n)
+        capacities = {name: rng.randint(0, n) for name in solver.CLASSES if rng.random() < 0.3}
+        warm_start = [rng.randrange(3) for _ in trains]
+
+        assignment, blocked, info = solver.solve(
+            trains, scores, weights, maintenance, PLAN_DATE, service, standby, warm_start,
+            {"capacities": capacities, "backend": "flow"}
+        )
+        allowed = [(i not in blocked, i not in blocked, True) for i in range(n)]
+        costs = solver.assignment_costs(trains, scores, weights)
+        targets = [info["targets"][name] for name in solver.CLASSES]
+        best = _exhaustive(costs, allowed, targets, capacities.get("IBL"))
+        case = f"round {r}: n={n} service={service} standby={standby} capacities={capacities}"
+        if best is None:
+            if info["status"] != "infeasible":
+                print(f"solver: {case} is infeasible but solver reported {info['status']}")
+                return False
+            continue
+        objective = sum(costs[i][c] for i, c in enumerate(assignment))
+        if info["status"] != "optimal" or abs(objective - best) > 1e-9:
+            print(f"solver: {case} gave {info['status']} {objective} instead of optimal {best}")
+            return False
+    print(f"solver: {rounds} rounds ok")
+    return True
+
+CHECKS = {"incremental": check_incremental, "horizon": check_horizon, "solver": check_solver}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Randomised consistency checks for the MetroPal planners")
+    parser.add_argument("checks", nargs="*", help=f"checks to run: {', '.join(sorted(CHECKS))} (default: all)")
+    parser.add_argument("--rounds", type=int, default=300, help="random cases per check")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.checks if name not in CHECKS]
+    if unknown:
+        parser.error(f"unknown checks: {', '.join(unknown)}")
+    ok = True
+    for name in args.checks or sorted(CHECKS):
+        ok = CHECKS[name](args.rounds, args.seed) and ok
+    return 0 if ok else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
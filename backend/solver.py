@@ -0,0 +1,242 @@
+"""Exact Service/Standby/IBL assignment as a min-cost flow, used by optimize(solver=...).
+
+Every train is one unit of flow into one of three classes. Class targets are fixed
+up front (the service and standby requirements, plus any bay capacities), so the
+problem is a transportation problem with three destinations. It is solved by
+moving trains between classes:
+
+  1. start from the greedy plan (warm start) and move trains that break a hard
+     constraint to IBL,
+  2. fill missing Service/Standby places along the cheapest move path,
+  3. cancel negative cycles (swaps between two classes or rotations through all
+     three) until none is left, which makes the assignment optimal.
+
+Each class pair keeps a heap of its trains ordered by the cost of the move, so
+every step is O(log n). With the greedy warm start most plans need no moves.
+
+Set METROPAL_SOLVER_BACKEND=pulp (or pass backend="pulp") to solve the same model
+as an ILP with PuLP/CBC instead.
+"""
+import heapq, os, time
+from certificates import CERTIFICATES, expiry_of
+
+SERVICE, STANDBY, IBL = 0, 1, 2
+CLASSES = ("Service", "Standby", "IBL")
+
+# which class a train is already stabled for, by the prefix of its stabling_bay_id
+BAY_CLASS = {"SBL": SERVICE, "CBL": STANDBY, "IBL": IBL}
+
+SOLVER_BACKEND = os.environ.get("METROPAL_SOLVER_BACKEND", "flow")
+DEFAULT_TIME_BUDGET = float(os.environ.get("METROPAL_SOLVER_TIME_BUDGET", 1.0))
+
+EPS = 1e-12
+
+def hard_constraints(train, plan_date, maintenance):
+    """Reasons the train can't run Service or Standby on plan_date (empty list if it can)"""
+    reasons = []
+    if maintenance:
+        reasons.append("Open job card or maintenance due")
+    for cert in CERTIFICATES:
+        expiry = expiry_of(train, cert)
+        if expiry and plan_date and expiry < plan_date:  # ISO dates compare in date order
+            reasons.append(f"{cert} expired on {expiry}")
+    return reasons
+
+def assignment_costs(trains, scores, weights):
+    """(n, 3) cost rows. Scores favour Service over Standby over IBL the same way the greedy
+       ranking does (the best scores go to Service, the next to Standby); an optional
+       "shunting" weight charges for moving a train away from the bay type it is stabled in."""
+    weight_sum = sum(weights.get(k, 0) for k in weights) or 1
+    shunting = weights.get("shunting", 0) / weight_sum
+    costs = []
+    for t, s in zip(trains, scores):
+        row = [-s, -s / 2, 0.0]
+        if shunting:
+            bay = (t.get("stabling_bay_id") or "")[:3]
+            home = BAY_CLASS.get(bay)
+            if home is not None:
+                for c in range(3):
+                    if c != home:
+                        row[c] += shunting
+        costs.append(row)
+    return costs
+
+def class_targets(n, allowed_service, service_needed, standby_needed, capacities):
+    """How many trains go to each class. IBL gets the rest; if IBL has a bay capacity the
+       overflow is stabled on Standby, up to its own capacity."""
+    cap = [capacities.get(name) for name in CLASSES]
+    service = min(service_needed, allowed_service, cap[SERVICE] if cap[SERVICE] is not None else n)
+    standby_cap = cap[STANDBY] if cap[STANDBY] is not None else n
+    standby = min(standby_needed, allowed_service - service, standby_cap)
+    if cap[IBL] is not None and n - service - standby > cap[IBL]:
+        standby = min(allowed_service - service, standby_cap, n - service - cap[IBL])
+    return [service, standby, n - service - standby]
+
+class _Moves:
+    """Per (from, to) class pair, a lazy heap of the trains in `from` keyed by the cost of moving them"""
+
+    def __init__(self, costs, allowed, assignment):
+        self.costs = costs
+        self.allowed = allowed
+        self.assignment = assignment
+        self.heaps = {(a, b): [] for a in range(3) for b in range(3) if a != b}
+        for i, a in enumerate(assignment):
+            self._push(i, a)
+
+    def _push(self, i, a):
+        row = self.costs[i]
+        for b in range(3):
+            if b != a and self.allowed[i][b]:
+                heapq.heappush(self.heaps[a, b], (row[b] - row[a], i))
+
+    def best(self, a, b):
+        """(cost, train) of the cheapest a -> b move, or (inf, None)"""
+        heap = self.heaps[a, b]
+        while heap and self.assignment[heap[0][1]] != a:
+            heapq.heappop(heap)  # stale: the train has moved since
+        return heap[0] if heap else (float("inf"), None)
+
+    def move(self, i, b):
+        self.assignment[i] = b
+        self._push(i, b)
+
+def _path_to(moves, target, source=IBL):
+    """Cheapest way to move one train into target, taking the place from source:
+       a direct move or a two-step move through the third class. Returns (cost, steps)."""
+    via = 3 - source - target
+    direct = moves.best(source, target)
+    first, second = moves.best(source, via), moves.best(via, target)
+    if first[1] is not None and second[1] is not None and first[0] + second[0] < direct[0]:
+        return first[0] + second[0], [(second[1], target), (first[1], via)]
+    if direct[1] is None:
+        return float("inf"), []
+    return direct[0], [(direct[1], target)]
+
+def _negative_cycle(moves):
+    """Steps of a cost-reducing swap or three-way rotation, or None when the assignment is optimal"""
+    best_gain, best_steps = -EPS, None
+    for a in range(3):
+        for b in range(a + 1, 3):
+            ab, ba = moves.best(a, b), moves.best(b, a)
+            if ab[1] is not None and ba[1] is not None and ab[0] + ba[0] < best_gain:
+                best_gain, best_steps = ab[0] + ba[0], [(ab[1], b), (ba[1], a)]
+    for order in ((0, 1, 2), (0, 2, 1)):
+        legs = [moves.best(order[k], order[(k + 1) % 3]) for k in range(3)]
+        if all(leg[1] is not None for leg in legs):
+            total = sum(leg[0] for leg in legs)
+            if total < best_gain:
+                best_gain = total
+                best_steps = [(legs[k][1], order[(k + 1) % 3]) for k in range(3)]
+    return best_steps
+
+def solve_flow(costs, allowed, targets, warm_start, time_budget=DEFAULT_TIME_BUDGET):
+    """Min-cost assignment meeting the class targets. Returns (assignment, status, iterations);
+       status is "optimal", "time_limit" (feasible, not proven optimal) or "infeasible"."""
+    deadline = time.perf_counter() + time_budget
+    assignment = [a if allowed[i][a] else IBL for i, a in enumerate(warm_start)]
+    counts = [assignment.count(c) for c in range(3)]
+
+    # over-full classes give their cheapest-to-move trains back to IBL
+    moves = _Moves(costs, allowed, assignment)
+    for c in (SERVICE, STANDBY):
+        while counts[c] > targets[c]:
+            _, i = moves.best(c, IBL)
+            moves.move(i, IBL)
+            counts[c] -= 1
+            counts[IBL] += 1
+
+    iterations = 0
+    # fill Service and Standby from IBL along the cheapest path each time
+    while counts[SERVICE] < targets[SERVICE] or counts[STANDBY] < targets[STANDBY]:
+        options = [
+            _path_to(moves, c) + (c,) for c in (SERVICE, STANDBY) if counts[c] < targets[c]
+        ]
+        cost, steps, c = min(options, key=lambda o: o[0])
+        if not steps:
+            return assignment, "infeasible", iterations
+        for i, b in steps:
+            moves.move(i, b)
+        counts[c] += 1
+        counts[IBL] -= 1
+        iterations += 1
+
+    while True:
+        if time.perf_counter() > deadline:
+            return assignment, "time_limit", iterations
+        steps = _negative_cycle(moves)
+        if steps is None:
+            return assignment, "optimal", iterations
+        for i, b in steps:
+            moves.move(i, b)
+        iterations += 1
+
+def solve_pulp(costs, allowed, targets, warm_start, time_budget=DEFAULT_TIME_BUDGET):
+    """The same model as a 0/1 ILP solved by CBC through PuLP"""
+    import pulp
+
+    n = len(costs)
+    prob = pulp.LpProblem("induction", pulp.LpMinimize)
+    x = {
+        (i, c): pulp.LpVariable(f"x_{i}_{c}", cat="Binary")
+        for i in range(n) for c in range(3) if allowed[i][c]
+    }
+    prob += pulp.lpSum(costs[i][c] * v for (i, c), v in x.items())
+    for i in range(n):
+        prob += pulp.lpSum(x[i, c] for c in range(3) if (i, c) in x) == 1
+    for c in range(3):
+        prob += pulp.lpSum(v for (i, k), v in x.items() if k == c) == targets[c]
+    for (i, c), v in x.items():
+        v.setInitialValue(1 if warm_start[i] == c else 0)
+
+    status = prob.solve(pulp.PULP_CBC_CMD(msg=False, timeLimit=time_budget, warmStart=True))
+    if pulp.LpStatus[status] != "Optimal":
+        return list(warm_start), "infeasible" if pulp.LpStatus[status] == "Infeasible" else "time_limit", 0
+    assignment = [IBL] * n
+    for (i, c), v in x.items():
+        if v.value() and v.value() > 0.5:
+            assignment[i] = c
+    return assignment, "optimal", 0
+
+def solve(trains, scores, weights, maintenance, plan_date, service_needed, standby_needed,
+          warm_start, options=None):
+    """Assigns every train a class index. warm_start is the greedy plan's class per train.
+       options: time_budget (seconds), capacities ({"Service"|"Standby"|"IBL": max trains}),
+       backend ("flow" or "pulp"). Returns (assignment, blocked, info) where blocked maps a
+       train position to the hard constraints that kept it off Service/Standby."""
+    options = options or {}
+    started = time.perf_counter()
+    n = len(trains)
+
+    blocked = {}
+    allowed = []
+    for i, t in enumerate(trains):
+        reasons = hard_constraints(t, plan_date, maintenance[i])
+        if reasons:
+            blocked[i] = reasons
+        allowed.append((not reasons, not reasons, True))
+
+    costs = assignment_costs(trains, scores, weights)
+    targets = class_targets(n, n - len(blocked), service_needed, standby_needed, options.get("capacities") or {})
+    time_budget = float(options.get("time_budget", DEFAULT_TIME_BUDGET))
+    backend = options.get("backend") or SOLVER_BACKEND
+    if backend == "pulp":
+        try:
+            assignment, status, iterations = solve_pulp(costs, allowed, targets, warm_start, time_budget)
+        except ImportError:
+            backend = "flow"
+    if backend != "pulp":
+        assignment, status, iterations = solve_flow(costs, allowed, targets, warm_start, time_budget)
+
+    capacity = (options.get("capacities") or {}).get("IBL")
+    ibl = assignment.count(IBL)
+    if status == "optimal" and capacity is not None and ibl > capacity:
+        status = "infeasible"  # not enough trains may leave IBL to fit its bays
+
+    return assignment, blocked, {
+        "backend": backend,
+        "status": status,
+        "objective": round(sum(costs[i][c] for i, c in enumerate(assignment)), 6),
+        "iterations": iterations,
+        "targets": dict(zip(CLASSES, targets)),
+        "seconds": round(time.perf_counter() - started, 6)
+    }
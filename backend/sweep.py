@@ -0,0 +1,141 @@
+"""Weight sensitivity sweeps: many weight vectors scored against one day's fleet at once.
+
+The fleet's score terms form an (n trains x k terms) feature matrix and the
+normalised weight sets a (k x m) coefficient matrix; their product gives every
+train's score under every weight set. Terms are accumulated one at a time, in the
+order _score_columns adds them, so each column is bit-for-bit the score optimize()
+would compute for that weight set. Ranking, assignment and conflict counting are
+then done column-wise over the whole (n x m) score matrix.
+"""
+import datetime, itertools, random
+import numpy as np
+from data_loader import load_full_train_data
+from optimizer import _fleet_columns, _score_terms, _resolve_requirements
+from conflicts import RULES, index_trains
+import live_updates
+
+MAX_WEIGHT_SETS = 5000
+ASSIGNMENTS = ("Service", "Standby", "IBL")
+
+# (weight key, score term, divisor) in the order _score_columns adds them
+TERMS = (
+    ("punctuality", "health", None),
+    ("readiness", "health", None),
+    ("maintenance", "maintenance", None),
+    ("cleaning", "cleaning", None),
+    ("branding", "branding", 2),
+    ("mileage", "mileage", None),
+)
+
+def weight_grid(base, grid):
+    """Every combination of the values in grid ({key: [values]}), other keys taken from base"""
+    keys = list(grid)
+    return [dict(base, **dict(zip(keys, combo))) for combo in itertools.product(*(grid[k] for k in keys))]
+
+def weight_samples(base, ranges, samples, seed=None):
+    """samples random weight sets, each key in ranges ({key: [low, high]}) drawn uniformly"""
+    rng = random.Random(seed)
+    return [
+        dict(base, **{k: round(rng.uniform(lo, hi), 3) for k, (lo, hi) in ranges.items()})
+        for _ in range(samples)
+    ]
+
+def score_matrix(cols, weight_sets):
+    """(n, m) scores of every train under every weight set"""
+    terms = _score_terms(cols)
+    coefficients = np.array([
+        [w.get(key, 0) / (sum(w.get(k, 0) for k in w) or 1) for key, _, _ in TERMS]
+        for w in weight_sets
+    ]).reshape(len(weight_sets), len(TERMS)).T  # (k, m)
+    scores = np.zeros((len(cols["fitness"]), len(weight_sets)))
+    for row, (_, term, divisor) in zip(coefficients, TERMS):
+        weighted = terms[term][:, None] * row[None, :]
+        scores += weighted / divisor if divisor else weighted
+    return scores
+
+def _assignment_matrix(scores, maintenance, service_needed, standby_needed):
+    """(n, m) class index (0 Service, 1 Standby, 2 IBL) per train and weight set"""
+    n, m = scores.shape
+    eligible = np.flatnonzero(~maintenance)
+    classes = np.full((n, m), 2, dtype=np.int8)
+    if len(eligible) and m:
+        # stable argsort over -score keeps ties in fleet order, like optimize()
+        order = np.argsort(-scores[eligible], axis=0, kind="stable")
+        rank = np.empty_like(order)
+        np.put_along_axis(rank, order, np.arange(len(eligible))[:, None], axis=0)
+        service = max(0, service_needed)
+        block = np.where(rank < service, 0, np.where(rank < service + max(0, standby_needed), 1, 2))
+        classes[eligible] = block
+    return classes
+
+def _conflict_counts(trains, classes, weight_sets):
+    """Conflicts per weight set. Each rule is checked once per train and assignment it covers;
+       the weight-dependent part is only whether the rule is enabled."""
+    by_id = index_trains(trains)
+    records = [by_id.get(t["train_id"]) for t in trains]
+    counts = np.zeros(classes.shape[1], dtype=np.int64)
+    for rule in RULES:
+        hits = np.zeros((len(trains), 3), dtype=bool)
+        for c, name in enumerate(ASSIGNMENTS):
+            if name in rule["assignments"]:
+                hits[:, c] = [bool(tr and rule["check"](tr, name)) for tr in records]
+        if not hits.any():
+            continue
+        enabled = np.array([rule["enabled"] is None or bool(rule["enabled"](w)) for w in weight_sets])
+        per_set = np.take_along_axis(hits, classes.astype(np.intp), axis=1).sum(axis=0)
+        counts += np.where(enabled, per_set, 0)
+    return counts
+
+def sweep(weight_sets, date_str=None, requirements=None, trains=None, baseline=None, include_assignments=False):
+    """Plans the day under every weight set. Returns per-set summaries (as optimize() reports
+       them) and how many trains change assignment compared with baseline (default: first set)."""
+    current_date = date_str or datetime.date.today().strftime("%Y-%m-%d")
+    if trains is None:
+        trains = load_full_train_data(date=date_str) if date_str else load_full_train_data()
+        trains = live_updates.apply_to(trains, current_date)
+    if not trains:
+        return {"error": f"No data available for date {current_date}"}
+    service_needed, standby_needed = _resolve_requirements(date_str, requirements)
+
+    all_sets = list(weight_sets) + ([baseline] if baseline is not None else [])
+    cols = _fleet_columns(trains, current_date)
+    scores = score_matrix(cols, all_sets)
+    classes = _assignment_matrix(scores, cols["maintenance"], service_needed, standby_needed)
+    conflicts = _conflict_counts(trains, classes, all_sets)
+
+    base_classes = classes[:, -1] if baseline is not None else classes[:, 0]
+    counts = np.stack([(classes == c).sum(axis=0) for c in range(3)])
+    ids = [t["train_id"] for t in trains]
+
+    results = []
+    for j, w in enumerate(weight_sets):
+        moved = np.flatnonzero(classes[:, j] != base_classes)
+        # summed like optimize(): rounded plan scores, best first
+        service_scores = sorted(scores[classes[:, j] == 0, j].tolist(), reverse=True)
+        entry = {
+            "weights": w,
+            "summary": {
+                "total_trains": len(trains),
+                "service_assigned": int(counts[0, j]),
+                "standby_assigned": int(counts[1, j]),
+                "ibl_assigned": int(counts[2, j]),
+                "conflicts_found": int(conflicts[j]),
+                "avg_service_score": round(sum(round(x, 3) for x in service_scores) / max(1, len(service_scores)), 3)
+            },
+            "assignments_changed": len(moved),
+            "changed_trains": [
+                {"train_id": ids[i], "from": ASSIGNMENTS[base_classes[i]], "to": ASSIGNMENTS[classes[i, j]]}
+                for i in moved.tolist()
+            ]
+        }
+        if include_assignments:
+            entry["assignments"] = {ids[i]: ASSIGNMENTS[c] for i, c in enumerate(classes[:, j].tolist())}
+        results.append(entry)
+
+    return {
+        "date": current_date,
+        "service_needed": service_needed,
+        "standby_needed": standby_needed,
+        "baseline": baseline if baseline is not None else (weight_sets[0] if weight_sets else None),
+        "results": results
+    }
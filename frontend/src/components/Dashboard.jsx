@@ -7,6 +7,23 @@ import TrainInventory from "./TrainInventory";
 import PerformanceCard from "./Performance";
 import AutoDraft from "./AutoDraft";
 
+// Recent conflict entries from /api/conflicts and the event stream, newest first. The same
+// optimization can arrive both ways, so entries are kept once per (timestamp, date).
+const RECENT_CONFLICTS = 3;
+
+const mergeConflicts = (current, incoming) => {
+  const seen = new Set();
+  return [...incoming, ...current]
+    .filter(entry => {
+      const key = `${entry.timestamp}|${entry.date}`;
+      if (seen.has(key)) return false;
+      seen.add(key);
+      return true;
+    })
+    .sort((a, b) => String(b.timestamp).localeCompare(String(a.timestamp)))
+    .slice(0, RECENT_CONFLICTS);
+};
+
 const Dashboard = () => {
   const [dashboardStats, setDashboardStats] = useState({
     totalTrains: 25,
@@ -19,10 +36,26 @@ const Dashboard = () => {
   const [recentConflicts, setRecentConflicts] = useState([]);
   const [loading, setLoading] = useState(false);
 
-  // Fetch dashboard data on component mount
+  // Fetch dashboard data on component mount, then follow server-sent updates
   useEffect(() => {
     fetchDashboardData();
     fetchRecentConflicts();
+
+    if (typeof EventSource === 'undefined') return undefined;
+    const stream = new EventSource('/api/stream');
+
+    // New conflicts arrive as they are found, newest first like /api/conflicts
+    stream.addEventListener('conflicts', (event) => {
+      const entry = JSON.parse(event.data);
+      setRecentConflicts(prev => mergeConflicts(prev, [entry]));
+    });
+
+    // The fleet data changed on the server
+    stream.addEventListener('data_version', () => {
+      fetchDashboardData();
+    });
+
+    return () => stream.close();
   }, []);
 
   const fetchDashboardData = async () => {
@@ -48,7 +81,9 @@ const Dashboard = () => {
     try {
       const response = await fetch('/api/conflicts');
       const conflicts = await response.json();
-      setRecentConflicts(conflicts.slice(0, 3)); // Show only recent 3
+      if (Array.isArray(conflicts)) {
+        setRecentConflicts(prev => mergeConflicts(prev, conflicts));
+      }
     } catch (error) {
       console.error('Error fetching conflicts:', error);
     }
@@ -85,7 +120,9 @@ const Dashboard = () => {
       }));
     }
     
-    // Refresh conflicts
+    // The event stream may be held by a different server worker than the one that ran
+    // this optimization and never see its conflicts, so always fetch them here as well;
+    // mergeConflicts keeps an entry that also arrives on the stream only once
     fetchRecentConflicts();
   };
 